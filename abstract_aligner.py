@@ -1,33 +1,193 @@
 # -*- coding: utf-8 -*-
 # Python 3.6.12
 
-"""This module contains a template for all Aligner classes."""
+"""This module contains a template for all Aligner classes.
 
+Counting with dicts only needs the standard library. pandas, NumPy and
+the modules that use them (count backends, line index, occurrence export,
+sampling) are imported on first use, so that short-lived worker processes
+start fast (see the 'import' benchmark in benchmark.py).
+
+"""
+import csv
+import heapq
+import sys
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 
-import pandas as pd
-import numpy as np
+from profiling import NullTimer, Profiler
 
 
 class Aligner(ABC):
     """Template for all Aligner classes."""
 
+    #: How matches are counted: 'dict' (nested dicts), 'matrix'
+    #: (count_matrix.CountMatrix) or 'sparse' (count_matrix.SparseCounts,
+    #: for many connectors or large vocabularies). Can be changed per
+    #: instance.
+    count_backend = 'dict'
+
+    #: profiling.Profiler that measures the runs of the instance, see
+    #: 'enable_profiling'. If None, nothing is measured.
+    profiler = None
+
     @abstractmethod
     def align(self):
         pass
 
+    def estimate(self, src_path, tgt_path, max_lines=100000,
+                 batch_size=10000, seed=0, top=5, patience=None,
+                 confidence=0.95, **kwargs):
+        """Aligns a random sample of the line pairs (sampling mode).
+
+        The sample is aligned in batches with 'align' (see its 'lines'
+        argument), every batch in the order of the line numbers.
+
+        Args:
+            src_path(str): See 'align'.
+            tgt_path(str): See 'align'.
+            max_lines(int): Maximum number of sampled line pairs.
+            batch_size(int): Number of line pairs per batch.
+            seed(int): Seed of the sample, the same seed gives the same
+                       sample (see sampling.sample_lines).
+            top(int): Number of equivalents per connector that have to be
+                      stable, see 'patience'.
+            patience(int): If given, the sampling stops early when the
+                           'top' equivalents of every connector (and
+                           their order) haven't changed for this number of
+                           batches.
+            confidence(float): Confidence level of the intervals, see
+                               sampling.SampleEstimate.
+            **kwargs: Further arguments of 'align', e.g. frame or workers.
+
+        Returns:
+            sampling.SampleEstimate: The counts of the sample, scaled
+                                     counts and proportions.
+
+        """
+        from line_index import count_line_pairs
+        from sampling import SampleEstimate, sample_lines
+
+        total = count_line_pairs(src_path, tgt_path)
+        sample = sample_lines(total, max_lines, seed)
+        counts = self.new_counts(self.count_backend)
+        rankings = None
+        unchanged = 0
+        batches = 0
+        stable = False
+        for start in range(0, len(sample), batch_size):
+            batch = sorted(sample[start:start+batch_size].tolist())
+            self.merge_alignments(counts, self.align(src_path, tgt_path,
+                                                     lines=batch, **kwargs))
+            batches += 1
+            if patience is None:
+                continue
+            new_rankings = {connector: [equivalent for equivalent, _ in values]
+                            for connector, values
+                            in self.top_values(counts, top).items()}
+            unchanged = unchanged + 1 if new_rankings == rankings else 0
+            rankings = new_rankings
+            if unchanged >= patience:
+                stable = True
+                break
+        n_lines = min(len(sample), batches * batch_size)
+        return SampleEstimate(counts, n_lines, total, batches, stable,
+                              confidence)
+
+    def enable_profiling(self, out=sys.stderr):
+        """Measures the phases of the following 'align' calls.
+
+        The times and calls of reading, tokenization, equivalent search,
+        match recording and result export (see 'timed') are recorded,
+        as well as the connector hits and the hits without match. A
+        summary is written to 'out' at the end of every 'align' call and
+        stays available as 'self.profiler.summary()'.
+
+        Args:
+            out(file): Where the summary is written. If None, it is only
+                       stored.
+
+        """
+        self.profiler = Profiler(out)
+
+    def disable_profiling(self):
+        self.profiler = None
+
+    def timed(self, name):
+        """Returns a context manager that measures a phase if profiling.
+
+        Example:
+            with aligner.timed('export'):
+                df = aligner.result_to_df(result, save='result.csv')
+
+        """
+        if self.profiler is None:
+            return NullTimer()
+        return self.profiler.timer(name)
+
+    def _instrument(self, name, func):
+        """Returns 'func', timed as phase 'name' if profiling is enabled.
+
+        The aligners look their hot-path functions up once per run with
+        this, so disabled profiling costs nothing per call.
+        """
+        if self.profiler is None:
+            return func
+        return self.profiler.wrap(name, func)
+
+    def _instrument_iter(self, name, iterable):
+        """Like '_instrument', but times every step of an iterable."""
+        if self.profiler is None:
+            return iterable
+        return self.profiler.wrap_iter(name, iterable)
+
+    def _start_profile(self):
+        if self.profiler is not None:
+            self.profiler.reset()
+
+    def _end_profile(self, alignments, shard_profilers=()):
+        """Adds the counts of a run and the worker profiles, then dumps."""
+        if self.profiler is not None:
+            for profiler in shard_profilers:
+                self.profiler.merge(profiler)
+            self.profiler.count_result(alignments)
+            self.profiler.dump()
+
+    @staticmethod
+    def new_counts(backend='dict'):
+        """Returns an empty container for matches.
+
+        Args:
+            backend(str): 'dict', 'matrix' or 'sparse', see
+                          'count_backend'.
+
+        Returns:
+            dict or CountMatrix: Container for 'note_match'.
+
+        """
+        if backend == 'dict':
+            return dict()
+        if backend not in ('matrix', 'sparse'):
+            raise ValueError(f'Unknown count backend: {backend}')
+        from count_matrix import CountMatrix, SparseCounts
+        if backend == 'matrix':
+            return CountMatrix()
+        return SparseCounts()
+
     @staticmethod
     def note_match(dic, connector, equivalent):
         """Enters new found matches to a dictionary.
 
         Args:
             dic(dict): Dict to which the connector and equivalent
-                        are added in-place.
+                        are added in-place. Can also be a CountMatrix.
             connector(str): Source connector.
             equivalent(str): Found target connector.
 
         """
-        if connector not in dic:
+        if type(dic) is not dict:
+            dic.add(connector, equivalent)
+        elif connector not in dic:
             dic[connector] = {equivalent: 1}
             # connector hasn't been aligned to equivalent yet.
         elif equivalent not in dic[connector]:
@@ -37,25 +197,185 @@ class Aligner(ABC):
         else:
             dic[connector][equivalent] += 1
 
+    @staticmethod
+    def merge_alignments(dic, other):
+        """Adds the matches of another dictionary to a dictionary.
+
+        Has the same result as calling 'note_match' for every match in
+        'other' after the matches in 'dic'.
+
+        Args:
+            dic(dict): Dict to which the matches are added in-place. Can
+                       also be a CountMatrix.
+            other(dict): Dict of the same form as 'dic' or CountMatrix.
+
+        """
+        if type(dic) is not dict:
+            dic.merge(other)
+            return
+        if type(other) is not dict:
+            other = other.to_dict()
+        for connector, equivalents in other.items():
+            if connector not in dic:
+                dic[connector] = dict()
+            matches = dic[connector]
+            for equivalent, count in equivalents.items():
+                matches[equivalent] = matches.get(equivalent, 0) + count
+
+    @staticmethod
+    def run_parallel(func, jobs, workers):
+        """Runs a function for several argument tuples in a process pool.
+
+        Args:
+            func(callable): A picklable function, e.g. a method of a
+                            picklable object.
+            jobs(list of tuple): Arguments of every call.
+            workers(int): Number of processes.
+
+        Returns:
+            list: The return values in the order of 'jobs'.
+
+        """
+        return list(Aligner.iter_parallel(func, jobs, workers))
+
+    @staticmethod
+    def iter_parallel(func, jobs, workers):
+        """Like 'run_parallel', but yields every return value when it and
+        all values before it are available.
+        """
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(func, *args) for args in jobs]
+            for future in futures:
+                yield future.result()
+
+    @staticmethod
+    def _new_occurrences(export):
+        """Returns an empty occurrences.Occurrences if 'export', else None.
+        """
+        if not export:
+            return None
+        from occurrences import Occurrences
+        return Occurrences()
+
+    @staticmethod
+    def _line_parts(src_path, tgt_path, lines, n_parts):
+        """Splits the 'lines' argument of 'align' into parts.
+
+        Args:
+            lines(range or iterable of int): Line numbers (starting at 1).
+            n_parts(int): Maximum number of parts.
+
+        Returns:
+            list of tuple: (shard, sample) of every part. A range with step
+                           1 is split into corpus.Shard objects (see
+                           line_index.line_shards), other line numbers into
+                           lists (see line_index.split_lines). The other
+                           value is None.
+
+        """
+        from line_index import line_shards, split_lines
+        if isinstance(lines, range) and lines.step == 1:
+            return [(shard, None) for shard in line_shards(
+                    src_path, tgt_path, lines, n_parts)]
+        return [(None, sample) for sample in split_lines(lines, n_parts)]
+
     @staticmethod
     def result_to_df(d, save=''):
         """Creates a pandas.DataFrame from a nested dictionary.
 
         Args:
             d(dict): a nested dictionary with immutable keys and dictionaries
-                     (dict) as values.
+                     (dict) as values, or a CountMatrix.
             save(:obj:`str`, optional): path to the .csv-file the DataFrame
                                         can optionally be saved in, if save is
                                         evaluated as True.
 
         """
-        df = pd.DataFrame(d)
-        df = df.replace(to_replace=np.nan, value=0)
-        df = df.astype(int)
+        if type(d) is not dict:
+            df = d.to_df()
+        else:
+            import numpy as np
+            import pandas as pd
+            df = pd.DataFrame(d)
+            df = df.replace(to_replace=np.nan, value=0)
+            df = df.astype(int)
         if save:
             df.to_csv(path_or_buf=save, encoding='utf-8')
         return df
 
+    @staticmethod
+    def result_to_long_csv(d, save):
+        """Saves the counts as .csv-file with one row per non-zero pair.
+
+        The columns are 'connector', 'equivalent' and 'count'. The rows
+        are written while they are produced, without a DataFrame.
+
+        Args:
+            d(dict): Counts like in 'result_to_df', or a CountMatrix.
+            save(str): Path to the .csv-file.
+
+        """
+        if type(d) is not dict:
+            rows = d.iter_counts()
+        else:
+            rows = ((connector, equivalent, count)
+                    for connector, equivalents in d.items()
+                    for equivalent, count in equivalents.items())
+        with open(save, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['connector', 'equivalent', 'count'])
+            writer.writerows(rows)
+
+    @staticmethod
+    def top_values(d, top=10):
+        """Returns the most frequent equivalents of every connector.
+
+        Uses a heap per connector instead of sorting all equivalents.
+
+        Args:
+            d(dict): Counts like in 'result_to_df', or a CountMatrix.
+            top(int): Number of equivalents per connector.
+
+        Returns:
+            dict: Connector as key and a list of (equivalent, count),
+                  highest count first, as value.
+
+        """
+        if type(d) is not dict:
+            return d.top_values(top)
+        return {connector: heapq.nlargest(top, equivalents.items(),
+                                          key=lambda item: item[1])
+                for connector, equivalents in d.items()}
+
+    @staticmethod
+    def print_top_counts(d, save='', top=10):
+        """Like 'print_top_values', but from the counts (see 'top_values')
+        instead of a DataFrame.
+
+        Args:
+            d(dict): Counts like in 'result_to_df', or a CountMatrix.
+            save(str): Path to txt-file for extracted information. If empty,
+                       information is printed to console.
+            top(int): How many values are printed.
+
+        """
+        if save:
+            out = open(save, 'w', encoding='utf-8')
+        else:
+            out = None
+        print(f'Top {top} of every connector:', end='\n\n', file=out)
+        for connector, values in Aligner.top_values(d, top).items():
+            width = max([len(equivalent) for equivalent, _ in values],
+                        default=0)
+            count_width = max([len(str(count)) for _, count in values],
+                              default=0)
+            for equivalent, count in values:
+                print(f'{equivalent:<{width}}    {count:>{count_width}}',
+                      file=out)
+            print(f'Name: {connector}, dtype: int64', end='\n\n', file=out)
+        if save:
+            out.close()
+
     @staticmethod
     def print_top_values(df, save='', top=10):
         """Informs about the highest values of every column.
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""Runs the aligners for several language pairs and connector lists.
+
+The runs are described by a JSON config:
+
+    {"pairs": {"de-en": ["de-en/europarl-v7.de-en.de",
+                         "de-en/europarl-v7.de-en.en"]},
+     "connectors": {"de": ["aber", "doch", ...],
+                    "en": ["but", "however", ...]},
+     "jobs": [{"approach": "list", "pair": "de-en",
+               "src_connectors": "de", "tgt_connectors": "en",
+               "settings": {"frame": 33, "start": -16}},
+              {"approach": "naive", "pair": "de-en",
+               "src_connectors": "de"}],
+     "top": 15}
+
+Connector lists are given inline or as name of a list in "connectors".
+Every distinct corpus file is tokenized once into a token cache (see
+token_cache.py), then the jobs align the cached files. Both run in one
+process pool, and a job starts as soon as the caches of its files are
+ready. The results of a job are saved as results/<approach>/<name>.csv
+and .txt, the name is the pair unless the job has a "name".
+
+    python batch_runner.py batch.json --workers 4
+
+"""
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from abstract_aligner import Aligner
+from list_aligner import ListAligner
+from model1_aligner import Model1Aligner
+from naive_aligner import NaiveAligner
+from token_cache import load_token_cache
+
+
+#: Approaches that can be run and the aligner classes.
+APPROACHES = {'list': ListAligner, 'naive': NaiveAligner,
+              'model1': Model1Aligner}
+
+#: Reproduces the runs of the main functions of the aligners.
+DEFAULT_CONFIG = {
+    'pairs': {'de-en': ['de-en/europarl-v7.de-en.de',
+                        'de-en/europarl-v7.de-en.en']},
+    'connectors': {
+        'de': ['aber', 'doch', 'jedoch',
+               'allerdings', 'andererseits', 'hingegen'],
+        'en': ['but', 'however', 'though', 'although', 'yet',
+               'nevertheless', 'nonetheless', 'albeit', 'otherwise',
+               'whereas', 'again', 'still', 'instead', 'alternatively',
+               'after all', 'then again', 'there again', 'by contrast',
+               'on the contrary', 'on the other hand', 'at the same time',
+               'even so', 'even if', 'by the same token',
+               'on a different note', 'on the other side',
+               'on the downside', 'having said this', 'having said that',
+               'apart from that']},
+    'jobs': [{'approach': 'list', 'pair': 'de-en', 'name': 'list_33_minus16',
+              'src_connectors': 'de', 'tgt_connectors': 'en',
+              'settings': {'frame': 33, 'start': -16}},
+             {'approach': 'naive', 'pair': 'de-en', 'name': 'naive',
+              'src_connectors': 'de'}],
+    'top': 15}
+
+
+def load_config(path):
+    """Reads a config file (see module docstring)."""
+    with open(path, encoding='utf-8') as config_file:
+        return json.load(config_file)
+
+
+def _connectors(config, connectors):
+    """Returns a connector list of a job as set."""
+    if isinstance(connectors, str):
+        connectors = config['connectors'][connectors]
+    return set(connectors)
+
+
+def plan_jobs(config, results_dir='results'):
+    """Checks the jobs of a config and completes their settings.
+
+    Returns:
+        list of dict: Per job 'approach', 'src_path', 'tgt_path',
+                      'src_connectors', 'tgt_connectors' (only 'list'),
+                      'settings' and 'save' (path without extension).
+
+    Raises:
+        ValueError: If an approach, pair or connector list is unknown or
+                    two jobs would write the same results.
+
+    """
+    jobs = []
+    saves = set()
+    for job in config['jobs']:
+        approach = job['approach']
+        if approach not in APPROACHES:
+            raise ValueError(f'Unknown approach: {approach}')
+        if job['pair'] not in config['pairs']:
+            raise ValueError(f'Unknown pair: {job["pair"]}')
+        src_path, tgt_path = config['pairs'][job['pair']]
+        try:
+            planned = {'approach': approach,
+                       'src_path': src_path, 'tgt_path': tgt_path,
+                       'src_connectors': _connectors(
+                           config, job['src_connectors']),
+                       'settings': job.get('settings', dict())}
+            if approach == 'list':
+                planned['tgt_connectors'] = _connectors(
+                        config, job['tgt_connectors'])
+        except KeyError as error:
+            raise ValueError(f'Unknown or missing connectors: {error}')
+        planned['save'] = os.path.join(results_dir, approach,
+                                       job.get('name', job['pair']))
+        if planned['save'] in saves:
+            raise ValueError(f'Two jobs write to {planned["save"]}')
+        saves.add(planned['save'])
+        jobs.append(planned)
+    return jobs
+
+
+def build_cache(path):
+    """Builds the token cache of a file if needed, returns the path."""
+    load_token_cache(path)
+    return path
+
+
+def run_job(job, top=10):
+    """Aligns the cached files of a job and saves the results.
+
+    The no-matches of the list approach are logged to
+    '<save>_no_matches.log'.
+
+    Returns:
+        str: Path of the .csv-file.
+
+    """
+    src = load_token_cache(job['src_path'])
+    tgt = load_token_cache(job['tgt_path'])
+    os.makedirs(os.path.dirname(job['save']), exist_ok=True)
+    if job['approach'] != 'list':
+        aligner = APPROACHES[job['approach']](job['src_connectors'])
+        result = aligner.align(src, tgt, **job['settings'])
+    else:
+        aligner = ListAligner(job['src_connectors'], job['tgt_connectors'])
+        handler = logging.FileHandler(job['save'] + '_no_matches.log', 'w',
+                                      encoding='utf-8')
+        logger = logging.getLogger()
+        level = logger.level
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        try:
+            result = aligner.align(src, tgt, **job['settings'])
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+            handler.close()
+    df = Aligner.result_to_df(result, save=job['save'] + '.csv')
+    Aligner.print_top_values(df, save=job['save'] + '.txt', top=top)
+    return job['save'] + '.csv'
+
+
+def run_batch(config, workers=None, results_dir='results'):
+    """Runs all jobs of a config.
+
+    Args:
+        config(dict): See module docstring.
+        workers(int): Number of processes. If None, the number of CPUs.
+        results_dir(str): Directory with one directory per approach.
+
+    Returns:
+        list of str: The .csv-files of the jobs, in the order of the
+                     config.
+
+    """
+    jobs = plan_jobs(config, results_dir)
+    top = config.get('top', 10)
+    files = list(dict.fromkeys(path for job in jobs
+                               for path in (job['src_path'],
+                                            job['tgt_path'])))
+    results = [None] * len(jobs)
+    waiting = list(range(len(jobs)))
+    ready = set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(build_cache, path): ('cache', path)
+                   for path in files}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, key = pending.pop(future)
+                if kind == 'cache':
+                    ready.add(future.result())
+                else:
+                    results[key] = future.result()
+                    print(f'Saved {results[key]}')
+            for i in [i for i in waiting
+                      if jobs[i]['src_path'] in ready
+                      and jobs[i]['tgt_path'] in ready]:
+                waiting.remove(i)
+                pending[pool.submit(run_job, jobs[i], top)] = ('job', i)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('config', nargs='?', default='',
+                        help='JSON config (default: the runs of the main '
+                             'functions of the aligners)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes (default: number of CPUs)')
+    parser.add_argument('--results', default='results',
+                        help='directory for the results')
+    args = parser.parse_args()
+    config = load_config(args.config) if args.config else DEFAULT_CONFIG
+    run_batch(config, args.workers, args.results)
+
+
+if __name__ == '__main__':
+    main()
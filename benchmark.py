@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""Benchmarks the aligners on synthetic parallel corpora.
+
+Generates deterministic German/English parallel files (and a Giza A3 file
+for the same sentence pairs), runs every benchmark in a fresh process and
+writes lines/sec, peak RSS and per-phase timings as JSON, e.g.:
+
+    python benchmark.py --lines 100000 --density 0.1 --output bench.json
+
+The 'import' benchmark measures how long importing the aligners takes
+and checks it against IMPORT_BUDGET.
+
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+
+SRC_CONNECTORS = ['aber', 'doch', 'jedoch',
+                  'allerdings', 'andererseits', 'hingegen']
+TGT_CONNECTORS = ['but', 'however', 'though', 'although', 'yet',
+                  'nevertheless', 'still', 'instead', 'after all',
+                  'on the other hand', 'at the same time', 'even so']
+SRC_WORDS = ['der', 'die', 'das', 'und', 'ist', 'nicht', 'wir', 'sie', 'es',
+             'ein', 'eine', 'zu', 'in', 'den', 'von', 'mit', 'sich', 'auf',
+             'für', 'Herr', 'Präsident', 'Kommission', 'Bericht', 'Rat',
+             'Parlament', 'Mitgliedstaaten', 'müssen', 'haben', 'werden']
+TGT_WORDS = ['the', 'of', 'and', 'to', 'is', 'in', 'we', 'that', 'this',
+             'it', 'a', 'be', 'for', 'on', 'are', 'have', 'not', 'with',
+             'Mr', 'President', 'Commission', 'report', 'Council',
+             'Parliament', 'Member', 'States', 'must', 'will']
+
+BENCHMARKS = ['naive', 'list', 'non_con_dict', 'giza', 'import']
+
+#: Modules of the core counting path, they only need the standard library.
+CORE_MODULES = ['abstract_aligner', 'naive_aligner', 'list_aligner',
+                'disambig_aligner']
+
+#: Third-party modules that should only be loaded on first use.
+LAZY_MODULES = ['numpy', 'pandas', 'nltk', 'tqdm', 'regex']
+
+#: Maximum seconds for importing CORE_MODULES in a fresh interpreter.
+IMPORT_BUDGET = 0.25
+
+#: Number of fresh interpreters, the fastest import is reported.
+IMPORT_REPEATS = 5
+
+
+def _sentence(rng, words, connector, position, length):
+    tokens = [rng.choice(words) for _ in range(length)]
+    if connector:
+        tokens.insert(min(position, len(tokens)), connector)
+    for i in range(1, len(tokens) - 1):
+        if rng.random() < 0.08:
+            tokens[i] += ','
+    tokens[0] = tokens[0].capitalize()
+    return tokens
+
+
+def generate_corpus(directory, n_lines, density=0.1, seed=0):
+    """Writes a synthetic parallel corpus and a matching Giza A3 file.
+
+    Args:
+        directory (str): Output directory.
+        n_lines (int): Number of sentence pairs.
+        density (float): Probability that a sentence pair contains a
+                         connector.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        dict: Paths of the files ('src', 'tgt', 'a3').
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {'src': os.path.join(directory, 'synthetic.de'),
+             'tgt': os.path.join(directory, 'synthetic.en'),
+             'a3': os.path.join(directory, 'synthetic.A3.final')}
+    rng = random.Random(seed)
+    with open(paths['src'], 'w', encoding='utf-8') as src, \
+         open(paths['tgt'], 'w', encoding='utf-8') as tgt, \
+         open(paths['a3'], 'w', encoding='utf-8') as a3:
+        for i in range(1, n_lines + 1):
+            length = rng.randint(3, 40)
+            position = rng.randint(0, length)
+            if rng.random() < density:
+                src_connector = rng.choice(SRC_CONNECTORS)
+                tgt_connector = rng.choice(TGT_CONNECTORS)
+            else:
+                src_connector = tgt_connector = None
+            src_tokens = _sentence(rng, SRC_WORDS, src_connector, position,
+                                   length)
+            tgt_position = max(0, position + rng.randint(-3, 3))
+            tgt_tokens = _sentence(rng, TGT_WORDS, tgt_connector,
+                                   tgt_position,
+                                   max(1, length + rng.randint(-5, 5)))
+            src.write(' '.join(src_tokens) + '.\n')
+            tgt.write(' '.join(tgt_tokens) + '.\n')
+            # Giza's tokenized and aligned version of the pair.
+            tgt_words = ' '.join(tgt_tokens).replace(',', ' ,').split(' ')
+            src_words = ' '.join(src_tokens).replace(',', ' ,').split(' ')
+            a3.write(f'# Sentence pair ({i}) source length {len(src_words)} '
+                     f'target length {len(tgt_words)} '
+                     f'alignment score : 1e-10\n')
+            a3.write(' '.join(tgt_words) + ' \n')
+            alignments = ['NULL ({ })']
+            for word in src_words:
+                targets = rng.sample(range(1, len(tgt_words) + 1),
+                                     rng.randint(0, min(2, len(tgt_words))))
+                alignments.append('%s ({ %s})' % (word, ''.join(
+                        f'{target} ' for target in sorted(targets))))
+            a3.write(' '.join(alignments) + ' \n')
+    return paths
+
+
+def _peak_rss():
+    """Returns the peak resident set size of this process in bytes."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _import_time():
+    """Imports CORE_MODULES in a fresh interpreter.
+
+    Returns:
+        dict: 'seconds' and the LAZY_MODULES that were 'loaded'.
+
+    """
+    code = ('import json, sys, time\n'
+            'start = time.perf_counter()\n'
+            f'import {", ".join(CORE_MODULES)}\n'
+            'seconds = time.perf_counter() - start\n'
+            'print(json.dumps({"seconds": seconds, "loaded": '
+            f'[name for name in {LAZY_MODULES!r} if name in sys.modules]}}))')
+    output = subprocess.check_output(
+            [sys.executable, '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output)
+
+
+def _run_import_benchmark():
+    """Measures the import time of CORE_MODULES (see IMPORT_BUDGET)."""
+    # The first import may compile the modules.
+    _import_time()
+    runs = [_import_time() for _ in range(IMPORT_REPEATS)]
+    best = min(runs, key=lambda run: run['seconds'])
+    return {'seconds': best['seconds'],
+            'budget': IMPORT_BUDGET,
+            'within_budget': best['seconds'] <= IMPORT_BUDGET,
+            'loaded': best['loaded'],
+            'peak_rss': None,
+            'phases': {'import': best['seconds']},
+            'counters': dict()}
+
+
+def _run_benchmark(name, paths, n_lines):
+    """Runs one benchmark and returns its measurements.
+
+    The aligners run with profiling (see Aligner.enable_profiling), their
+    phases (read, tokenize, search, note_match, ...) are part of 'main'.
+    """
+    if name == 'import':
+        return _run_import_benchmark()
+    from abstract_aligner import Aligner
+    from disambiguator import Disambiguator
+    from giza_results import GizaResultsReader
+    from list_aligner import ListAligner
+    from naive_aligner import NaiveAligner
+
+    phases = dict()
+    aligner = None
+    if name == 'naive':
+        aligner = NaiveAligner(set(SRC_CONNECTORS))
+    elif name == 'list':
+        aligner = ListAligner(set(SRC_CONNECTORS), set(TGT_CONNECTORS))
+    if aligner is not None:
+        aligner.enable_profiling(out=None)
+    start = time.perf_counter()
+    if aligner is not None:
+        result = aligner.align(paths['src'], paths['tgt'])
+    elif name == 'non_con_dict':
+        result = None
+        Disambiguator.create_non_con_dict(SRC_CONNECTORS, paths['src'])
+    elif name == 'giza':
+        reader = GizaResultsReader(set(SRC_CONNECTORS))
+        result = reader.read_results(paths['a3'])
+    else:
+        raise ValueError(f'Unknown benchmark: {name}')
+    phases['main'] = time.perf_counter() - start
+    if result is not None:
+        start = time.perf_counter()
+        Aligner.result_to_df(result)
+        phases['result_to_df'] = time.perf_counter() - start
+    total = sum(phases.values())
+    counters = dict()
+    if aligner is not None:
+        profile = aligner.profiler.summary()
+        for phase, timer in profile['timers'].items():
+            phases[phase] = timer['seconds']
+        counters = profile['counters']
+    return {'lines': n_lines,
+            'seconds': total,
+            'lines_per_sec': n_lines / total if total else None,
+            'peak_rss': _peak_rss(),
+            'phases': phases,
+            'counters': counters}
+
+
+def _version():
+    """Returns the current git commit, if available."""
+    try:
+        return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(directory, n_lines, density=0.1, seed=0,
+                   benchmarks=BENCHMARKS):
+    """Generates the corpus and runs the benchmarks.
+
+    Every benchmark runs in a fresh process, so that its peak RSS is
+    measured separately.
+
+    Returns:
+        dict: The report.
+
+    """
+    paths = generate_corpus(directory, n_lines, density, seed)
+    report = {'version': _version(),
+              'python': platform.python_version(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'corpus': {'lines': n_lines, 'density': density, 'seed': seed},
+              'benchmarks': dict()}
+    for name in benchmarks:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            report['benchmarks'][name] = pool.submit(
+                    _run_benchmark, name, paths, n_lines).result()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lines', type=int, default=100000,
+                        help='number of synthetic sentence pairs')
+    parser.add_argument('--density', type=float, default=0.1,
+                        help='share of sentence pairs with a connector')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dir', default='benchmark_data',
+                        help='directory for the synthetic files')
+    parser.add_argument('--output', default='',
+                        help='JSON file for the report (default: stdout)')
+    parser.add_argument('--benchmarks', nargs='+', default=BENCHMARKS,
+                        choices=BENCHMARKS)
+    args = parser.parse_args()
+    report = run_benchmarks(args.dir, args.lines, args.density, args.seed,
+                            args.benchmarks)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as out:
+            json.dump(report, out, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
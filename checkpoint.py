@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains checkpoints for resumable and incremental runs.
+
+A checkpoint is a JSON file with the settings of a run, the position
+where reading continues and the counts up to this position:
+
+    {"settings": {...},
+     "lineno": <line number of the next line>,
+     "offsets": [<byte position of the next line in every file>],
+     "complete": <whether the run reached the end of the files>,
+     "alignments": {<connector>: {<equivalent>: <count>, ...}, ...}}
+
+A run can be resumed from any checkpoint. If the files were extended
+after a complete run, resuming aligns only the appended lines.
+
+"""
+import json
+import os
+
+from corpus import Shard, is_tokenized
+
+
+#: Number of lines after which a checkpoint is written.
+CHECKPOINT_EVERY = 100000
+
+
+def save_checkpoint(path, settings, position, alignments, complete=False):
+    """Writes a checkpoint.
+
+    The file is replaced atomically, so an interrupted run always leaves
+    a valid checkpoint.
+
+    Args:
+        path(str): Path to the checkpoint file.
+        settings(dict): Settings of the run, must be JSON serializable.
+        position(corpus.Shard): Where the next line starts. For a single
+                                file, 'tgt_offset' is not used.
+        alignments(dict): The counts so far. Can also be a CountMatrix.
+        complete(bool): Whether the end of the files was reached.
+
+    """
+    if type(alignments) is not dict:
+        alignments = alignments.to_dict()
+    state = {'settings': settings,
+             'lineno': position.lineno,
+             'offsets': [position.src_offset, position.tgt_offset],
+             'complete': complete,
+             'alignments': alignments}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(state, file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, settings, paths=()):
+    """Reads a checkpoint and checks that it belongs to a run.
+
+    Args:
+        path(str): Path to the checkpoint file.
+        settings(dict): Settings of the run that is resumed.
+        paths(tuple): The files of the run (paths or tokenized corpora).
+                      Files must not be shorter than the checkpointed
+                      position.
+
+    Returns:
+        tuple: Where reading continues (corpus.Shard) and the counts so far
+               (dict).
+
+    Raises:
+        ValueError: If the settings differ or a file is too short.
+
+    """
+    with open(path, encoding='utf-8') as file:
+        state = json.load(file)
+    if state['settings'] != json.loads(json.dumps(settings)):
+        raise ValueError(f'Checkpoint {path} has other settings: '
+                         f'{state["settings"]}')
+    for corpus, offset in zip(paths, state['offsets']):
+        if is_tokenized(corpus):
+            too_short = len(corpus) < state['lineno'] - 1
+        else:
+            too_short = os.path.getsize(corpus) < offset
+        if too_short:
+            raise ValueError(f'{corpus} is shorter than in checkpoint {path}')
+    position = Shard(state['lineno'], None, *state['offsets'])
+    return position, state['alignments']
+
+
+def count_difference(alignments, before):
+    """Returns the counts that were added to 'before' in 'alignments'.
+
+    Args:
+        alignments(dict): The counts after a run. Can also be a
+                          CountMatrix.
+        before(dict): The counts at the start of the run.
+
+    Returns:
+        dict: The positive differences, in the order of 'alignments'.
+
+    """
+    if type(alignments) is not dict:
+        alignments = alignments.to_dict()
+    difference = dict()
+    for connector, equivalents in alignments.items():
+        old = before.get(connector, dict())
+        for equivalent, count in equivalents.items():
+            count -= old.get(equivalent, 0)
+            if count:
+                difference.setdefault(connector, dict())[equivalent] = count
+    return difference
+
+
+def add_to_results(alignments, results_csv, save=''):
+    """Adds counts to a results file written by Aligner.result_to_df.
+
+    The rows and columns of the file keep their order, new equivalents and
+    connectors are appended.
+
+    Args:
+        alignments(dict): The counts that are added (see
+                          Aligner.note_match). Can also be a CountMatrix.
+        results_csv(str): Path to the existing .csv-file.
+        save(str): Path where the sum is saved. If empty, 'results_csv'
+                   is overwritten.
+
+    Returns:
+        pandas.DataFrame: The sum.
+
+    """
+    import pandas as pd
+    # '' (no match) must not be read as NaN.
+    old = pd.read_csv(results_csv, index_col=0, encoding='utf-8',
+                      keep_default_na=False)
+    if type(alignments) is not dict:
+        alignments = alignments.to_dict()
+    index = list(old.index)
+    known = set(index)
+    columns = list(old.columns)
+    for connector, equivalents in alignments.items():
+        if connector not in old.columns:
+            columns.append(connector)
+        for equivalent in equivalents:
+            if equivalent not in known:
+                index.append(equivalent)
+                known.add(equivalent)
+    new = pd.DataFrame(alignments).reindex(index=index, columns=columns)
+    df = old.reindex(index=index, columns=columns, fill_value=0)
+    df = (df + new.fillna(0)).astype(int)
+    df.to_csv(path_or_buf=save or results_csv, encoding='utf-8')
+    return df
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains helpers for reading the line-paired corpus files.
+
+The files are read in binary mode, so that byte offsets of line starts
+can be used to split them into shards which are processed independently.
+Like in text mode, a line ends at '\\n', '\\r\\n' or a lone '\\r' (see
+'iter_file_lines').
+
+Wherever a file path is expected, a tokenized corpus (see
+token_cache.TokenizedCorpus) can be given instead. Its lines are
+addressed by line number, so the byte offsets are not used for it.
+
+"""
+import itertools
+import os
+from collections import namedtuple
+
+from split_text import Tokenizer
+
+
+#: A part of two parallel files. 'lineno' is the line number (starting
+#: at 1) of the first line, 'n_lines' the number of lines (None means
+#: until the end of the files), the offsets are the byte positions of the
+#: first line in the source and the target file.
+Shard = namedtuple('Shard', ['lineno', 'n_lines', 'src_offset', 'tgt_offset'])
+
+#: Number of bytes that are read at once by 'iter_file_lines'.
+READ_SIZE = 1 << 16
+
+
+def iter_file_lines(file):
+    """Yields the undecoded lines of a file opened in binary mode.
+
+    The lines are split like in text mode (universal newlines): at '\\n',
+    '\\r\\n' and a lone '\\r'. Every line keeps its line break, so the
+    sizes of the lines add up to byte offsets.
+
+    Args:
+        file(file): A file opened in binary mode, read from its current
+                    position.
+
+    """
+    rest = b''
+    for block in iter(lambda: file.read(READ_SIZE), b''):
+        lines = (rest + block).splitlines(True)
+        # The last line can continue in the next block, also a '\r' that
+        # is followed by '\n'.
+        rest = lines.pop()
+        if rest.endswith(b'\n'):
+            lines.append(rest)
+            rest = b''
+        yield from lines
+    if rest:
+        yield rest
+
+
+def read_lines(path, offset=0, n_lines=None, progress=None):
+    """Yields the decoded lines of a file.
+
+    Args:
+        path(str): Path to a utf-8 encoded file.
+        offset(int): Byte position of the first line.
+        n_lines(int): Maximum number of lines. If None, the file is read
+                      until the end.
+        progress(callable): If given, called with the number of bytes of
+                            every line (e.g. tqdm.update).
+
+    """
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        lines = itertools.islice(iter_file_lines(file), n_lines)
+        if progress is None:
+            for line in lines:
+                yield line.decode('utf-8')
+        else:
+            for line in lines:
+                progress(len(line))
+                yield line.decode('utf-8')
+
+
+def iter_line_pairs(src_path, tgt_path, shard=None):
+    """Yields the parallel lines of two files.
+
+    Stops at the end of the shorter file.
+
+    Args:
+        src_path(str): Path to the file in the source language.
+        tgt_path(str): Path to the file in the target language.
+        shard(Shard): Part of the files that is read. If None, the
+                      files are read completely.
+
+    Yields:
+        tuple: (lineno, src_line, tgt_line)
+
+    """
+    if shard is None:
+        shard = Shard(1, None, 0, 0)
+    src_lines = read_lines(src_path, shard.src_offset, shard.n_lines)
+    tgt_lines = read_lines(tgt_path, shard.tgt_offset, shard.n_lines)
+    yield from zip(itertools.count(shard.lineno), src_lines, tgt_lines)
+
+
+def is_tokenized(corpus):
+    """Returns True for a tokenized corpus, False for a file path."""
+    return hasattr(corpus, 'iter_tokens')
+
+
+#: Tokenizer of the aligners, casefolds and interns the tokens.
+TOKENIZER = Tokenizer()
+
+
+def tokenize_line(line):
+    """Returns the casefolded tokens of a line."""
+    return TOKENIZER.split(line)
+
+
+def progress_bar(corpus, desc, disable=False, start=None, lines=None):
+    """Creates a progress bar for reading a file or a tokenized corpus.
+
+    The total is the size of the file in bytes or the number of lines of
+    the tokenized corpus, so the bar can be updated with the 'progress'
+    argument of 'iter_tokens'. tqdm is imported on first use.
+
+    Args:
+        start(Shard): Where reading starts. If None, at the beginning.
+        lines(int): If given, the total is this number of lines instead
+                    (e.g. of a sample of line numbers).
+
+    Returns:
+        tqdm.tqdm: The progress bar.
+
+    """
+    from tqdm import tqdm
+    if lines is not None:
+        return tqdm(total=lines, desc=desc, unit='lines', disable=disable)
+    if is_tokenized(corpus):
+        return tqdm(total=len(corpus), desc=desc, unit='lines',
+                    initial=start.lineno - 1 if start else 0,
+                    disable=disable)
+    return tqdm(total=os.path.getsize(corpus), desc=desc, unit='B',
+                unit_scale=True, initial=start.src_offset if start else 0,
+                disable=disable)
+
+
+def iter_tokens(corpus, offset=0, lineno=1, n_lines=None, progress=None,
+                tokenize=tokenize_line):
+    """Yields the casefolded token lists of a file or a tokenized corpus.
+
+    Args:
+        corpus(str or TokenizedCorpus): Path to a file or tokenized corpus.
+        offset(int): Byte position of the first line in the file.
+        lineno(int): Line number of the first line. Only used for a
+                     tokenized corpus.
+        n_lines(int): Maximum number of lines. If None, until the end.
+        progress(callable): If given, called with the number of bytes of
+                            every line of a file, or with 1 for every line
+                            of a tokenized corpus (see 'progress_bar').
+        tokenize(callable): Function that returns the tokens of a line.
+                            Not used for a tokenized corpus.
+
+    """
+    if is_tokenized(corpus):
+        stop = None if n_lines is None else lineno - 1 + n_lines
+        if progress is None:
+            yield from corpus.iter_tokens(lineno - 1, stop)
+        else:
+            for tokens in corpus.iter_tokens(lineno - 1, stop):
+                progress(1)
+                yield tokens
+    else:
+        for line in read_lines(corpus, offset, n_lines, progress):
+            yield tokenize(line)
+
+
+def _track(offsets, i, progress=None):
+    """Returns a progress callback that adds the line sizes to offsets[i]."""
+    def callback(size):
+        offsets[i] += size
+        if progress is not None:
+            progress(size)
+    return callback
+
+
+def iter_token_pairs(src_path, tgt_path, shard=None, progress=None,
+                     tokenize=tokenize_line, offsets=None, src_tokenize=None):
+    """Like 'iter_line_pairs', but yields casefolded token lists.
+
+    Args:
+        src_path(str or TokenizedCorpus): The source file.
+        tgt_path(str or TokenizedCorpus): The target file.
+        shard(Shard): Part of the files that is read. If None, the
+                      files are read completely.
+        progress(callable): Progress callback for the source file, see
+                            'iter_tokens'.
+        tokenize(callable): See 'iter_tokens'.
+        offsets(list): If given, [src_offset, tgt_offset] is kept at the
+                       byte positions after the last yielded line pair, so
+                       that reading can be continued there. Only updated
+                       for files.
+        src_tokenize(callable): Tokenizes the source lines. If None,
+                                'tokenize'.
+
+    Yields:
+        tuple: (lineno, src_tokens, tgt_tokens)
+
+    """
+    if src_tokenize is None:
+        src_tokenize = tokenize
+    if shard is None:
+        shard = Shard(1, None, 0, 0)
+    tgt_progress = None
+    if offsets is not None:
+        offsets[:] = [shard.src_offset, shard.tgt_offset]
+        # At the end, zip reads a source line without target line, so
+        # the offsets are only copied when a pair is yielded.
+        read = list(offsets)
+        if not is_tokenized(src_path):
+            progress = _track(read, 0, progress)
+        if not is_tokenized(tgt_path):
+            tgt_progress = _track(read, 1)
+    src_tokens = iter_tokens(src_path, shard.src_offset, shard.lineno,
+                             shard.n_lines, progress, src_tokenize)
+    tgt_tokens = iter_tokens(tgt_path, shard.tgt_offset, shard.lineno,
+                             shard.n_lines, tgt_progress, tokenize)
+    pairs = zip(itertools.count(shard.lineno), src_tokens, tgt_tokens)
+    if offsets is None:
+        yield from pairs
+    else:
+        for pair in pairs:
+            offsets[:] = read
+            yield pair
+
+
+def line_offsets(path, indices, offset=0):
+    """Computes the byte offsets of lines.
+
+    Args:
+        path(str): Path to a file.
+        indices(list of int): Ascending line indices (starting at 0),
+                              counted from 'offset'.
+        offset(int): Byte position of the line with index 0.
+
+    Returns:
+        list of int: The byte offset of every line in 'indices'. Lines
+                     after the end of the file get the file size.
+
+    """
+    offsets = []
+    i = 0
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        for index, line in enumerate(iter_file_lines(file)):
+            while i < len(indices) and indices[i] <= index:
+                offsets.append(offset)
+                i += 1
+            if i == len(indices):
+                break
+            offset += len(line)
+    offsets.extend([offset] * (len(indices) - i))
+    return offsets
+
+
+def shard_offsets(path, n_shards, line_multiple=1, offset=0):
+    """Splits a file into parts of roughly the same size.
+
+    Every part starts at the beginning of a line.
+
+    Args:
+        path(str): Path to a file.
+        n_shards(int): Number of parts. Small files can give less parts.
+        line_multiple(int): The line index of every part start is a
+                            multiple of this number, so records that span
+                            several lines are not split.
+        offset(int): Byte position of the line where the first part
+                     starts. Only the rest of the file is split.
+
+    Returns:
+        list of tuple: (line index, byte offset) of every part start. The
+                       line indices are counted from 'offset'.
+
+    """
+    size = os.path.getsize(path)
+    targets = iter([offset + (size - offset) * i // n_shards
+                    for i in range(1, n_shards)])
+    target = next(targets, None)
+    bounds = [(0, offset)]
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        for index, line in enumerate(iter_file_lines(file), 1):
+            if target is None:
+                break
+            offset += len(line)
+            if (offset >= target and offset < size
+                    and index % line_multiple == 0):
+                bounds.append((index, offset))
+                while target is not None and target <= offset:
+                    target = next(targets, None)
+    return bounds
+
+
+def make_shards(src_path, tgt_path, n_shards, start=None):
+    """Splits two parallel files into shards with the same lines.
+
+    Args:
+        src_path(str or TokenizedCorpus): The source file.
+        tgt_path(str or TokenizedCorpus): The target file.
+        n_shards(int): Number of shards. Small files can give less shards.
+        start(Shard): Position where the first shard starts ('n_lines' is
+                      ignored). If None, at the beginning of the files.
+
+    Returns:
+        list of Shard: Consecutive shards that cover both files.
+
+    """
+    if start is None:
+        start = Shard(1, None, 0, 0)
+    if not is_tokenized(src_path):
+        bounds = shard_offsets(src_path, n_shards, offset=start.src_offset)
+    elif not is_tokenized(tgt_path):
+        bounds = shard_offsets(tgt_path, n_shards, offset=start.tgt_offset)
+    else:
+        n = min(len(src_path), len(tgt_path)) - (start.lineno - 1)
+        starts = sorted(set(n * i // n_shards for i in range(n_shards)))
+        bounds = [(index, 0) for index in starts]
+    indices = [index for index, _ in bounds]
+    offsets = []
+    for path, offset in ((src_path, start.src_offset),
+                         (tgt_path, start.tgt_offset)):
+        if is_tokenized(path):
+            offsets.append([0] * len(indices))
+        else:
+            offsets.append(line_offsets(path, indices, offset))
+    shards = []
+    for i, index in enumerate(indices):
+        if i + 1 < len(indices):
+            n_lines = indices[i+1] - index
+        else:
+            n_lines = None
+        shards.append(Shard(start.lineno + index, n_lines,
+                            offsets[0][i], offsets[1][i]))
+    return shards
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains NumPy backends for counting alignments.
+
+They can be used instead of the nested dictionaries of Aligner.note_match
+(see Aligner.count_backend). CountMatrix keeps a dense matrix of
+equivalents x connectors, SparseCounts only the non-zero pairs.
+
+"""
+import heapq
+from array import array
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+
+# Cached result of _sorts_dict_union.
+_SORTS_DICT_UNION = None
+
+
+def _sorts_dict_union():
+    """Returns whether pandas sorts the row union of a dict of dicts.
+
+    Older pandas versions sort the keys, newer keep their order.
+    """
+    global _SORTS_DICT_UNION
+    if _SORTS_DICT_UNION is None:
+        df = pd.DataFrame({'a': {'b': 1}, 'b': {'a': 1}})
+        _SORTS_DICT_UNION = list(df.index) == ['a', 'b']
+    return _SORTS_DICT_UNION
+
+
+class CountMatrix():
+    """Counts matches of connectors and equivalents in a NumPy matrix.
+
+    Connectors and equivalents are interned to integer IDs. Matches are
+    collected in batches and then added to a growable int64 matrix with
+    one row per equivalent and one column per connector.
+
+    Attributes:
+        connectors (list of str): The connector of every column.
+        equivalents (list of str): The equivalent of every row.
+
+    """
+    #: Number of matches that are collected before they are counted.
+    BATCH_SIZE = 1 << 16
+
+    def __init__(self):
+        self.connectors = []
+        self.equivalents = []
+        self._connector_ids = dict()
+        self._equivalent_ids = dict()
+        self._counts = np.zeros((64, 8), dtype=np.int64)
+        self._batch_rows = array('q')
+        self._batch_cols = array('q')
+        self._batch_counts = array('q')
+        # (rows, cols) of the non-zero cells in the order of their first
+        # match, so that to_dict can reproduce the order of the dicts.
+        self._order = []
+
+    def add(self, connector, equivalent, count=1):
+        """Adds matches of a connector and an equivalent.
+
+        Args:
+            connector (str): Source connector.
+            equivalent (str): Found target connector.
+            count (int): Number of matches.
+
+        """
+        col = self._connector_ids.get(connector)
+        if col is None:
+            col = self._connector_ids[connector] = len(self.connectors)
+            self.connectors.append(connector)
+        row = self._equivalent_ids.get(equivalent)
+        if row is None:
+            row = self._equivalent_ids[equivalent] = len(self.equivalents)
+            self.equivalents.append(equivalent)
+        self._batch_rows.append(row)
+        self._batch_cols.append(col)
+        self._batch_counts.append(count)
+        if len(self._batch_rows) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Adds the collected matches to the matrix."""
+        if not self._batch_rows:
+            return
+        n_rows, n_cols = self._counts.shape
+        if len(self.equivalents) > n_rows or len(self.connectors) > n_cols:
+            while n_rows < len(self.equivalents):
+                n_rows *= 2
+            while n_cols < len(self.connectors):
+                n_cols *= 2
+            counts = np.zeros((n_rows, n_cols), dtype=np.int64)
+            counts[:self._counts.shape[0], :self._counts.shape[1]] = \
+                self._counts
+            self._counts = counts
+        rows = np.frombuffer(self._batch_rows, dtype=np.int64)
+        cols = np.frombuffer(self._batch_cols, dtype=np.int64)
+        keys = rows * n_cols + cols
+        cells, first, inverse = np.unique(keys, return_index=True,
+                                          return_inverse=True)
+        sums = np.bincount(inverse.reshape(-1),
+                           weights=np.frombuffer(self._batch_counts,
+                                                 dtype=np.int64))
+        flat = self._counts.reshape(-1)
+        new = np.sort(first[flat[cells] == 0])
+        if len(new):
+            self._order.append((rows[new], cols[new]))
+        flat[cells] += sums.astype(np.int64)
+        self._batch_rows = array('q')
+        self._batch_cols = array('q')
+        self._batch_counts = array('q')
+
+    def merge(self, other):
+        """Adds the matches of another CountMatrix or nested dict."""
+        if isinstance(other, CountMatrix):
+            other = other.to_dict()
+        for connector, equivalents in other.items():
+            for equivalent, count in equivalents.items():
+                self.add(connector, equivalent, count)
+
+    def matrix(self):
+        """Returns the counts (equivalents x connectors) as an array."""
+        self.flush()
+        return self._counts[:len(self.equivalents), :len(self.connectors)]
+
+    def _cells(self):
+        """Returns (rows, cols) of all non-zero cells in match order."""
+        self.flush()
+        if not self._order:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        return (np.concatenate([rows for rows, _ in self._order]),
+                np.concatenate([cols for _, cols in self._order]))
+
+    def to_dict(self):
+        """Returns the counts as nested dict like Aligner.note_match."""
+        rows, cols = self._cells()
+        counts = self._counts[rows, cols].tolist()
+        d = {connector: dict() for connector in self.connectors}
+        for row, col, count in zip(rows.tolist(), cols.tolist(), counts):
+            d[self.connectors[col]][self.equivalents[row]] = count
+        return d
+
+    def items(self):
+        return self.to_dict().items()
+
+    def to_df(self):
+        """Creates the same pandas.DataFrame as Aligner.result_to_df.
+
+        The DataFrame is built directly from the matrix. The rows are
+        ordered like pandas orders the union of the keys of nested dicts.
+
+        """
+        rows, cols = self._cells()
+        col_rows = [rows[cols == col] for col in range(len(self.connectors))]
+        if (len(col_rows) <= 1
+                or all(np.array_equal(col_rows[0], other)
+                       for other in col_rows[1:])):
+            index = col_rows[0] if col_rows else rows
+        elif _sorts_dict_union():
+            index = np.array(sorted(np.unique(rows).tolist(),
+                                    key=self.equivalents.__getitem__),
+                             dtype=np.int64)
+        else:
+            all_rows = np.concatenate(col_rows)
+            _, first = np.unique(all_rows, return_index=True)
+            index = all_rows[np.sort(first)]
+        return pd.DataFrame(self._row_values(index),
+                            index=[self.equivalents[row]
+                                   for row in index.tolist()],
+                            columns=self.connectors).astype(int)
+
+    def _row_values(self, rows):
+        """Returns the counts of some equivalents as dense array."""
+        return self.matrix()[rows]
+
+    def iter_counts(self):
+        """Yields (connector, equivalent, count) of every non-zero pair."""
+        for connector, equivalents in self.to_dict().items():
+            for equivalent, count in equivalents.items():
+                yield connector, equivalent, count
+
+    def top_values(self, top=10):
+        """Returns the most frequent equivalents of every connector.
+
+        Args:
+            top (int): Number of equivalents per connector.
+
+        Returns:
+            dict: Connector as key and a list of (equivalent, count),
+                  highest count first, as value.
+
+        """
+        return {connector: heapq.nlargest(top, equivalents.items(),
+                                          key=itemgetter(1))
+                for connector, equivalents in self.to_dict().items()}
+
+    def __getstate__(self):
+        self.flush()
+        state = self.__dict__.copy()
+        for name in ('_batch_rows', '_batch_cols', '_batch_counts'):
+            state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._batch_rows = array('q')
+        self._batch_cols = array('q')
+        self._batch_counts = array('q')
+
+
+class SparseCounts(CountMatrix):
+    """Counts matches of connectors and equivalents in sparse form.
+
+    Only the non-zero pairs are stored, so the memory grows with their
+    number instead of connectors x equivalents. A pair is stored as key
+    (connector ID * 2**32 + equivalent ID) with its count and the number
+    of the match that added it first. Collected matches are compacted
+    into sorted runs of unique keys, and the runs are merged when they
+    are as large as the main run. After merging, the keys are sorted by
+    connector, like the rows of a CSR matrix.
+
+    Attributes:
+        connectors (list of str): The connector of every connector ID.
+        equivalents (list of str): The equivalent of every equivalent ID.
+
+    """
+    #: Maximum number of runs before they are merged.
+    MAX_RUNS = 16
+
+    def __init__(self):
+        self.connectors = []
+        self.equivalents = []
+        self._connector_ids = dict()
+        self._equivalent_ids = dict()
+        self._batch_rows = array('q')
+        self._batch_cols = array('q')
+        self._batch_counts = array('q')
+        self._n_matches = 0
+        # (keys, counts, first) of every run, the first is the main run.
+        self._runs = []
+
+    @staticmethod
+    def _compact(keys, counts, first):
+        """Sums the counts of equal keys, sorted by key."""
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        if not len(keys):
+            return keys, counts[order], first[order]
+        starts = np.flatnonzero(np.concatenate(([True],
+                                                keys[1:] != keys[:-1])))
+        return (keys[starts], np.add.reduceat(counts[order], starts),
+                np.minimum.reduceat(first[order], starts))
+
+    def flush(self):
+        """Compacts the collected matches into a run."""
+        if not self._batch_rows:
+            return
+        rows = np.frombuffer(self._batch_rows, dtype=np.int64)
+        cols = np.frombuffer(self._batch_cols, dtype=np.int64)
+        counts = np.frombuffer(self._batch_counts, dtype=np.int64)
+        first = np.arange(self._n_matches, self._n_matches + len(rows))
+        self._n_matches += len(rows)
+        self._runs.append(self._compact((cols << 32) | rows, counts, first))
+        self._batch_rows = array('q')
+        self._batch_cols = array('q')
+        self._batch_counts = array('q')
+        if (len(self._runs) > self.MAX_RUNS
+                or sum(len(run[0]) for run in self._runs[1:])
+                >= len(self._runs[0][0])):
+            self._merge_runs()
+
+    def _merge_runs(self):
+        if len(self._runs) > 1:
+            self._runs = [self._compact(*[np.concatenate(arrays)
+                                          for arrays in zip(*self._runs)])]
+
+    def _pairs(self):
+        """Returns the keys, counts and first matches of all pairs."""
+        self.flush()
+        self._merge_runs()
+        if not self._runs:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        return self._runs[0]
+
+    def __len__(self):
+        """Returns the number of non-zero pairs."""
+        return len(self._pairs()[0])
+
+    def merge(self, other):
+        """Adds the matches of another SparseCounts, CountMatrix or nested
+        dict."""
+        if not isinstance(other, SparseCounts):
+            super().merge(other)
+            return
+        keys, counts, first = other._pairs()
+        if not len(keys):
+            return
+        self.flush()
+        # IDs of the other's connectors and equivalents in this object.
+        cols = np.array([self._intern(connector, self._connector_ids,
+                                      self.connectors)
+                         for connector in other.connectors], dtype=np.int64)
+        rows = np.array([self._intern(equivalent, self._equivalent_ids,
+                                      self.equivalents)
+                         for equivalent in other.equivalents],
+                        dtype=np.int64)
+        keys = (cols[keys >> 32] << 32) | rows[keys & 0xFFFFFFFF]
+        self._runs.append(self._compact(keys, counts,
+                                        first + self._n_matches))
+        self._n_matches += other._n_matches
+        self._merge_runs()
+
+    @staticmethod
+    def _intern(value, ids, values):
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = ids[value] = len(values)
+            values.append(value)
+        return value_id
+
+    def matrix(self):
+        """Returns the counts (equivalents x connectors) as dense array.
+
+        Needs memory for all equivalents x connectors, see 'iter_counts'
+        and 'top_values' for the sparse alternatives.
+        """
+        return self._row_values(np.arange(len(self.equivalents)))
+
+    def _cells(self):
+        keys, _, first = self._pairs()
+        keys = keys[np.argsort(first, kind='stable')]
+        return keys & 0xFFFFFFFF, keys >> 32
+
+    def _row_values(self, rows):
+        keys, counts, _ = self._pairs()
+        positions = np.full(len(self.equivalents), -1, dtype=np.int64)
+        positions[rows] = np.arange(len(rows))
+        values = np.zeros((len(rows), len(self.connectors)), dtype=np.int64)
+        pair_rows = positions[keys & 0xFFFFFFFF]
+        selected = pair_rows >= 0
+        values[pair_rows[selected], (keys >> 32)[selected]] = \
+            counts[selected]
+        return values
+
+    def to_dict(self):
+        """Returns the counts as nested dict like Aligner.note_match."""
+        keys, counts, first = self._pairs()
+        order = np.argsort(first, kind='stable')
+        d = {connector: dict() for connector in self.connectors}
+        for key, count in zip(keys[order].tolist(), counts[order].tolist()):
+            d[self.connectors[key >> 32]][
+                self.equivalents[key & 0xFFFFFFFF]] = count
+        return d
+
+    def iter_counts(self, chunk_size=1 << 16):
+        """Yields (connector, equivalent, count) of every non-zero pair.
+
+        The pairs are ordered by connector ID, then equivalent ID, and
+        converted in chunks, so no other copy of all pairs is made.
+
+        Args:
+            chunk_size (int): Number of pairs that are converted at once.
+
+        """
+        keys, counts, _ = self._pairs()
+        connectors = self.connectors
+        equivalents = self.equivalents
+        for start in range(0, len(keys), chunk_size):
+            for key, count in zip(keys[start:start+chunk_size].tolist(),
+                                  counts[start:start+chunk_size].tolist()):
+                yield (connectors[key >> 32],
+                       equivalents[key & 0xFFFFFFFF], count)
+
+    def top_values(self, top=10):
+        """See CountMatrix.top_values, without creating a nested dict."""
+        keys, counts, first = self._pairs()
+        bounds = np.searchsorted(
+                keys, np.arange(len(self.connectors) + 1, dtype=np.int64)
+                << 32).tolist()
+        top_values = dict()
+        for col, connector in enumerate(self.connectors):
+            begin, end = bounds[col], bounds[col+1]
+            # Equal counts in the order of the first match, like the dicts.
+            best = heapq.nlargest(top, zip(counts[begin:end].tolist(),
+                                           (-first[begin:end]).tolist(),
+                                           keys[begin:end].tolist()))
+            top_values[connector] = [
+                    (self.equivalents[key & 0xFFFFFFFF], count)
+                    for count, _, key in best]
+        return top_values
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module combines the disambiguation and the list approach.
+
+The source connectors are disambiguated with the heuristics of
+Disambiguator.create_non_con_dict while the list approach reads the
+corpus. In every line, the first occurrence of a connector between two
+spaces (in any case) is judged: if it follows a word and a space and is
+followed by a space and a word (e.g. "ist aber gut"), it is not used as
+a connector. Capitalized occurrences (e.g. at the beginning of a
+sentence), occurrences after a comma and the further occurrences in the
+line are kept, like create_non_con_dict counts them. Non-connector uses
+are skipped before the search for an equivalent, so the files are read
+only once.
+
+The results differ from results/disambig/disambig_33_minus16.csv, which
+was made with an earlier disambiguation that isn't part of the
+repository, so 'main' saves them under another name.
+
+"""
+import logging
+import re
+
+from corpus import TOKENIZER, is_tokenized
+from list_aligner import ListAligner
+
+
+#: Context of a non-connector use, see Disambiguator.create_non_con_dict.
+#: The connector is the token between the two spaces.
+NON_CONNECTOR_CONTEXT = re.compile(
+        r"[a-zA-Zß0-9\(\)\'\"öüä ] [^ ]+ [a-zA-Z0-9\(öüäÄÜÖ\)]")
+
+#: Appended to a source token that is used as non-connector.
+NON_CONNECTOR_MARK = ' (no connector)'
+
+
+class DisambigAligner(ListAligner):
+    """List approach that skips non-connector uses of source connectors.
+
+    The source file is needed as text, a token_cache.TokenizedCorpus has
+    lost the commas and the case.
+    """
+
+    def align(self, src_path, tgt_path, *args, **kwargs):
+        """Aligns the connectors like ListAligner.align.
+
+        Raises:
+            ValueError: If 'src_path' is a tokenized corpus.
+
+        """
+        if is_tokenized(src_path):
+            raise ValueError('The source file is needed as text to '
+                             'disambiguate the connectors.')
+        return super().align(src_path, tgt_path, *args, **kwargs)
+
+    def sweep(self, src_path, tgt_path, *args, **kwargs):
+        """Aligns with several settings like ListAligner.sweep.
+
+        Raises:
+            ValueError: If 'src_path' is a tokenized corpus.
+
+        """
+        if is_tokenized(src_path):
+            raise ValueError('The source file is needed as text to '
+                             'disambiguate the connectors.')
+        return super().sweep(src_path, tgt_path, *args, **kwargs)
+
+    def _source_tokenizer(self):
+        """Returns a tokenizer that marks the non-connector uses.
+
+        A marked token is not in self.src_connectors, so it is neither
+        searched nor logged. The number of marked tokens is counted as
+        'non_connectors' if profiling is enabled.
+        """
+        connectors = self.src_connectors
+        split = TOKENIZER.split
+        spans = TOKENIZER.spans
+        is_context = NON_CONNECTOR_CONTEXT.fullmatch
+        count = None
+        if self.profiler is not None:
+            count = self.profiler.count
+
+        def tokenize(line):
+            tokens = split(line)
+            if connectors.isdisjoint(tokens):
+                return tokens
+            # Like create_non_con_dict, the context is taken from the
+            # stripped line and only the first occurrence of a connector
+            # between two spaces is judged.
+            line = line.strip()
+            judged = set()
+            for i, (begin, end) in enumerate(spans(line)):
+                token = tokens[i]
+                if (token not in connectors or token in judged
+                        or begin < 2 or line[begin-1] != ' '
+                        or end + 2 > len(line) or line[end] != ' '):
+                    continue
+                judged.add(token)
+                # Capitalized occurrences are kept.
+                if (line[begin:end] == token
+                        and is_context(line, begin - 2, end + 2)):
+                    tokens[i] = token + NON_CONNECTOR_MARK
+                    if count is not None:
+                        count('non_connectors')
+            return tokens
+
+        return tokenize
+
+
+def main():
+    """Starts alignment."""
+    logging.basicConfig(filename="results/disambig/no_matches.log",
+                        level=logging.INFO)
+
+    obj1 = DisambigAligner(
+            src_connectors={'aber', 'doch', 'jedoch',
+                            'allerdings', 'andererseits', 'hingegen'},
+            tgt_connectors={'but', 'however', 'though',
+                            'although', 'yet', 'nevertheless',
+                            'nonetheless', 'albeit', 'otherwise',
+                            'whereas', 'again', 'still', 'instead',
+                            'alternatively', 'after all', 'then again',
+                            'there again', 'by contrast', 'on the contrary',
+                            'on the other hand', 'at the same time',
+                            'even so', 'even if', 'by the same token',
+                            'on a different note', 'on the other side',
+                            'on the downside', 'having said this',
+                            'having said that', 'apart from that'}
+            )
+    europarl_result = obj1.align('de-en/europarl-v7.de-en.de',
+                                 'de-en/europarl-v7.de-en.en')
+    # Save results df to csv (see module docstring for the name).
+    europarl_df = DisambigAligner.result_to_df(
+            europarl_result,
+            save='results/disambig/disambig_aligner_33_minus16.csv'
+            )
+    # Save top 10 equivalents for every connector.
+    obj1.print_top_values(
+            europarl_df,
+            save='results/disambig/disambig_aligner_33_minus16.txt')
+
+
+if __name__ == "__main__":
+    main()
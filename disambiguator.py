@@ -4,24 +4,29 @@ Python: 3.8.10
 Windows 10
 """
 
+import csv
 import io
 import logging
-import pandas as pd
-import regex as re
+from contextlib import closing
 
-from tqdm import tqdm
+from corpus import read_lines
+from split_text import TOKEN_PATTERN, token_split
 
 
 class Disambiguator():
     """Filter out candidates based on patterns pre and post alignment."""
 
     def __init__(self, alignments_df,
-                 patterns=[r", %s", r"%s,"]):
+                 patterns=[r", %s", r"%s,"],
+                 punish_patterns=[r"[a-zA-Z] %s "]):
         self.alignments_df = alignments_df
         self.patterns = patterns
+        self.punish_patterns = punish_patterns
+        # Results of _count_patterns, see disambiguate.
+        self.pattern_counts = {}
 
     def disambiguate(self, tgt_path, candidate_list,
-                     c_filter=10, p_filter=2, mode="pattern"):
+                     c_filter=10, p_filter=2, mode="pattern", tokenized=None):
         """Return a drop_list containing all indices/candidates (post alignment).
 
         Args
@@ -33,15 +38,40 @@ class Disambiguator():
             c_filter(int): int that governs, how often a candidate
                            must have been found in one of the self.patterns
                            to be considered a connector.
-            d_filter(int): int that governs, how often a candidate must
-                           have been found in a punisch_pattern before
+            p_filter(int): int that governs, how often a candidate must
+                           have been found in a punish_pattern before
                            being put on the drop_list.
+            mode(str): "count" counts all candidates in one pass over the
+                       file (see _count_patterns). The counts are kept in
+                       self.pattern_counts, so other filter values for the
+                       same file and candidates need no further pass, and
+                       only new candidates are counted.
+                       "pattern" (default) searches the file once per
+                       candidate and pattern with regular expressions.
+            tokenized(token_cache.TokenizedCorpus): tokenized tgt_path.
+                      If given, the "count" mode skips all lines that
+                      contain no candidate without tokenizing them.
 
         Returns
         -------
             list of strings: drop_list containing all indices/candidates that
                              are to be dropped from alignments_dataframe.
         """
+        if mode == 'count':
+            counts = self.pattern_counts.get(tgt_path, {})
+            # Candidates are counted independently, so only the new ones
+            # need a pass over the file.
+            missing = [candidate for candidate in candidate_list
+                       if str(candidate) not in counts]
+            if missing:
+                new_counts = self._count_patterns(tgt_path, missing,
+                                                  tokenized)
+                if new_counts is None:
+                    return None
+                counts = {**counts, **new_counts}
+                self.pattern_counts[tgt_path] = counts
+            return self.drop_list_from_counts(counts, candidate_list,
+                                              c_filter, p_filter)
         if mode == 'pattern':
             return self._pattern_disamb(tgt_path, candidate_list, c_filter,
                                         p_filter)
@@ -55,9 +85,8 @@ class Disambiguator():
                         continue
                     else:
                         drop_list.append(candidate)
-                txt_file.seek(0)
                 for candidate in candidate_list:
-                    if (self._punish_patterns([r"[a-zA-Z] %s "], candidate,
+                    if (self._punish_patterns(self.punish_patterns, candidate,
                                               txt_file, p_filter)):
                         drop_list.append(candidate)
             return drop_list
@@ -75,28 +104,159 @@ class Disambiguator():
         return list(self.alignments_df.index)
 
     def _check_context(self, candidate, txt_file, filter):
+        import regex as re
         count = 0
         for pattern in self.patterns:
+            compiled = re.compile(pattern % re.escape(str(candidate)),
+                                  re.IGNORECASE)
+            txt_file.seek(0)
             for line in txt_file:
                 stripped_line = line.strip()
-                if re.search(pattern % str(candidate), stripped_line,
-                             re.IGNORECASE):
+                if compiled.search(stripped_line):
                     count += 1
                     if count == filter:
                         return True
         return False
 
     def _punish_patterns(self, patterns, candidate, txt, p_filter):
+        import regex as re
         count = 0
         for pattern in patterns:
+            compiled = re.compile(pattern % re.escape(str(candidate)))
+            txt.seek(0)
             for line in txt:
                 stripped_line = line.strip()
-                if re.search(pattern % str(candidate), stripped_line):
+                if compiled.search(stripped_line):
                     count += 1
-                    if count == filter:
+                    if count == p_filter:
                         return True
         return False
 
+    def _count_patterns(self, tgt_path, candidate_list, tokenized=None):
+        """Count the pattern occurences of all candidates in one pass.
+
+        Every line is split into tokens like split_text.token_split does.
+        Token sequences joined by single spaces are looked up in a hash
+        set of the candidates, so unlike in the "pattern" mode a candidate
+        only matches whole tokens ("but" is not found in "butter"). For
+        every hit, the part of a pattern before "%s" has to match directly
+        before the candidate and the part after "%s" directly after it.
+        self.patterns ignore case, self.punish_patterns don't.
+
+        Args
+        -------
+            tgt_path(str): directory of the target file.
+            candidate_list(list): candidates/indices of the
+                                  alignments_dataframe.
+            tokenized(token_cache.TokenizedCorpus): see disambiguate.
+
+        Returns
+        -------
+            dict: str(candidate): list of int. The list contains for every
+                  pattern of self.patterns and then of
+                  self.punish_patterns in how many lines it was found.
+        """
+        import regex as re
+        from tqdm import tqdm
+        patterns = ([self._split_pattern(pattern, re.IGNORECASE)
+                     for pattern in self.patterns]
+                    + [self._split_pattern(pattern, 0)
+                       for pattern in self.punish_patterns])
+        n_patterns = len(self.patterns)
+        counts = {}
+        # casefolded candidate: candidates
+        folded = {}
+        max_length = 1
+        for candidate in candidate_list:
+            candidate = str(candidate)
+            counts[candidate] = [0] * len(patterns)
+            folded.setdefault(candidate.casefold(), []).append(candidate)
+            max_length = max(max_length, len(candidate.split(' ')))
+        try:
+            if tokenized is None:
+                txt_file = io.open(tgt_path, mode="r", encoding="utf-8")
+                hit_lines = None
+            else:
+                # The cache splits lines like corpus.read_lines.
+                txt_file = closing(read_lines(tgt_path))
+                first_tokens = set()
+                for folded_candidate in folded:
+                    tokens = token_split(folded_candidate)
+                    if tokens:
+                        first_tokens.add(tokens[0])
+                hit_lines = set(tokenized.lines_with(first_tokens).tolist())
+            with txt_file as lines:
+                for index, line in enumerate(tqdm(lines,
+                                                  desc='Counting patterns')):
+                    if hit_lines is not None and index not in hit_lines:
+                        continue
+                    stripped_line = line.strip()
+                    tokens = list(TOKEN_PATTERN.finditer(stripped_line))
+                    hits = set()
+                    for i in range(len(tokens)):
+                        begin = tokens[i].start()
+                        for j in range(i, min(i + max_length, len(tokens))):
+                            if (j > i and tokens[j].start()
+                                    != tokens[j-1].end() + 1):
+                                break
+                            end = tokens[j].end()
+                            snip = stripped_line[begin:end]
+                            for candidate in folded.get(snip.casefold(), ()):
+                                for k, (before, after) in enumerate(patterns):
+                                    if k >= n_patterns and snip != candidate:
+                                        continue
+                                    if ((candidate, k) not in hits
+                                            and before.search(stripped_line,
+                                                              0, begin)
+                                            and after.match(stripped_line,
+                                                            end)):
+                                        hits.add((candidate, k))
+                    for candidate, k in hits:
+                        counts[candidate][k] += 1
+        except IOError:
+            logging.basicConfig(level=logging.ERROR)
+            logging.error("ERROR: Could not find the given file")
+            return None
+        return counts
+
+    @staticmethod
+    def _split_pattern(pattern, flags):
+        """Return the compiled parts of a pattern before and after "%s"."""
+        import regex as re
+        before, after = pattern.split("%s")
+        return (re.compile(r"(?:%s)$" % before, flags),
+                re.compile(after, flags))
+
+    def drop_list_from_counts(self, counts, candidate_list,
+                              c_filter=10, p_filter=2):
+        """Return the drop_list for counts from _count_patterns.
+
+        A candidate is dropped if it was found less than c_filter times
+        in self.patterns, and (again) if it was found at least p_filter
+        times in self.punish_patterns.
+
+        Args
+        -------
+            counts(dict): see _count_patterns.
+            candidate_list(list): candidates/indices of the
+                                  alignments_dataframe.
+            c_filter(int): see disambiguate.
+            p_filter(int): see disambiguate.
+
+        Returns
+        -------
+            list of strings: see disambiguate.
+        """
+        n_patterns = len(self.patterns)
+        drop_list = []
+        for candidate in candidate_list:
+            if sum(counts[str(candidate)][:n_patterns]) < c_filter:
+                drop_list.append(candidate)
+        for candidate in candidate_list:
+            if sum(counts[str(candidate)][n_patterns:]) >= p_filter:
+                drop_list.append(candidate)
+        return drop_list
+
     def drop_rows(self, drop_list):
         """Return alignment_df after drop_list indixes have beeen removed.
 
@@ -114,7 +274,7 @@ class Disambiguator():
 
     # pre alignment disambiguation:
     @staticmethod
-    def create_non_con_dict(connector_list, tgt_path):
+    def create_non_con_dict(connector_list, tgt_path, mode="single_pass"):
         """Show which of the non-connector occurences for every connector.
 
         Args
@@ -123,6 +283,10 @@ class Disambiguator():
                 connectors for which the non-connector occurences
                 are to be found.
             tgt_path(str): directory of the file containing the connectors.
+            mode(str): "single_pass" reads the file once and searches all
+                       connectors with combined precompiled patterns.
+                       "per_connector" reads the file once per connector.
+                       Both give the same result.
 
         Returns
         -------
@@ -131,38 +295,125 @@ class Disambiguator():
                    The second one contains how many occurrences there were
                    overall for every connector.
         """
-        not_connectors = {}
-        con_total_occs = {}
+        import regex as re
         try:
             with io.open(tgt_path, mode="r", encoding="utf-8") as txt_file:
-                for connector in tqdm(connector_list,
-                                      desc='Disambiguation',
-                                      total=len(connector_list)):
-                    connector_occs = []
-                    not_connectors[connector] = []
-                    txt_file.seek(0)
-                    for line in txt_file:
-                        stripped_line = line.strip()
-                        if re.search(r". %s ." % connector, stripped_line,
-                                     re.IGNORECASE):
-                            connector_occs.append(
-                                    re.findall(
-                                        r". %s ." % connector, stripped_line,
-                                        re.IGNORECASE)[0])
-                        elif re.search(r"%s" % str(connector).capitalize(),
-                                       stripped_line):
-                            connector_occs.append(str(', ' + re.findall(
-                                r"%s" % str(connector).capitalize(),
-                                stripped_line)[0] + ' ,'))
-                    con_total_occs[connector] = len(connector_occs)
-                    for i in range(0, len(connector_occs)):
-                        if re.search(r"[a-zA-Zß0-9\(\)\'\"öüä ] %s [a-zA-Z0-9\(öüäÄÜÖ\)]"
-                                     % str(connector), connector_occs[i]):
-                            not_connectors[connector].append(i)
-            return (not_connectors, con_total_occs)
+                if mode == "single_pass":
+                    con_occs = Disambiguator._scan_connectors(connector_list,
+                                                              txt_file)
+                else:
+                    con_occs = Disambiguator._scan_per_connector(
+                        connector_list, txt_file)
         except IOError:
             logging.basicConfig(level=logging.ERROR)
             logging.error("ERROR: Could not find the given file")
+            return None
+        not_connectors = {}
+        con_total_occs = {}
+        for connector, connector_occs in con_occs.items():
+            not_connectors[connector] = []
+            con_total_occs[connector] = len(connector_occs)
+            non_con_pattern = re.compile(
+                r"[a-zA-Zß0-9\(\)\'\"öüä ] %s [a-zA-Z0-9\(öüäÄÜÖ\)]"
+                % str(connector))
+            for i in range(0, len(connector_occs)):
+                if non_con_pattern.search(connector_occs[i]):
+                    not_connectors[connector].append(i)
+        return (not_connectors, con_total_occs)
+
+    @staticmethod
+    def _scan_per_connector(connector_list, txt_file):
+        """Return the occurences of every connector, one pass each."""
+        import regex as re
+        from tqdm import tqdm
+        con_occs = {}
+        for connector in tqdm(connector_list,
+                              desc='Disambiguation',
+                              total=len(connector_list)):
+            connector_occs = []
+            txt_file.seek(0)
+            for line in txt_file:
+                stripped_line = line.strip()
+                if re.search(r". %s ." % connector, stripped_line,
+                             re.IGNORECASE):
+                    connector_occs.append(
+                            re.findall(
+                                r". %s ." % connector, stripped_line,
+                                re.IGNORECASE)[0])
+                elif re.search(r"%s" % str(connector).capitalize(),
+                               stripped_line):
+                    connector_occs.append(str(', ' + re.findall(
+                        r"%s" % str(connector).capitalize(),
+                        stripped_line)[0] + ' ,'))
+            con_occs[connector] = connector_occs
+        return con_occs
+
+    @staticmethod
+    def _scan_connectors(connector_list, txt_file):
+        """Return the occurences of every connector in a single pass.
+
+        Every line is searched for the first ". <connector> ." match
+        (ignoring case) of every connector, or else for the capitalized
+        connector, just like in _scan_per_connector. Both searches use one
+        alternation of all connectors inside a lookahead, so overlapping
+        matches of different connectors are found, too. Connectors that
+        could match at the same position as another connector (e.g.
+        "doch" and "doch nicht") are put into separate groups with their
+        own patterns.
+        """
+        import regex as re
+        from tqdm import tqdm
+        groups = []
+        for connector in dict.fromkeys(connector_list):
+            for group in groups:
+                if not any(Disambiguator._overlap(connector, other)
+                           for other in group):
+                    group.append(connector)
+                    break
+            else:
+                groups.append([connector])
+        scans = []
+        for group in groups:
+            context = re.compile(
+                r"(?=. (?:%s) .)" % "|".join(
+                    "(%s)" % re.escape(connector) for connector in group),
+                re.IGNORECASE)
+            capitalized = re.compile(
+                r"(?=%s)" % "|".join(
+                    "(%s)" % re.escape(str(connector).capitalize())
+                    for connector in group))
+            scans.append((group, context, capitalized))
+        con_occs = {connector: [] for connector in connector_list}
+        for line in tqdm(txt_file, desc='Disambiguation'):
+            stripped_line = line.strip()
+            for group, context, capitalized in scans:
+                found = set()
+                for match in context.finditer(stripped_line):
+                    connector = group[match.lastindex - 1]
+                    if connector not in found:
+                        found.add(connector)
+                        con_occs[connector].append(stripped_line[
+                            match.start():match.end(match.lastindex) + 2])
+                if len(found) == len(group):
+                    continue
+                for match in capitalized.finditer(stripped_line):
+                    connector = group[match.lastindex - 1]
+                    if connector not in found:
+                        found.add(connector)
+                        con_occs[connector].append(
+                            ', ' + match.group(match.lastindex) + ' ,')
+        return con_occs
+
+    @staticmethod
+    def _overlap(connector, other):
+        """Return True if both connectors can match at the same position."""
+        lower, other_lower = connector.lower(), other.lower()
+        capital = str(connector).capitalize()
+        other_capital = str(other).capitalize()
+        return (lower.startswith(other_lower + ' ')
+                or other_lower.startswith(lower + ' ')
+                or capital.startswith(other_capital)
+                or other_capital.startswith(capital))
 
     @staticmethod
     def percentage_of_non_connectors(non_con_dicts, csv_file_name=""):
@@ -202,14 +453,9 @@ def main():
     non_con = Disambiguator.create_non_con_dict(['aber', 'doch', 'jedoch',
                                                  'allerdings', 'andererseits',
                                                  'hingegen'],
-<<<<<<< HEAD
                                                 "de-en/europarl-v7.de-en.de")
     print(non_con[0])
     Disambiguator.percentage_of_non_connectors(non_con)
-=======
-                                                r"de-en/europarl-v7.de-en.de")
-    logging.debug(print(non_con[0]))
->>>>>>> 194e6bb9f9a61fb6bce8176747719ea84582a87d
 
 
 if __name__ == "__main__":
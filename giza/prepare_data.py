@@ -1,12 +1,41 @@
 # -*- coding: utf-8 -*-
 # Python 3.6.12
 
-"""Prepares the data files to run Giza."""
+"""Prepares the data files to run Giza.
 
+Both files are split into shards at line boundaries. A process pool
+tokenizes the shards of both files at the same time and the tokenized
+shards are written to the output files in their original order, so the
+output is the same as tokenizing line by line.
 
-from nltk.tokenize import word_tokenize as tokenize
+The SHA-256 hash of an input file and the language are saved next to its
+output file (<output>.json). If they are unchanged and the output file
+is complete, the file is not tokenized again.
 
-from tqdm import tqdm
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+#: Number of bytes of the input file per shard.
+SHARD_SIZE = 1 << 23
+
+#: Buffer size for reading and writing the files.
+BUFFER_SIZE = 1 << 24
+
+
+def tokenize(text, language):
+    """Tokenizes a line with nltk.word_tokenize.
+
+    nltk is imported on first use, it takes long to import.
+    """
+    from nltk.tokenize import word_tokenize
+    return word_tokenize(text, language)
 
 
 def tokenize_file(path, path_out, language, linenumber=None):
@@ -21,6 +50,7 @@ def tokenize_file(path, path_out, language, linenumber=None):
                           of the tokenization.
 
     """
+    from tqdm import tqdm
     with open(path, encoding='utf-8') as file_in, \
          open(path_out, 'w', encoding='utf-8') as file_out:
         for line in tqdm(file_in, total=linenumber,
@@ -29,12 +59,175 @@ def tokenize_file(path, path_out, language, linenumber=None):
             file_out.write(' '.join(tokens) + '\n')
 
 
-if __name__ == '__main__':
+def file_hash(path):
+    """Returns the SHA-256 hash of a file as hex string."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def shard_offsets(path, shard_size=SHARD_SIZE):
+    """Splits a file into parts of about 'shard_size' bytes.
+
+    Returns:
+        list of tuple: (start, end) byte positions. Every part starts at
+                       the beginning of a line.
+
+    """
+    size = os.path.getsize(path)
+    shards = []
+    start = 0
+    with open(path, 'rb') as file:
+        while start < size:
+            file.seek(min(start + shard_size, size))
+            # Rest of the line, so the next part starts at a line.
+            file.readline()
+            end = min(file.tell(), size)
+            shards.append((start, end))
+            start = end
+    return shards
+
+
+def tokenize_shard(path, start, end, language):
+    """Tokenizes the lines between two byte positions of a file.
+
+    The lines are read like in 'tokenize_file' (universal newlines).
+
+    Returns:
+        str: The tokenized lines, each ending with a line break.
+
+    """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8')
+    return ''.join([' '.join(tokenize(line, language)) + '\n'
+                    for line in lines])
+
+
+def _load_meta(path_out):
+    try:
+        with open(path_out + '.json', encoding='utf-8') as meta_file:
+            return json.load(meta_file)
+    except (IOError, ValueError):
+        return None
+
+
+def is_up_to_date(path_out, meta):
+    """Checks whether an output file was written for the same input.
+
+    Args:
+        path_out (str): Path to the tokenized output file.
+        meta (dict): Hash of the input file and language, see
+                     'tokenize_files'.
+
+    """
+    old = _load_meta(path_out)
+    if old is None or not os.path.exists(path_out):
+        return False
+    return ({key: old.get(key) for key in meta} == meta
+            and old.get('size') == os.path.getsize(path_out))
+
+
+def tokenize_files(files, workers=None, force=False, shard_size=SHARD_SIZE,
+                   max_pending=None):
+    """Tokenizes several files in parallel, like 'tokenize_file'.
+
+    The shards of all files are interleaved, so all files are tokenized
+    at the same time. Output files are written to '<path_out>.tmp' and
+    renamed when they are complete.
+
+    Args:
+        files (list of tuple): (path, path_out, language) of every file.
+        workers (int): Number of processes. If None, the number of CPUs.
+        force (bool): If True, files are tokenized even if their output
+                      is up to date (see 'is_up_to_date').
+        shard_size (int): See 'shard_offsets'.
+        max_pending (int): Maximum number of shards that are tokenized or
+                           wait to be written. If None, four times the
+                           number of workers.
+
+    Returns:
+        list of str: The output files that were written, without the
+                     skipped files.
+
+    """
+    from tqdm import tqdm
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 4 * workers
+    jobs = []
+    for path, path_out, language in files:
+        meta = {'input': os.path.abspath(path), 'sha256': file_hash(path),
+                'language': language}
+        if not force and is_up_to_date(path_out, meta):
+            print(f'{path_out} is up to date.')
+            continue
+        shards = shard_offsets(path, shard_size)
+        jobs.append((path, path_out, language, meta, shards))
+    if not jobs:
+        return []
+    # Round robin over the files.
+    tasks = []
+    for i in range(max(len(job[4]) for job in jobs)):
+        for job_id, job in enumerate(jobs):
+            if i < len(job[4]):
+                tasks.append((job_id, *job[4][i]))
+    outputs = [open(job[1] + '.tmp', 'w', encoding='utf-8',
+                    buffering=BUFFER_SIZE) for job in jobs]
+    total = sum(os.path.getsize(job[0]) for job in jobs)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool, \
+             tqdm(total=total, unit='B', unit_scale=True,
+                  desc='Tokenization of the files') as pbar:
+            pending = deque()
+            for job_id, start, end in tasks:
+                path, _, language = jobs[job_id][:3]
+                pending.append((job_id, end - start,
+                                pool.submit(tokenize_shard, path, start, end,
+                                            language)))
+                if len(pending) >= max_pending:
+                    _write_result(outputs, pending.popleft(), pbar)
+            while pending:
+                _write_result(outputs, pending.popleft(), pbar)
+    finally:
+        for output in outputs:
+            output.close()
+    for path, path_out, _, meta, _ in jobs:
+        os.replace(path_out + '.tmp', path_out)
+        meta['size'] = os.path.getsize(path_out)
+        with open(path_out + '.json', 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file)
+    return [job[1] for job in jobs]
+
+
+def _write_result(outputs, result, pbar):
+    """Writes a tokenized shard to its output file."""
+    job_id, n_bytes, future = result
+    outputs[job_id].write(future.result())
+    pbar.update(n_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes (default: number of CPUs)')
+    parser.add_argument('--force', action='store_true',
+                        help='tokenize even if the output is up to date')
+    args = parser.parse_args()
+
     SRC_FILE = '../de-en/europarl-v7.de-en.de'
     TGT_FILE = '../de-en/europarl-v7.de-en.en'
     SRC_FILE_TOKENIZED = 'giza-pp/europarl_data/Source'
     TGT_FILE_TOKENIZED = 'giza-pp/europarl_data/Target'
-    LINENUMBER = 1920210
 
-    tokenize_file(SRC_FILE, SRC_FILE_TOKENIZED, 'german', LINENUMBER)
-    tokenize_file(TGT_FILE, TGT_FILE_TOKENIZED, 'english', LINENUMBER)
+    tokenize_files([(SRC_FILE, SRC_FILE_TOKENIZED, 'german'),
+                    (TGT_FILE, TGT_FILE_TOKENIZED, 'english')],
+                   workers=args.workers, force=args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,20 @@
 
 """Extracts information about specified words from the Giza results."""
 
-from tqdm import tqdm
-
 from abstract_aligner import Aligner
+from checkpoint import (CHECKPOINT_EVERY, add_to_results, count_difference,
+                        load_checkpoint, save_checkpoint)
+from corpus import Shard, progress_bar, shard_offsets
 
 
 class GizaResultsReader():
     """Extracts Giza alignments for given connectors.
 
+    Giza's A3 file consists of records of three lines: a header line
+    ('# Sentence pair (<id>) ...'), the target sentence and the source
+    sentence, where every word is followed by the positions of its
+    aligned target words, e.g. 'NULL ({ 2 }) aber ({ 1 }) ...'.
+
     Attributes:
         src_connectors (set): A set of words for which all alignments are
                               counted.
@@ -22,11 +28,15 @@ class GizaResultsReader():
                 }
 
     """
+    #: How matches are counted, see Aligner.count_backend.
+    count_backend = 'dict'
+
     def __init__(self, src_connectors):
         self.src_connectors = src_connectors
         self.alignments = dict()
 
-    def read_results(self, resultsfile):
+    def read_results(self, resultsfile, workers=1, export='', checkpoint='',
+                     resume='', checkpoint_every=CHECKPOINT_EVERY):
         """Extracts specified alignments from the Giza results.
 
         Finds the results for the words in the set
@@ -34,6 +44,23 @@ class GizaResultsReader():
 
         Args:
             resultsfile (str): Path to file that contains Giza's results.
+            workers (int): Number of processes. If greater than 1, the file
+                           is split into shards of whole records that are
+                           read in parallel.
+            export (str): If given, every alignment of a connector is saved
+                          to this .npz file (see 'load_export').
+            checkpoint (str): If given, the position in the file and the
+                              counts so far are saved to this file every
+                              'checkpoint_every' records (with several
+                              workers after every shard) and at the end.
+                              See checkpoint.py.
+            resume (str): Checkpoint of an interrupted or finished run with
+                          the same connectors. Reading continues at its
+                          position, starting with its counts. If the file
+                          was extended after a finished run, only the
+                          appended records are read. Can't be combined with
+                          'export'.
+            checkpoint_every (int): See 'checkpoint'.
 
         Returns:
             dict: The aligned connectors. Has the form:
@@ -43,39 +70,291 @@ class GizaResultsReader():
                 ...
                 }
 
+        Raises:
+            ValueError: If the file doesn't consist of valid records or the
+                        checkpoint in 'resume' doesn't belong to this run.
+
         """
-        alignments = dict()
-        with open(resultsfile, encoding='utf-8') as results:
-            for line in tqdm(results, desc='Reading Giza results',
-                             total=1908920*3):
-                if line.startswith('#'):
-                    continue
-                elif not line.startswith('NULL'):
-                    english_toks = line.split(' ')
+        if export and resume:
+            raise ValueError('A resumed run can\'t be exported')
+        settings = self._checkpoint_settings()
+        position = Shard(1, None, 0, 0)
+        alignments = Aligner.new_counts(self.count_backend)
+        if resume:
+            position, counts = load_checkpoint(resume, settings,
+                                               (resultsfile,))
+            Aligner.merge_alignments(alignments, counts)
+        if checkpoint:
+            def save_state(position, alignments, complete=False):
+                save_checkpoint(checkpoint, settings, position, alignments,
+                                complete)
+        else:
+            save_state = None
+        if workers > 1:
+            bounds = shard_offsets(resultsfile, workers * 4, line_multiple=3,
+                                   offset=position.src_offset)
+            jobs = []
+            for i, (index, offset) in enumerate(bounds):
+                if i + 1 < len(bounds):
+                    n_lines = bounds[i+1][0] - index
                 else:
-                    tokens = line.split(' ')
-                    i = 0
-                    while i < len(tokens):
-                        if tokens[i] in self.src_connectors:
-                            connector = tokens[i]
-                            # tokens[i+1] is '({'. tokens[i+2] is
-                            # a number or '})' if there is no match.
-                            i += 2
-                            # Join equivalents that consist of
-                            # multiple words to one string.
-                            equivalent_toks = []
-                            while tokens[i].isnumeric():
-                                equivalent_toks.append(
-                                        english_toks[int(tokens[i]) - 1]
-                                        )
-                                i += 1
-                            equivalent = ' '.join(equivalent_toks)
-                            Aligner.note_match(alignments,
-                                               connector,
-                                               equivalent)
-                        i += 1
+                    n_lines = None
+                jobs.append((resultsfile, offset, position.lineno + index,
+                             n_lines, bool(export), False))
+            results = []
+            for i, (shard_alignments, rows, end) in enumerate(
+                    Aligner.iter_parallel(self._read_shard, jobs, workers)):
+                Aligner.merge_alignments(alignments, shard_alignments)
+                results.append(rows)
+                if save_state is not None:
+                    save_state(end, alignments, i + 1 == len(jobs))
+        else:
+            _, rows, _ = self._read_shard(
+                    resultsfile, position.src_offset, position.lineno,
+                    export=bool(export), alignments=alignments,
+                    checkpoint=save_state, checkpoint_every=checkpoint_every)
+            results = [rows]
+        if export:
+            self._save_export(export, results)
         return alignments
 
+    def update(self, resultsfile, results_csv, checkpoint, workers=1):
+        """Reads the records appended since a run and adds them to its
+        results.
+
+        Args:
+            resultsfile (str): Path to file that contains Giza's results.
+            results_csv (str): The results of the run (see
+                               Aligner.result_to_df), updated in-place.
+            checkpoint (str): The final checkpoint of the run (see
+                              'read_results'), replaced by the checkpoint
+                              of the updated run.
+            workers (int): See 'read_results'.
+
+        Returns:
+            pandas.DataFrame: The updated results.
+
+        """
+        _, before = load_checkpoint(checkpoint, self._checkpoint_settings(),
+                                    (resultsfile,))
+        alignments = self.read_results(resultsfile, workers,
+                                       checkpoint=checkpoint,
+                                       resume=checkpoint)
+        return add_to_results(count_difference(alignments, before),
+                              results_csv)
+
+    def _checkpoint_settings(self):
+        """Returns the settings that a checkpoint must match."""
+        return {'aligner': 'GizaResultsReader',
+                'src_connectors': sorted(self.src_connectors)}
+
+    def _read_shard(self, resultsfile, offset=0, lineno=1, n_lines=None,
+                    export=False, progress=True, alignments=None,
+                    checkpoint=None, checkpoint_every=None):
+        """Extracts the alignments from a part of the Giza results.
+
+        Args:
+            resultsfile (str): Path to file that contains Giza's results.
+            offset (int): Byte position of the first line of the part.
+            lineno (int): Line number of the first line.
+            n_lines (int): Number of lines of the part. If None, the file
+                           is read until the end.
+            export (bool): Whether the single alignments are collected.
+            progress (bool): Whether a progress bar is shown.
+            alignments (dict): Counts to which the matches are added. If
+                               None, the counts start empty.
+            checkpoint (callable): If given, called with the position of
+                                   the next record (corpus.Shard) and the
+                                   counts every 'checkpoint_every' records
+                                   and with complete=True at the end.
+            checkpoint_every (int): See 'checkpoint'. If None, only at the
+                                    end.
+
+        Returns:
+            tuple: The aligned connectors (see 'read_results'), if
+                   'export', a dict of arrays (see 'load_export'), else
+                   None, and the position after the part (corpus.Shard).
+
+        """
+        if alignments is None:
+            alignments = Aligner.new_counts(self.count_backend)
+        end = Shard(lineno, None, offset, 0)
+        records = 0
+        connectors = sorted(self.src_connectors)
+        connector_ids = {connector: i
+                         for i, connector in enumerate(connectors)}
+        columns = {'sentence': [], 'connector': [], 'position': [],
+                   'n_targets': [], 'targets': []}
+        pbar = progress_bar(resultsfile, 'Reading Giza results',
+                            disable=not progress, start=end)
+        for record_lineno, size, header, english, null in self._iter_records(
+                resultsfile, offset, lineno, n_lines):
+            english_toks = english.split(' ')
+            for position, connector, targets in self._parse_record(
+                    null, record_lineno):
+                equivalent = ' '.join(english_toks[target - 1]
+                                      for target in targets)
+                Aligner.note_match(alignments, connector, equivalent)
+                if export:
+                    columns['sentence'].append(
+                            self._sentence_id(header, record_lineno))
+                    columns['connector'].append(connector_ids[connector])
+                    columns['position'].append(position)
+                    columns['n_targets'].append(len(targets))
+                    columns['targets'].extend(targets)
+            pbar.update(size)
+            end = Shard(record_lineno + 3, None, end.src_offset + size, 0)
+            records += 1
+            if checkpoint is not None and checkpoint_every \
+                    and records % checkpoint_every == 0:
+                checkpoint(end, alignments)
+        pbar.close()
+        if checkpoint is not None:
+            checkpoint(end, alignments, complete=True)
+        if not export:
+            return alignments, None, end
+        import numpy as np
+        return alignments, {
+            'sentence': self._int_array(columns['sentence'], np.uint32),
+            'connector': self._int_array(columns['connector'], np.uint8),
+            'position': self._int_array(columns['position'], np.uint16),
+            'n_targets': self._int_array(columns['n_targets'], np.uint16),
+            'targets': self._int_array(columns['targets'], np.uint16),
+            'connectors': np.array(connectors, dtype=str),
+            }, end
+
+    @staticmethod
+    def _int_array(values, dtype):
+        """Returns the integers as array of 'dtype' or, if they don't fit,
+        of the smallest integer type that holds them.
+
+        Raises:
+            ValueError: If the integers don't fit in 64 bits.
+
+        """
+        import numpy as np
+        if values:
+            dtype = np.result_type(dtype, np.min_scalar_type(min(values)),
+                                   np.min_scalar_type(max(values)))
+            if dtype.kind not in 'iu':
+                raise ValueError('Giza results contain a number that '
+                                 'doesn\'t fit in 64 bits')
+        return np.array(values, dtype=dtype)
+
+    @staticmethod
+    def _iter_records(resultsfile, offset, lineno, n_lines):
+        """Yields the records of (a part of) the Giza results.
+
+        Yields:
+            tuple: (line number of the header, size in bytes, header,
+                    target sentence, source sentence with alignments)
+
+        Raises:
+            ValueError: If a record is incomplete or has no valid header
+                        or source line.
+
+        """
+        with open(resultsfile, 'rb') as results:
+            results.seek(offset)
+            read = 0
+            while n_lines is None or read < n_lines:
+                lines = [results.readline() for _ in range(3)]
+                read += 3
+                if not lines[0]:
+                    break
+                if not lines[2]:
+                    if b''.join(lines).strip():
+                        raise ValueError(
+                                f'Incomplete record at line {lineno}')
+                    break
+                header, english, null = [line.decode('utf-8')
+                                         for line in lines]
+                if not header.startswith('# Sentence pair ('):
+                    raise ValueError(f'Invalid header at line {lineno}')
+                if not null.startswith('NULL ({'):
+                    raise ValueError(
+                            f'Invalid source line at line {lineno + 2}')
+                yield (lineno, sum(len(line) for line in lines),
+                       header, english, null)
+                lineno += 3
+
+    def _parse_record(self, null, lineno):
+        """Finds the connectors in a source line and their alignments.
+
+        Args:
+            null (str): Source line of a record ('NULL ({ ... }) ...').
+            lineno (int): Line number of the header of the record.
+
+        Yields:
+            tuple: (position, connector, target positions) for every
+                   connector. Positions start at 1, NULL has position 0.
+
+        Raises:
+            ValueError: If the line has an invalid structure.
+
+        """
+        tokens = null.split()
+        position = 0
+        i = 0
+        while i < len(tokens):
+            word = tokens[i]
+            if i + 1 >= len(tokens) or tokens[i+1] != '({':
+                raise ValueError(f'Invalid source line at line {lineno + 2}')
+            i += 2
+            targets = []
+            while i < len(tokens) and tokens[i] != '})':
+                targets.append(int(tokens[i]))
+                i += 1
+            if i == len(tokens):
+                raise ValueError(f'Invalid source line at line {lineno + 2}')
+            i += 1
+            if position > 0 and word in self.src_connectors:
+                yield position, word, targets
+            position += 1
+
+    @staticmethod
+    def _sentence_id(header, lineno):
+        """Returns the id from '# Sentence pair (<id>) ...'."""
+        try:
+            return int(header[len('# Sentence pair ('):header.index(')')])
+        except ValueError:
+            raise ValueError(f'Invalid header at line {lineno}')
+
+    @staticmethod
+    def _save_export(path, parts):
+        """Concatenates the exported arrays of all shards and saves them."""
+        import numpy as np
+        arrays = {'connectors': parts[0]['connectors']}
+        for name in ('sentence', 'connector', 'position', 'n_targets',
+                     'targets'):
+            arrays[name] = np.concatenate([part[name] for part in parts])
+        np.savez_compressed(path, **arrays)
+
+    @staticmethod
+    def load_export(path):
+        """Loads the alignments saved by 'read_results'.
+
+        Args:
+            path (str): Path to the .npz file.
+
+        Returns:
+            dict: Arrays with one entry per aligned connector occurrence:
+                  'sentence' (id of the sentence pair), 'connector' (index
+                  into 'connectors'), 'position' (position of the connector
+                  in the source sentence, starting at 1) and 'n_targets'
+                  (number of aligned target words). 'targets' contains the
+                  target positions (starting at 1) of all occurrences one
+                  after another, 'offsets' the start of every occurrence in
+                  'targets'.
+
+        """
+        import numpy as np
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        arrays['offsets'] = np.concatenate(
+                ([0], np.cumsum(arrays['n_targets'], dtype=np.int64)))
+        return arrays
+
 
 def main():
     obj = GizaResultsReader({'aber', 'doch', 'jedoch',
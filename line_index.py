@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains a line-offset index for corpus files.
+
+The byte offset of every line start is stored next to the file:
+
+    <prefix>.lines.npy   uint64 offset of every line start, plus the size
+                         of the file.
+    <prefix>.lines.json  Size and modification time of the file and
+                         INDEX_VERSION.
+
+The lines end like in corpus.read_lines, at '\\n', '\\r\\n' or a lone '\\r'.
+
+With the index, single lines can be read with one seek instead of reading
+the file from the beginning:
+
+    with LinePairReader('de-en/europarl-v7.de-en.de',
+                        'de-en/europarl-v7.de-en.en') as reader:
+        src_line, tgt_line = reader.pair(1234567)
+        pairs = reader.range(1000, 1100)
+
+The aligners use the index to align a range or a sample of the lines
+(see 'line_shards' and 'iter_token_pairs_at').
+
+"""
+import json
+import os
+from contextlib import ExitStack
+
+import numpy as np
+
+from corpus import Shard, is_tokenized, tokenize_line
+
+
+#: Number of bytes that are searched for line ends at once.
+BLOCK_SIZE = 1 << 24
+
+#: Version of the index format. An index of another version is rebuilt.
+#: Version 2 also ends a line at a lone '\r'.
+INDEX_VERSION = 2
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime,
+            'version': INDEX_VERSION}
+
+
+def build_line_index(path, prefix=None):
+    """Computes the line offsets of a file and saves them.
+
+    Args:
+        path(str): Path to a file.
+        prefix(str): Path prefix of the index files. If None, 'path'.
+
+    Returns:
+        numpy.ndarray: The memory-mapped offsets.
+
+    """
+    if prefix is None:
+        prefix = path
+    parts = [np.zeros(1, dtype=np.uint64)]
+    size = 0
+    carriage_return = False
+    with open(path, 'rb') as file:
+        while True:
+            block = file.read(BLOCK_SIZE)
+            if not block:
+                break
+            data = np.frombuffer(block, dtype=np.uint8)
+            newline = data == 10
+            # A '\r' at the end of the previous block ends a line unless
+            # it is followed by '\n'.
+            if carriage_return and not newline[0]:
+                parts.append(np.array([size], dtype=np.uint64))
+            ends = data == 13
+            ends[:-1] &= ~newline[1:]
+            ends[-1] = False
+            ends |= newline
+            parts.append((np.flatnonzero(ends) + size + 1).astype(np.uint64))
+            carriage_return = block[-1] == 13
+            size += len(block)
+    offsets = np.concatenate(parts)
+    # Last line without line break (or with '\r' at the end).
+    if offsets[-1] != size:
+        offsets = np.append(offsets, np.uint64(size))
+    np.save(prefix + '.lines.npy', offsets)
+    with open(prefix + '.lines.json', 'w', encoding='utf-8') as meta_file:
+        json.dump(_source_stat(path), meta_file)
+    return np.load(prefix + '.lines.npy', mmap_mode='r')
+
+
+def load_line_index(path, prefix=None):
+    """Loads the line index of a file and builds it if needed.
+
+    The index is rebuilt if the file changed since it was built.
+
+    Args:
+        path(str): Path to a file.
+        prefix(str): Path prefix of the index files. If None, 'path'.
+
+    Returns:
+        numpy.ndarray: Byte offset of every line start (memory-mapped),
+                       the last value is the size of the file. Line i
+                       (starting at 0) is offsets[i]:offsets[i+1].
+
+    """
+    if prefix is None:
+        prefix = path
+    try:
+        with open(prefix + '.lines.json', encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+    except (IOError, ValueError):
+        meta = None
+    if meta != _source_stat(path):
+        return build_line_index(path, prefix)
+    return np.load(prefix + '.lines.npy', mmap_mode='r')
+
+
+class LineReader():
+    """Reads lines of a file by line number, using its line index.
+
+    Attributes:
+        path(str): Path to a utf-8 encoded file.
+        offsets(numpy.ndarray): The line index, see 'load_line_index'.
+
+    """
+    def __init__(self, path, offsets=None):
+        if offsets is None:
+            offsets = load_line_index(path)
+        self.path = path
+        self.offsets = offsets
+        self.file = open(path, 'rb')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _check(self, lineno):
+        if not 0 < lineno <= len(self):
+            raise IndexError(f'{self.path} has no line {lineno}')
+
+    def read_bytes(self, lineno):
+        """Returns a line (starting at 1) undecoded, with line break."""
+        self._check(lineno)
+        start = int(self.offsets[lineno-1])
+        self.file.seek(start)
+        return self.file.read(int(self.offsets[lineno]) - start)
+
+    def line(self, lineno):
+        """Returns a line (starting at 1) without line break."""
+        return self.read_bytes(lineno).decode('utf-8').rstrip('\r\n')
+
+    def lines(self, start, stop):
+        """Returns the lines 'start' to 'stop' - 1, read at once.
+
+        Raises:
+            IndexError: If a line is not in the file.
+
+        """
+        if stop <= start:
+            return []
+        self._check(start)
+        self._check(stop - 1)
+        offsets = self.offsets[start-1:stop].tolist()
+        self.file.seek(offsets[0])
+        data = self.file.read(offsets[-1] - offsets[0])
+        base = offsets[0]
+        return [data[begin-base:end-base].decode('utf-8').rstrip('\r\n')
+                for begin, end in zip(offsets, offsets[1:])]
+
+
+class LinePairReader():
+    """Reads line pairs of two parallel files by line number.
+
+    Attributes:
+        src(LineReader): Reader of the source file.
+        tgt(LineReader): Reader of the target file.
+
+    """
+    def __init__(self, src_path, tgt_path):
+        self.src = LineReader(src_path)
+        try:
+            self.tgt = LineReader(tgt_path)
+        except BaseException:
+            self.src.close()
+            raise
+
+    def __len__(self):
+        """Number of line pairs, the length of the shorter file."""
+        return min(len(self.src), len(self.tgt))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.src.close()
+        self.tgt.close()
+
+    def pair(self, lineno):
+        """Returns (src_line, tgt_line) of a line number (starting at 1).
+
+        Raises:
+            IndexError: If the line pair is not in both files.
+
+        """
+        return self.src.line(lineno), self.tgt.line(lineno)
+
+    def pairs(self, line_numbers):
+        """Returns (lineno, src_line, tgt_line) of every line number."""
+        return [(lineno, *self.pair(lineno)) for lineno in line_numbers]
+
+    def range(self, start, stop):
+        """Returns (lineno, src_line, tgt_line) of the lines 'start' to
+        'stop' - 1, with one read per file."""
+        return list(zip(range(start, stop), self.src.lines(start, stop),
+                        self.tgt.lines(start, stop)))
+
+    def shards(self, n_shards, start=1, stop=None):
+        """Splits the lines 'start' to 'stop' - 1 into shards, see
+        'line_shards'."""
+        return _shards(((self.src.offsets, len(self.src)),
+                        (self.tgt.offsets, len(self.tgt))),
+                       range(start, len(self) + 1 if stop is None else stop),
+                       n_shards)
+
+
+def read_line_numbers(path, line_numbers, offsets=None):
+    """Reads single lines of a file.
+
+    Args:
+        path(str): Path to a utf-8 encoded file.
+        line_numbers(iterable of int): Line numbers (starting at 1).
+        offsets(numpy.ndarray): Index from 'load_line_index'. If None, it
+                                is loaded.
+
+    Returns:
+        list of str: The lines without line break, in the order of
+                     'line_numbers'.
+
+    Raises:
+        IndexError: If a line number is not in the file.
+
+    """
+    with LineReader(path, offsets) as reader:
+        return [reader.line(lineno) for lineno in line_numbers]
+
+
+def _index(corpus):
+    """Returns (line index or None, number of lines) of a file or a
+    tokenized corpus."""
+    if is_tokenized(corpus):
+        return None, len(corpus)
+    offsets = load_line_index(corpus)
+    return offsets, len(offsets) - 1
+
+
+def count_line_pairs(src_path, tgt_path):
+    """Returns the number of line pairs (lines of the shorter file).
+
+    Args:
+        src_path(str or TokenizedCorpus): The source file.
+        tgt_path(str or TokenizedCorpus): The target file.
+
+    """
+    return min(_index(src_path)[1], _index(tgt_path)[1])
+
+
+def _shards(indices, lines, n_shards):
+    # See 'line_shards', 'indices' has the result of '_index' of both
+    # files.
+    stop = min(lines.stop, min(n for _, n in indices) + 1)
+    n = stop - lines.start
+    if n <= 0:
+        return []
+    starts = sorted(set(lines.start + n * i // n_shards
+                        for i in range(n_shards)))
+    shards = []
+    for start, end in zip(starts, starts[1:] + [stop]):
+        src_offset, tgt_offset = (0 if offsets is None
+                                  else int(offsets[start-1])
+                                  for offsets, _ in indices)
+        shards.append(Shard(start, end - start, src_offset, tgt_offset))
+    return shards
+
+
+def line_shards(src_path, tgt_path, lines, n_shards=1):
+    """Splits a range of lines of two parallel files into shards.
+
+    The byte offsets of the shards are taken from the line indices, so
+    the files are not read.
+
+    Args:
+        src_path(str or TokenizedCorpus): The source file.
+        tgt_path(str or TokenizedCorpus): The target file.
+        lines(range): Line numbers (starting at 1) with step 1. Lines
+                      after the end of the shorter file are left out.
+        n_shards(int): Number of shards. Small ranges can give less
+                       shards.
+
+    Returns:
+        list of corpus.Shard: Consecutive shards that cover the range.
+
+    Raises:
+        ValueError: If the range has another step than 1 or starts
+                    before line 1.
+
+    """
+    if lines.step != 1 or lines.start < 1:
+        raise ValueError(f'Not a range of line numbers: {lines}')
+    return _shards((_index(src_path), _index(tgt_path)), lines, n_shards)
+
+
+def _line_getter(corpus, stack):
+    """Returns a function that returns a line (starting at 1) of a file
+    (undecoded) or a tokenized corpus (token list)."""
+    if is_tokenized(corpus):
+        def get_line(lineno):
+            if not 0 < lineno <= len(corpus):
+                raise IndexError(f'The corpus has no line {lineno}')
+            return corpus.line_tokens(lineno - 1)
+        return get_line
+    return stack.enter_context(LineReader(corpus)).read_bytes
+
+
+def iter_token_pairs_at(src_path, tgt_path, line_numbers,
+                        tokenize=tokenize_line, src_tokenize=None,
+                        matcher=None, progress=None):
+    """Like corpus.iter_token_pairs, but yields the given lines.
+
+    Every line pair is read with one seek per file, in the order of
+    'line_numbers'.
+
+    Args:
+        src_path(str or TokenizedCorpus): The source file.
+        tgt_path(str or TokenizedCorpus): The target file.
+        line_numbers(iterable of int): Line numbers (starting at 1).
+        tokenize, src_tokenize: See corpus.iter_token_pairs.
+        matcher(prefilter.KeywordMatcher): If given, only the pairs whose
+                                           source line can contain a
+                                           keyword are yielded.
+        progress(callable): If given, called with 1 for every line pair.
+
+    Yields:
+        tuple: (lineno, src_tokens, tgt_tokens)
+
+    Raises:
+        IndexError: If a line pair is not in both files.
+
+    """
+    if src_tokenize is None:
+        src_tokenize = tokenize
+    with ExitStack() as stack:
+        src_line = _line_getter(src_path, stack)
+        tgt_line = _line_getter(tgt_path, stack)
+        for lineno in line_numbers:
+            src = src_line(lineno)
+            tgt = tgt_line(lineno)
+            if progress is not None:
+                progress(1)
+            if matcher is not None and not matcher.matches(src):
+                continue
+            if type(src) is bytes:
+                src = src_tokenize(src.decode('utf-8'))
+            if type(tgt) is bytes:
+                tgt = tokenize(tgt.decode('utf-8'))
+            yield lineno, src, tgt
+
+
+def split_lines(lines, n_parts):
+    """Splits a range or a sample of line numbers into consecutive parts.
+
+    Returns:
+        list: Non-empty ranges or lists of line numbers.
+
+    """
+    lines = lines if isinstance(lines, range) else list(lines)
+    bounds = sorted(set(len(lines) * i // n_parts for i in range(n_parts)))
+    return [lines[start:stop]
+            for start, stop in zip(bounds, bounds[1:] + [len(lines)])
+            if stop > start]
@@ -8,11 +8,16 @@ connectors using their distance in the parallel sentences.
 
 """
 import logging
-
-from tqdm import tqdm
+import os
+from functools import partial
 
 from abstract_aligner import Aligner
-from split_text import token_split
+from checkpoint import (CHECKPOINT_EVERY, add_to_results, count_difference,
+                        load_checkpoint, save_checkpoint)
+from corpus import (Shard, iter_token_pairs, make_shards, progress_bar,
+                    tokenize_line)
+from pipeline import iter_chunk_pairs, run_pipeline
+from prefilter import KeywordMatcher, iter_candidate_pairs
 
 
 class ListAligner(Aligner):
@@ -20,29 +25,400 @@ class ListAligner(Aligner):
         self.src_connectors = src_connectors
         self.tgt_connectors = tgt_connectors
 
-    def align(self, src_path, tgt_path, frame=33, start=-16, max_window=None):
+    def align(self, src_path, tgt_path, frame=33, start=-16, max_window=None,
+              *, engine='phrase', workers=1, checkpoint='', resume='',
+              checkpoint_every=CHECKPOINT_EVERY, pipeline=False, export='',
+              prefilter=True, lines=None):
         """Aims to align the connectors from two text files.
 
         Args:
             src_path(str): Path to the file in the source language (the
-                           same as self.connectors).
+                           same as self.connectors). Can also be a
+                           token_cache.TokenizedCorpus of the file.
             tgt_path(str): Path to the target file, where we're trying to
                            find equivalents of the connectors in the source
-                           file.
+                           file. Can also be a token_cache.TokenizedCorpus.
             frame(int): Size of the frame in which an equivalent in searched.
             start(int): A negative value that states the position of the first
                         token in the frame relative to the source connector.
             max_window(int): Maximum connector length that is searched for. If
                              None, the maximum length is computed from
                              'self.tgt_connectors'.
+            engine(str): 'phrase' finds all target connectors of a sentence
+                         in one pass over a precompiled phrase index (see
+                         '_compile_phrase_index'). 'window' uses
+                         '_search_equivalent'. Both give the same results.
+            workers(int): Number of processes. If greater than 1, the files
+                          are split into shards that are aligned in
+                          parallel. The result and the log are the same as
+                          with one process.
+            checkpoint(str): If given, the position in both files and the
+                             counts so far are saved to this file every
+                             'checkpoint_every' lines (with several workers
+                             after every shard) and at the end. See
+                             checkpoint.py.
+            resume(str): Checkpoint of an interrupted or finished run with
+                         the same settings. The alignment continues at its
+                         position, starting with its counts. If the files
+                         were extended after a finished run, only the
+                         appended lines are aligned.
+            checkpoint_every(int): See 'checkpoint'.
+            pipeline(bool): If True, a reader thread reads the files in
+                            chunks, which 'workers' processes align (see
+                            pipeline.py). The files can be .gz or .xz
+                            compressed. Can't be combined with checkpoints.
+            export(str): If given, every aligned connector occurrence is
+                         saved to this .npz file, indexed by connector and
+                         equivalent (see occurrences.OccurrenceIndex). Can't
+                         be combined with 'resume'.
+            prefilter(bool): If True, only the line pairs whose source line
+                             can contain a source connector are tokenized
+                             (see prefilter.py). Gives the same results.
+            lines(range or iterable of int): If given, only these lines
+                                             are aligned (line numbers
+                                             starting at 1). A range with
+                                             step 1 is read like a shard,
+                                             other line numbers are read
+                                             one by one in their order with
+                                             the line index of the files
+                                             (see line_index.py). Can't be
+                                             combined with checkpoints or
+                                             the pipeline mode.
+
+        Raises:
+            ValueError: If the engine is unknown, the checkpoint in
+                        'resume' doesn't belong to this run, checkpoints
+                        are used in pipeline mode or with 'lines' or a
+                        resumed run is exported.
+            IndexError: If a line of 'lines' (not a range) is not in both
+                        files.
 
         """
         if not max_window:
             max_window = self._compute_maxwindow()
-        return self.__list_align(
-                src_path, tgt_path,
-                frame, start, max_window
-                )
+        if engine not in ('phrase', 'window'):
+            raise ValueError(f'Unknown engine: {engine}')
+        if pipeline and (checkpoint or resume):
+            raise ValueError('Checkpoints are not supported in pipeline mode')
+        if lines is not None and (pipeline or checkpoint or resume):
+            raise ValueError('A line range or sample can\'t be aligned with '
+                             'checkpoints or in pipeline mode')
+        if export and resume:
+            raise ValueError('A resumed run can\'t be exported')
+        occurrences = self._new_occurrences(export)
+        matcher = KeywordMatcher(self.src_connectors) if prefilter else None
+        self._start_profile()
+        settings = self._checkpoint_settings(frame, start, max_window)
+        position = None
+        alignments = self.new_counts(self.count_backend)
+        if resume:
+            position, counts = load_checkpoint(resume, settings,
+                                               (src_path, tgt_path))
+            self.merge_alignments(alignments, counts)
+        if checkpoint:
+            def save_state(position, alignments, complete=False):
+                save_checkpoint(checkpoint, settings, position, alignments,
+                                complete)
+        else:
+            save_state = None
+        shard_profilers = []
+        if workers > 1 or pipeline:
+            if pipeline:
+                shards = None
+                results = run_pipeline(
+                        partial(self._align_chunk, frame, start, max_window,
+                                engine, bool(export), matcher),
+                        src_path, tgt_path, workers
+                        )
+            else:
+                if lines is None:
+                    parts = [(shard, None) for shard in make_shards(
+                            src_path, tgt_path, workers * 4, position)]
+                else:
+                    parts = self._line_parts(src_path, tgt_path, lines,
+                                             workers * 4)
+                shards = [shard for shard, _ in parts]
+                results = self.iter_parallel(
+                        self._align_shard,
+                        [(src_path, tgt_path, frame, start, max_window,
+                          engine, shard, bool(checkpoint), bool(export),
+                          matcher, sample)
+                         for shard, sample in parts],
+                        workers
+                        )
+            for i, (shard_alignments, no_matches, end, profiler,
+                    shard_occurrences) in enumerate(results):
+                self.merge_alignments(alignments, shard_alignments)
+                if shard_occurrences is not None:
+                    occurrences.merge(shard_occurrences)
+                for lineno, token in no_matches:
+                    logging.info(f'No match: Line {lineno} ({token})')
+                if profiler is not None:
+                    shard_profilers.append(profiler)
+                if save_state is not None:
+                    save_state(end, alignments, i + 1 == len(shards))
+        else:
+            if lines is None:
+                parts = [(position, None)]
+            else:
+                parts = self._line_parts(src_path, tgt_path, lines, 1)
+            for shard, sample in parts:
+                alignments = self.__list_align(
+                        src_path, tgt_path,
+                        frame, start, max_window, engine,
+                        shard, alignments=alignments,
+                        checkpoint=save_state,
+                        checkpoint_every=checkpoint_every,
+                        occurrences=occurrences, matcher=matcher,
+                        sample=sample
+                        )
+        if export:
+            with self.timed('export'):
+                occurrences.save(export)
+        self._end_profile(alignments, shard_profilers)
+        return alignments
+
+    def update(self, src_path, tgt_path, results_csv, checkpoint, frame=33,
+               start=-16, max_window=None, engine='phrase', workers=1):
+        """Aligns the lines appended since a run and adds them to its results.
+
+        Args:
+            src_path(str): See 'align'.
+            tgt_path(str): See 'align'.
+            results_csv(str): The results of the run (see 'result_to_df'),
+                              updated in-place.
+            checkpoint(str): The final checkpoint of the run (see 'align'),
+                             replaced by the checkpoint of the updated run.
+            frame, start, max_window, engine, workers: See 'align', must be
+                                                      the same as in the run.
+
+        Returns:
+            pandas.DataFrame: The updated results.
+
+        """
+        if not max_window:
+            max_window = self._compute_maxwindow()
+        settings = self._checkpoint_settings(frame, start, max_window)
+        _, before = load_checkpoint(checkpoint, settings,
+                                    (src_path, tgt_path))
+        alignments = self.align(src_path, tgt_path, frame, start, max_window,
+                                engine=engine, workers=workers,
+                                checkpoint=checkpoint, resume=checkpoint)
+        with self.timed('export'):
+            return add_to_results(count_difference(alignments, before),
+                                  results_csv)
+
+    def _checkpoint_settings(self, frame, start, max_window):
+        """Returns the settings that a checkpoint must match."""
+        return {'aligner': type(self).__name__,
+                'src_connectors': sorted(self.src_connectors),
+                'tgt_connectors': sorted(self.tgt_connectors),
+                'frame': frame, 'start': start, 'max_window': max_window}
+
+    def _align_shard(self, src_path, tgt_path, frame, start, max_window,
+                     engine, shard, track=False, export=False, matcher=None,
+                     sample=None):
+        """Aligns a part of the files (see corpus.Shard).
+
+        Args:
+            track(bool): Whether the end position is returned.
+            export(bool): Whether the occurrences are collected.
+            matcher(prefilter.KeywordMatcher): See '__list_align'.
+            sample(list of int): See '__list_align'.
+
+        Returns:
+            tuple: The alignments, a list of (lineno, connector) for every
+                   connector without match, so that the parent process can
+                   log them in order, the position after the last aligned
+                   line (corpus.Shard, None if not 'track'), the profiler
+                   of the worker (None if profiling is disabled) and the
+                   occurrences (occurrences.Occurrences, None if not
+                   'export').
+
+        """
+        no_matches = []
+        occurrences = self._new_occurrences(export)
+        ends = []
+        if track:
+            def checkpoint(position, alignments, complete=False):
+                ends.append(position)
+        else:
+            checkpoint = None
+        alignments = self.__list_align(src_path, tgt_path, frame, start,
+                                       max_window, engine, shard, no_matches,
+                                       checkpoint=checkpoint, progress=False,
+                                       occurrences=occurrences,
+                                       matcher=matcher, sample=sample)
+        return (alignments, no_matches, ends[-1] if ends else None,
+                self.profiler, occurrences)
+
+    def _align_chunk(self, frame, start, max_window, engine, export, matcher,
+                     chunk):
+        """Aligns a chunk of line pairs (see pipeline.read_chunks).
+
+        Returns:
+            tuple: Like '_align_shard', without end position.
+
+        """
+        no_matches = []
+        occurrences = self._new_occurrences(export)
+        alignments = self.__list_align(None, None, frame, start, max_window,
+                                       engine, no_matches=no_matches,
+                                       progress=False, chunk=chunk,
+                                       occurrences=occurrences,
+                                       matcher=matcher)
+        return alignments, no_matches, None, self.profiler, occurrences
+
+    def sweep(self, src_path, tgt_path, settings, save_dir='', workers=1,
+              prefilter=True):
+        """Aligns the files with several settings in a single pass.
+
+        For every source connector the target connectors of the sentence
+        are ranked once. The equivalent for every setting is the first
+        ranked connector that lies in its frame. Unmatched connectors are
+        not logged.
+
+        Args:
+            src_path(str): See 'align'.
+            tgt_path(str): See 'align'.
+            settings(list of tuple): (frame, start, max_window) for every
+                                     setting, see 'align'.
+            save_dir(str): If given, the result of every setting is saved to
+                           '<save_dir>/list_<frame>_minus<-start>.csv' (with
+                           '_window<max_window>' if max_window is not None).
+            workers(int): Number of processes, see 'align'.
+            prefilter(bool): See 'align'.
+
+        Returns:
+            dict: (frame, start, max_window) as keys and the results
+                  (pandas.DataFrame) as values.
+
+        """
+        resolved = [(frame, start, max_window or self._compute_maxwindow())
+                    for frame, start, max_window in settings]
+        matcher = KeywordMatcher(self.src_connectors) if prefilter else None
+        if workers > 1:
+            shards = make_shards(src_path, tgt_path, workers * 4)
+            results = [self.new_counts(self.count_backend)
+                       for _ in resolved]
+            for shard_results in self.run_parallel(
+                    self._sweep_shard,
+                    [(src_path, tgt_path, resolved, shard, matcher)
+                     for shard in shards],
+                    workers):
+                for alignments, shard_alignments in zip(results,
+                                                        shard_results):
+                    self.merge_alignments(alignments, shard_alignments)
+        else:
+            results = self._sweep_shard(src_path, tgt_path, resolved,
+                                        matcher=matcher)
+        dfs = dict()
+        for (frame, start, max_window), alignments in zip(settings, results):
+            save = ''
+            if save_dir:
+                if start <= 0:
+                    name = f'list_{frame}_minus{-start}'
+                else:
+                    name = f'list_{frame}_plus{start}'
+                if max_window is not None:
+                    name += f'_window{max_window}'
+                save = os.path.join(save_dir, name + '.csv')
+            key = (frame, start, max_window)
+            with self.timed('export'):
+                dfs[key] = self.result_to_df(alignments, save=save)
+        return dfs
+
+    def _sweep_shard(self, src_path, tgt_path, settings, shard=None,
+                     matcher=None):
+        """Aligns (a part of) the files with several settings.
+
+        Args:
+            settings(list of tuple): (frame, start, max_window) for every
+                                     setting, max_window must not be None.
+            shard(corpus.Shard): see '__list_align'.
+            matcher(prefilter.KeywordMatcher): see '__list_align'.
+
+        Returns:
+            list of dict: The aligned connectors for every setting.
+
+        """
+        results = [self.new_counts(self.count_backend)
+                   for _ in settings]
+        index = self._compile_phrase_index()
+        max_window = max(setting[2] for setting in settings)
+        pbar = progress_bar(src_path, 'Matching connectors',
+                            disable=shard is not None)
+        if matcher is None:
+            pairs = iter_token_pairs(src_path, tgt_path, shard, pbar.update,
+                                     src_tokenize=self._source_tokenizer())
+        else:
+            pairs = iter_candidate_pairs(
+                    src_path, tgt_path, matcher, shard, pbar.update,
+                    src_tokenize=self._source_tokenizer()
+                    )
+        for _, src_tokens, tgt_tokens in pairs:
+            phrases = None
+            for token_id, token in enumerate(src_tokens):
+                if token in self.src_connectors:
+                    if phrases is None:
+                        phrases = self._find_phrases(tgt_tokens, index,
+                                                     max_window)
+                    ranking = self._rank_phrases(phrases, token_id)
+                    for alignments, (frame, start, window) in zip(results,
+                                                                  settings):
+                        equivalent = self._pick_ranked(
+                                ranking, len(tgt_tokens), token_id,
+                                frame, start, window
+                                )
+                        self.note_match(alignments, token, equivalent)
+        pbar.close()
+        return results
+
+    def align_pair(self, src_line, tgt_line, frame=33, start=-16,
+                   max_window=None):
+        """Aligns the connectors of one sentence pair.
+
+        The equivalents are the same as with 'align' for this line pair.
+
+        Args:
+            src_line(str): The sentence in the source language.
+            tgt_line(str): The sentence in the target language.
+            frame, start, max_window: See 'align'.
+
+        Returns:
+            list of tuple: (position, connector, equivalent, target) for
+                           every source connector. 'position' and 'target'
+                           are token indices in the source and target
+                           sentence, 'target' is -1 and 'equivalent' an
+                           empty string if no equivalent is found.
+
+        """
+        if not max_window:
+            max_window = self._compute_maxwindow()
+        src_tokens = self._source_tokenizer()(src_line)
+        tgt_tokens = tokenize_line(tgt_line)
+        phrases = self._find_phrases(tgt_tokens, self._compile_phrase_index(),
+                                     max_window)
+        matches = []
+        for token_id, token in enumerate(src_tokens):
+            if token not in self.src_connectors:
+                continue
+            occurrence = self._nearest_occurrence(
+                    phrases, len(tgt_tokens), token_id, frame, start)
+            if occurrence is None:
+                matches.append((token_id, token, '', -1))
+            else:
+                matches.append((token_id, token, occurrence[2],
+                                occurrence[0]))
+        return matches
+
+    def _source_tokenizer(self):
+        """Returns the function that tokenizes the source lines.
+
+        Subclasses can mark source tokens here, a token that is not in
+        'self.src_connectors' is skipped before the search.
+        """
+        return tokenize_line
 
     def _compute_maxwindow(self):
         """Computes the maximum target connector length."""
@@ -53,7 +429,141 @@ class ListAligner(Aligner):
                 max_window = window
         return max_window
 
-    def __list_align(self, src_path, tgt_path, frame, start, max_window):
+    def _compile_phrase_index(self):
+        """Compiles 'self.tgt_connectors' into a token-level trie.
+
+        Every node is a dict that maps the next token to its child node.
+        The key None holds the connector that ends at this node.
+
+        Returns:
+            dict: The root node of the trie.
+
+        """
+        root = dict()
+        for connector in self.tgt_connectors:
+            node = root
+            for token in connector.split(' '):
+                node = node.setdefault(token, dict())
+            node[None] = connector
+        return root
+
+    @staticmethod
+    def _find_phrases(tokens, index, max_window):
+        """Finds all target connectors in a token list.
+
+        Args:
+            tokens(list): A tokenized sentence.
+            index(dict): Trie from '_compile_phrase_index'.
+            max_window(int): Maximum connector length that is searched for.
+
+        Returns:
+            list of tuple: (begin, end, connector) for every occurrence,
+                           'end' is exclusive.
+
+        """
+        phrases = []
+        sent_length = len(tokens)
+        for begin in range(sent_length):
+            node = index
+            for end in range(begin, min(begin + max_window, sent_length)):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                if None in node:
+                    phrases.append((begin, end + 1, node[None]))
+        return phrases
+
+    @staticmethod
+    def _nearest_phrase(phrases, sent_length, entry, frame, start):
+        """Picks the equivalent that '_search_equivalent' would return.
+
+        '_search_equivalent' tries shorter connectors first. For the same
+        length it alternates between the end positions right of 'entry'
+        (entry+1, entry+2, ...) and left of it (entry, entry-1, ...),
+        starting on the right. This order is reproduced as a sort key.
+
+        Args:
+            phrases(list): Occurrences from '_find_phrases'.
+            sent_length(int): Number of tokens in the target sentence.
+            entry(int): Index of the connector from the source sentence.
+            frame(int): Size of the frame in which an equivalent is searched.
+            start(int): A negative value that states the position of the first
+                        token in the frame relative to 'entry'.
+
+        Returns:
+            str: The found equivalent. If no equivalent is found, empty string.
+
+        """
+        occurrence = ListAligner._nearest_occurrence(phrases, sent_length,
+                                                     entry, frame, start)
+        if occurrence is None:
+            return ''
+        return occurrence[2]
+
+    @staticmethod
+    def _nearest_occurrence(phrases, sent_length, entry, frame, start):
+        """Like '_nearest_phrase', but returns (begin, end, connector) of the
+        occurrence, None if no equivalent is found."""
+        first = max(entry + start, 0)
+        last = min(entry + start + frame, sent_length)
+        best = None
+        best_key = None
+        for begin, end, connector in phrases:
+            if begin < first or end > last:
+                continue
+            if not -frame < end - entry < frame:
+                continue
+            key = ListAligner._rank_key(begin, end, entry)
+            if best_key is None or key < best_key:
+                best = (begin, end, connector)
+                best_key = key
+        return best
+
+    @staticmethod
+    def _rank_key(begin, end, entry):
+        """Sort key of an occurrence in the search order of '_nearest_phrase'.
+        """
+        distance = end - entry
+        if distance > 0:
+            return (end - begin, distance, 0)
+        return (end - begin, 1 - distance, 1)
+
+    @staticmethod
+    def _rank_phrases(phrases, entry):
+        """Sorts occurrences from '_find_phrases' by the search order.
+
+        Returns:
+            list of tuple: (begin, end, connector) of every occurrence.
+
+        """
+        return sorted(
+                phrases,
+                key=lambda phrase: ListAligner._rank_key(phrase[0], phrase[1],
+                                                         entry)
+                )
+
+    @staticmethod
+    def _pick_ranked(ranking, sent_length, entry, frame, start, max_window):
+        """Like '_nearest_phrase', but for occurrences from '_rank_phrases'.
+
+        Returns:
+            str: The first occurrence that lies in the frame and is not
+                 longer than 'max_window'. If none, empty string.
+
+        """
+        first = max(entry + start, 0)
+        last = min(entry + start + frame, sent_length)
+        for begin, end, connector in ranking:
+            if (begin >= first and end <= last and end - begin <= max_window
+                    and -frame < end - entry < frame):
+                return connector
+        return ''
+
+    def __list_align(self, src_path, tgt_path, frame, start, max_window,
+                     engine, shard=None, no_matches=None, alignments=None,
+                     checkpoint=None, checkpoint_every=None, progress=True,
+                     chunk=None, occurrences=None, matcher=None,
+                     sample=None):
         """Uses a list of target connectors to align the source connectors.
 
         Args:
@@ -66,6 +576,33 @@ class ListAligner(Aligner):
             start(int): A negative value that states the position of the first
                         token in the frame relative to the source connector.
             max_window(int): Maximum connector length that is searched for.
+            engine(str): See 'align'.
+            shard(corpus.Shard): Part of the files that is aligned. If
+                                 None, the files are aligned completely.
+            no_matches(list): If given, connectors without match are
+                              appended as (lineno, connector) instead of
+                              being logged.
+            alignments(dict): Counts to which the matches are added. If
+                              None, the counts start empty.
+            checkpoint(callable): If given, called with the position of the
+                                  next line (corpus.Shard) and the counts
+                                  every 'checkpoint_every' lines and with
+                                  complete=True at the end.
+            checkpoint_every(int): See 'checkpoint'. If None, only at the
+                                   end.
+            progress(bool): Whether a progress bar is shown.
+            chunk(tuple): If given, the line pairs of this chunk (see
+                          pipeline.read_chunks) are aligned instead of the
+                          files.
+            occurrences(occurrences.Occurrences): If given, every aligned
+                                                  connector is added.
+            matcher(prefilter.KeywordMatcher): If given, the line pairs
+                                               without source connector
+                                               are skipped before they are
+                                               tokenized.
+            sample(list of int): If given, these line numbers are aligned
+                                 instead of the shard (see
+                                 line_index.iter_token_pairs_at).
 
         Returns:
             dict: The aligned connectors. Has the form:
@@ -76,35 +613,111 @@ class ListAligner(Aligner):
                 }
 
         """
-        alignments = dict()
-        with open(src_path, encoding='utf-8') as src_file, \
-             open(tgt_path, encoding='utf-8') as tgt_file:
-            lineno = 1
-            pbar = tqdm(total=1920209, desc='Matching connectors')
-            while True:
-                try:
-                    src_line = next(src_file).casefold()
-                    tgt_line = next(tgt_file).casefold()
-                except StopIteration:
-                    break
-                src_tokens = token_split(src_line)
-                tgt_tokens = token_split(tgt_line)
-                token_id = 0
-                # It may happen that a target connector is matched twice.
-                for token in src_tokens:
-                    if token in self.src_connectors:
-                        equivalent = self._search_equivalent(
+        if alignments is None:
+            alignments = self.new_counts(self.count_backend)
+        if shard is None:
+            shard = Shard(1, None, 0, 0)
+        if engine == 'phrase' or occurrences is not None:
+            index = self._compile_phrase_index()
+        # Timed versions if profiling is enabled.
+        search_equivalent = self._instrument('search',
+                                             self._search_equivalent)
+        find_phrases = self._instrument('search', self._find_phrases)
+        nearest_phrase = self._instrument('search', self._nearest_phrase)
+        note_match = self._instrument('note_match', self.note_match)
+        if self.profiler is not None:
+            count = self.profiler.count
+            timed_nearest = nearest_phrase
+
+            def nearest_phrase(phrases, *args):
+                # Every occurrence of a target connector is a search step.
+                count('search_steps', len(phrases))
+                return timed_nearest(phrases, *args)
+        tokenize = self._instrument('tokenize', tokenize_line)
+        src_tokenize = self._instrument('tokenize', self._source_tokenizer())
+        # Byte positions after the current line, only tracked for
+        # checkpoints.
+        offsets = None if checkpoint is None else []
+        # Line number of the next checkpoint, -1 if none.
+        next_checkpoint = -1
+        if checkpoint is not None and checkpoint_every:
+            next_checkpoint = shard.lineno - 1 + checkpoint_every
+        if sample is not None:
+            from line_index import iter_token_pairs_at
+            pbar = progress_bar(src_path, 'Matching connectors',
+                                disable=not progress, lines=len(sample))
+            pairs = iter_token_pairs_at(src_path, tgt_path, sample, tokenize,
+                                        src_tokenize, matcher, pbar.update)
+        elif chunk is None:
+            pbar = progress_bar(src_path, 'Matching connectors',
+                                disable=not progress, start=shard)
+            if matcher is None:
+                pairs = iter_token_pairs(src_path, tgt_path, shard,
+                                         pbar.update, tokenize, offsets,
+                                         src_tokenize)
+            else:
+                pairs = iter_candidate_pairs(src_path, tgt_path, matcher,
+                                             shard, pbar.update, tokenize,
+                                             offsets, src_tokenize)
+        else:
+            pbar = None
+            pairs = iter_chunk_pairs(chunk, tokenize, src_tokenize, matcher)
+        lineno = shard.lineno - 1
+        for lineno, src_tokens, tgt_tokens in self._instrument_iter('read',
+                                                                    pairs):
+            token_id = 0
+            phrases = None
+            # It may happen that a target connector is matched twice.
+            for token in src_tokens:
+                if token in self.src_connectors:
+                    if engine == 'window':
+                        equivalent = search_equivalent(
                                 tgt_tokens, token_id,
                                 frame, start, max_window
                                 )
-                        # Add equivalent to alignments.
-                        self.note_match(alignments, token, equivalent)
-                        if not equivalent:
+                    else:
+                        # Target connectors are only searched once
+                        # per sentence.
+                        if phrases is None:
+                            phrases = find_phrases(
+                                    tgt_tokens, index, max_window
+                                    )
+                        equivalent = nearest_phrase(
+                                phrases, len(tgt_tokens), token_id,
+                                frame, start
+                                )
+                    # Add equivalent to alignments.
+                    note_match(alignments, token, equivalent)
+                    if occurrences is not None:
+                        if phrases is None:
+                            phrases = self._find_phrases(
+                                    tgt_tokens, index, max_window
+                                    )
+                        occurrence = self._nearest_occurrence(
+                                phrases, len(tgt_tokens), token_id,
+                                frame, start
+                                )
+                        occurrences.add(
+                                lineno, token_id, token, equivalent,
+                                -1 if occurrence is None else occurrence[0]
+                                )
+                    if not equivalent:
+                        if no_matches is None:
                             logging.info(f'No match: Line {lineno} ({token})')
-                    token_id += 1
-                lineno += 1
-                pbar.update(1)
+                        else:
+                            no_matches.append((lineno, token))
+                token_id += 1
+            # The prefilter may skip the line of a checkpoint, then the
+            # checkpoint is saved after the next line pair.
+            if 0 <= next_checkpoint <= lineno:
+                checkpoint(Shard(lineno + 1, None, *offsets), alignments)
+                while next_checkpoint <= lineno:
+                    next_checkpoint += checkpoint_every
+        if pbar is not None:
             pbar.close()
+        if checkpoint is not None:
+            checkpoint(Shard(lineno + 1, None, *offsets), alignments,
+                       complete=True)
         return alignments
 
     def _search_equivalent(self, tokens, entry, frame, start, max_window):
@@ -115,7 +728,7 @@ class ListAligner(Aligner):
         two-word connectors etc.
 
         Args:
-            tokens(list): A tokenized sentence.
+            tokens(list): A tokenized, casefolded sentence.
             entry(int): Index of the connector from the source sentence.
             frame(int): Size of the frame in which an equivalent is searched.
             start(int): A negative value that states the position of the first
@@ -153,9 +766,7 @@ class ListAligner(Aligner):
                     else:
                         if entry + b <= last:
                             if entry + b + a >= first:
-                                snip = ' '.join(
-                                        tokens[entry+b+a:entry+b]
-                                        ).casefold()
+                                snip = ' '.join(tokens[entry+b+a:entry+b])
                                 if snip in self.tgt_connectors:
                                     return snip
                         else:
@@ -170,9 +781,7 @@ class ListAligner(Aligner):
                     else:
                         if entry + b + a >= first:
                             if entry + b <= last:
-                                snip = ' '.join(
-                                        tokens[entry+b+a:entry+b]
-                                        ).casefold()
+                                snip = ' '.join(tokens[entry+b+a:entry+b])
                                 if snip in self.tgt_connectors:
                                     return snip
                         else:
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains a statistical alignment approach (IBM Model 1).
+
+A lexical translation model t(target word | source word) is trained with
+expectation maximization, like the first training step of Giza++. Only
+the sentence pairs with a source connector are used, which makes the
+model small and the training fast. Every target word is then aligned to
+its most probable source word (or to NULL), and the target words aligned
+to a connector are its equivalent, as in the Giza results (see
+giza_results.py).
+
+Optionally, the alignment prefers source words at the same relative
+position as the target word ('diagonal', see Dyer et al. 2013, "A
+Simple, Fast, and Effective Reparameterization of IBM Model 2"), which
+gives most of the improvement of the HMM model of Giza++.
+
+"""
+import os
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+from abstract_aligner import Aligner
+from corpus import iter_token_pairs, progress_bar, tokenize_line
+
+
+#: Maximum number of (source token, target token) pairs that are
+#: processed at once. Limits the memory of the training.
+BLOCK_PAIRS = 1 << 22
+
+#: Maximum number of token pairs whose word pair indices are kept between
+#: the EM iterations (4 bytes each) instead of being looked up again.
+CACHE_PAIRS = 1 << 26
+
+#: The sentence pairs with a source connector as token IDs. The source
+#: sentences start with NULL (ID 0). The tokens of sentence i are
+#: 'src_ids[src_offsets[i]:src_offsets[i+1]]', the same for the target.
+Bitext = namedtuple('Bitext', ['src_ids', 'src_offsets', 'src_vocab',
+                               'tgt_ids', 'tgt_offsets', 'tgt_vocab'])
+
+
+class Model1Aligner(Aligner):
+    """Aligns the connectors with a trained IBM Model 1.
+
+    Attributes:
+        connectors(set): The source connectors.
+        iterations(int): Number of EM iterations.
+        diagonal(float): How strongly the alignment prefers source words
+                         at the same relative position as the target
+                         word. 0 is the plain IBM Model 1.
+        null_prob(float): Probability of an alignment to NULL if
+                          'diagonal' is used.
+
+    """
+    def __init__(self, connectors, iterations=5, diagonal=0.0,
+                 null_prob=0.08):
+        self.connectors = connectors
+        self.iterations = iterations
+        self.diagonal = diagonal
+        self.null_prob = null_prob
+
+    def align(self, src_path, tgt_path, block_pairs=BLOCK_PAIRS):
+        """Trains the model and aligns the connectors from two text files.
+
+        Args:
+            src_path(str): Path to the file in the source language (the
+                           same as self.connectors). Can also be a
+                           token_cache.TokenizedCorpus of the file.
+            tgt_path(str): Path to the target file. Can also be a
+                           token_cache.TokenizedCorpus.
+            block_pairs(int): See 'BLOCK_PAIRS'.
+
+        Returns:
+            dict: The aligned connectors, like
+                  GizaResultsReader.read_results. Has the form:
+                {<source_connector1>: {
+                        <target_connector1>: <number_of_matches>,
+                        ...}
+                ...
+                }
+                  The equivalent of a connector is made up of all target
+                  words aligned to it, '' if there is none.
+
+        """
+        self._start_profile()
+        bitext = self.read_bitext(src_path, tgt_path)
+        blocks = self._blocks(bitext, block_pairs)
+        with self.timed('train'):
+            keys, probs = self.train(bitext, blocks)
+        with self.timed('align'):
+            alignments = self.new_counts(self.count_backend)
+            flags = np.fromiter(map(set(self.connectors).__contains__,
+                                    bitext.src_vocab), bool,
+                                len(bitext.src_vocab))
+            for first, last in blocks:
+                self._align_block(bitext, first, last, keys, probs, flags,
+                                  alignments)
+        self._end_profile(alignments)
+        return alignments
+
+    def read_bitext(self, src_path, tgt_path):
+        """Reads the sentence pairs that contain a source connector.
+
+        Args:
+            src_path(str): See 'align'.
+            tgt_path(str): See 'align'.
+
+        Returns:
+            Bitext: The sentence pairs as token IDs.
+
+        """
+        connectors = set(self.connectors)
+        src_index, src_vocab = {'': 0}, ['']
+        tgt_index, tgt_vocab = dict(), []
+        src_ids, tgt_ids = array('I'), array('I')
+        src_offsets, tgt_offsets = array('q', [0]), array('q', [0])
+        tokenize = self._instrument('tokenize', tokenize_line)
+        pbar = progress_bar(src_path, 'Reading sentences')
+        pairs = iter_token_pairs(src_path, tgt_path, progress=pbar.update,
+                                 tokenize=tokenize)
+        for _, src_tokens, tgt_tokens in self._instrument_iter('read', pairs):
+            if connectors.isdisjoint(src_tokens):
+                continue
+            # NULL
+            src_ids.append(0)
+            for tokens, index, vocab, ids in (
+                    (src_tokens, src_index, src_vocab, src_ids),
+                    (tgt_tokens, tgt_index, tgt_vocab, tgt_ids)):
+                for token in tokens:
+                    token_id = index.get(token)
+                    if token_id is None:
+                        token_id = index[token] = len(vocab)
+                        vocab.append(token)
+                    ids.append(token_id)
+            src_offsets.append(len(src_ids))
+            tgt_offsets.append(len(tgt_ids))
+        pbar.close()
+        return Bitext(np.frombuffer(src_ids, dtype=np.uint32),
+                      np.frombuffer(src_offsets, dtype=np.int64), src_vocab,
+                      np.frombuffer(tgt_ids, dtype=np.uint32),
+                      np.frombuffer(tgt_offsets, dtype=np.int64), tgt_vocab)
+
+    def train(self, bitext, blocks, cache_pairs=CACHE_PAIRS):
+        """Estimates t(target word | source word) with EM.
+
+        The probabilities are stored only for the word pairs that occur
+        together in a sentence pair, sorted by 'key'.
+
+        Args:
+            bitext(Bitext): See 'read_bitext'.
+            blocks(list of tuple): See '_blocks'.
+            cache_pairs(int): See 'CACHE_PAIRS'.
+
+        Returns:
+            tuple: The keys of the word pairs (numpy.ndarray, source ID *
+                   target vocabulary size + target ID) and their
+                   probabilities (numpy.ndarray).
+
+        """
+        n_tgt = len(bitext.tgt_vocab)
+        block_keys = [np.zeros(0, dtype=np.int64)]
+        for first, last in blocks:
+            src_pos, tgt_pos, _ = self._pairs(bitext, first, last)
+            block_keys.append(np.unique(self._pair_keys(bitext, src_pos,
+                                                        tgt_pos)))
+        keys = np.unique(np.concatenate(block_keys))
+        pair_src = keys // n_tgt
+        if len(keys) >= 2**31:
+            cache_pairs = 0
+        cache = dict()
+        # Uniform start.
+        probs = np.ones(len(keys))
+        for _ in range(self.iterations):
+            counts = np.zeros(len(keys))
+            for block, (first, last) in enumerate(blocks):
+                src_pos, tgt_pos, width = self._pairs(bitext, first, last)
+                index = cache.get(block)
+                if index is None:
+                    index = np.searchsorted(keys,
+                                            self._pair_keys(bitext, src_pos,
+                                                            tgt_pos))
+                    if len(index) <= cache_pairs:
+                        cache_pairs -= len(index)
+                        cache[block] = index = index.astype(np.int32)
+                posterior = self._alignment_probs(bitext, first, last,
+                                                  probs[index], src_pos,
+                                                  width)
+                # Normalized per target token.
+                target = np.repeat(np.arange(len(width)), width)
+                posterior /= np.bincount(target, posterior)[target]
+                counts += np.bincount(index, posterior, minlength=len(keys))
+            totals = np.bincount(pair_src, counts,
+                                 minlength=len(bitext.src_vocab))
+            probs = counts / totals[pair_src]
+        return keys, probs
+
+    @staticmethod
+    def _blocks(bitext, block_pairs):
+        """Splits the sentence pairs into blocks of about 'block_pairs'
+        token pairs.
+
+        Returns:
+            list of tuple: (first, last) sentence index of every block,
+                           'last' is excluded.
+
+        """
+        n_pairs = (np.diff(bitext.src_offsets)
+                   * np.diff(bitext.tgt_offsets))
+        cumulated = np.concatenate(([0], np.cumsum(n_pairs)))
+        blocks = []
+        first = 0
+        while first < len(n_pairs):
+            last = int(np.searchsorted(cumulated,
+                                       cumulated[first] + block_pairs,
+                                       'right')) - 1
+            last = max(last, first + 1)
+            blocks.append((first, last))
+            first = last
+        return blocks
+
+    @staticmethod
+    def _pairs(bitext, first, last):
+        """Returns all (source token, target token) pairs of sentences.
+
+        The pairs are grouped by target token: every target token is
+        paired with all tokens of its source sentence (NULL first).
+
+        Returns:
+            tuple: The positions of the source tokens in
+                   'bitext.src_ids', the positions of the target tokens in
+                   'bitext.tgt_ids' (numpy.ndarray) and the number of
+                   pairs of every target token (source sentence length).
+
+        """
+        src_offsets = bitext.src_offsets
+        tgt_offsets = bitext.tgt_offsets
+        sentence = np.repeat(np.arange(first, last),
+                             np.diff(tgt_offsets[first:last+1]))
+        width = src_offsets[sentence + 1] - src_offsets[sentence]
+        tgt_pos = np.repeat(np.arange(tgt_offsets[first], tgt_offsets[last]),
+                            width)
+        starts = np.cumsum(width) - width
+        src_pos = np.arange(width.sum()) - np.repeat(
+                starts - src_offsets[sentence], width)
+        return src_pos, tgt_pos, width
+
+    @staticmethod
+    def _pair_keys(bitext, src_pos, tgt_pos):
+        """Returns the keys of the word pairs at token positions."""
+        return (bitext.src_ids[src_pos].astype(np.int64)
+                * len(bitext.tgt_vocab) + bitext.tgt_ids[tgt_pos])
+
+    def _alignment_probs(self, bitext, first, last, probs, src_pos, width):
+        """Multiplies the translation probabilities of pairs (see '_pairs')
+        with the diagonal alignment prior, if 'self.diagonal' is used.
+
+        Returns:
+            numpy.ndarray: The unnormalized alignment probabilities.
+
+        """
+        if not self.diagonal:
+            return probs.copy()
+        src_offsets = bitext.src_offsets
+        tgt_offsets = bitext.tgt_offsets
+        tgt_lengths = np.diff(tgt_offsets[first:last+1])
+        sentence = np.repeat(np.arange(first, last), tgt_lengths)
+        # Position of every target token in its sentence, starting at 1.
+        j = (np.arange(tgt_offsets[first], tgt_offsets[last])
+             - tgt_offsets[sentence] + 1)
+        target = np.repeat(np.arange(len(width)), width)
+        # Position of the source token, 0 is NULL.
+        i = src_pos - src_offsets[sentence][target]
+        m = tgt_lengths[sentence - first][target]
+        n = np.maximum(width[target] - 1, 1)
+        prior = np.exp(-self.diagonal * np.abs(i / n - j[target] / m))
+        prior[i == 0] = 0.0
+        prior *= (1 - self.null_prob) / np.bincount(target, prior)[target]
+        prior[i == 0] = self.null_prob
+        return probs * prior
+
+    def _align_block(self, bitext, first, last, keys, probs, flags,
+                     alignments):
+        """Aligns the connectors of a block of sentence pairs.
+
+        Every target token is aligned to the source token (or NULL) with
+        the highest alignment probability, the first one if several have
+        the same probability.
+
+        Args:
+            bitext(Bitext): See 'read_bitext'.
+            first(int): Index of the first sentence pair.
+            last(int): Index after the last sentence pair.
+            keys(numpy.ndarray): See 'train'.
+            probs(numpy.ndarray): See 'train'.
+            flags(numpy.ndarray): Whether a source ID is a connector.
+            alignments(dict): Counts to which the matches are added.
+
+        """
+        note_match = self._instrument('note_match', self.note_match)
+        src_pos, tgt_pos, width = self._pairs(bitext, first, last)
+        tgt_start = bitext.tgt_offsets[first]
+        aligned = np.zeros(0, dtype=np.int64)
+        if len(src_pos):
+            index = np.searchsorted(keys, self._pair_keys(bitext, src_pos,
+                                                          tgt_pos))
+            scores = self._alignment_probs(bitext, first, last, probs[index],
+                                           src_pos, width)
+            starts = np.cumsum(width) - width
+            best = np.maximum.reduceat(scores, starts)
+            target = np.repeat(np.arange(len(width)), width)
+            candidates = np.flatnonzero(scores == best[target])
+            _, first_best = np.unique(target[candidates], return_index=True)
+            # Source position of every target token of the block.
+            aligned = src_pos[candidates[first_best]]
+        # Target tokens grouped by their source token, in sentence order.
+        order = np.argsort(aligned, kind='stable')
+        aligned = aligned[order]
+        src_start = bitext.src_offsets[first]
+        src_end = bitext.src_offsets[last]
+        positions = src_start + np.flatnonzero(
+                flags[bitext.src_ids[src_start:src_end]])
+        begins = np.searchsorted(aligned, positions, 'left').tolist()
+        ends = np.searchsorted(aligned, positions, 'right').tolist()
+        src_vocab = bitext.src_vocab
+        tgt_vocab = bitext.tgt_vocab
+        connectors = bitext.src_ids[positions].tolist()
+        tgt_ids = bitext.tgt_ids[tgt_start + order].tolist()
+        for connector, begin, end in zip(connectors, begins, ends):
+            note_match(alignments, src_vocab[connector],
+                       ' '.join([tgt_vocab[token_id]
+                                 for token_id in tgt_ids[begin:end]]))
+
+
+def main():
+    """Starts alignment."""
+    obj = Model1Aligner({'aber', 'doch', 'jedoch',
+                         'allerdings', 'andererseits', 'hingegen'})
+    result = obj.align('de-en/europarl-v7.de-en.de',
+                       'de-en/europarl-v7.de-en.en')
+
+    # Save results to csv.
+    os.makedirs('results/model1', exist_ok=True)
+    df = Aligner.result_to_df(result, save='results/model1/model1.csv')
+
+    # Save top matches of every connector.
+    Aligner.print_top_values(df, save='results/model1/model1.txt', top=15)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,8 +5,12 @@
 Es soll den ersten Schritt des Modulprojekts erfüllen.
 
 """
-from split_text import token_split
+from functools import partial
+
 from abstract_aligner import Aligner
+from corpus import Shard, iter_token_pairs, make_shards, tokenize_line
+from pipeline import iter_chunk_pairs, run_pipeline
+from prefilter import KeywordMatcher, iter_candidate_pairs
 
 
 class NaiveAligner(Aligner):
@@ -17,20 +21,159 @@ class NaiveAligner(Aligner):
         #               that are mapped to tokens in the target text.
         self.connectors = connectors
 
-    def align(self, src_path, tgt_path):
+    def align(self, src_path, tgt_path, workers=1, engine='loop',
+              pipeline=False, export='', prefilter=True, lines=None):
         """Aims to align the connectors from two text files.
 
         Args:
             src_path(str): Path to the file in the source language (the
-                           same as self.connectors).
+                           same as self.connectors). Can also be a
+                           token_cache.TokenizedCorpus of the file.
             tgt_path(str): Path to the target file, where we're trying to
                            find equivalents of the connectors in the source
-                           file.
+                           file. Can also be a token_cache.TokenizedCorpus.
+            workers(int): Number of processes. If greater than 1, the files
+                          are split into shards that are aligned in
+                          parallel.
+            engine(str): 'loop' checks token by token. 'numpy' aligns
+                         blocks of line pairs as token ID arrays (see
+                         '_align_block'), fastest with tokenized corpora.
+                         Both give the same results.
+            pipeline(bool): If True, a reader thread reads the files in
+                            chunks, which 'workers' processes align (see
+                            pipeline.py). The files can be .gz or .xz
+                            compressed. Only with the 'loop' engine.
+            export(str): If given, every aligned connector occurrence is
+                         saved to this .npz file, indexed by connector and
+                         equivalent (see occurrences.OccurrenceIndex).
+            prefilter(bool): If True, only the line pairs whose source line
+                             can contain a connector are tokenized (see
+                             prefilter.py). Only with the 'loop' engine,
+                             gives the same results.
+            lines(range or iterable of int): If given, only these lines
+                                             are aligned, see
+                                             ListAligner.align. A sample
+                                             that is not a range is only
+                                             aligned with the 'loop'
+                                             engine. Can't be combined
+                                             with the pipeline mode.
+
+        Raises:
+            ValueError: If the engine is unknown or can't be used with the
+                        pipeline mode or 'lines', or 'lines' are given in
+                        pipeline mode.
+            IndexError: If a line of 'lines' (not a range) is not in both
+                        files.
 
         """
-        return self.__naive_align(src_path, tgt_path)
+        if engine not in ('loop', 'numpy'):
+            raise ValueError(f'Unknown engine: {engine}')
+        if pipeline and engine != 'loop':
+            raise ValueError('The pipeline mode uses the loop engine')
+        if lines is not None:
+            if pipeline:
+                raise ValueError('A line range or sample can\'t be aligned '
+                                 'in pipeline mode')
+            if (engine != 'loop'
+                    and not (isinstance(lines, range) and lines.step == 1)):
+                raise ValueError('A sample of lines is aligned with the '
+                                 'loop engine')
+        self._start_profile()
+        shard_profilers = []
+        occurrences = self._new_occurrences(export)
+        matcher = None
+        if prefilter and engine == 'loop':
+            matcher = KeywordMatcher(self.connectors)
+        if pipeline or workers > 1:
+            if pipeline:
+                results = run_pipeline(partial(self._align_chunk, bool(export),
+                                               matcher),
+                                       src_path, tgt_path, workers)
+            else:
+                if lines is None:
+                    parts = [(shard, None) for shard in make_shards(
+                            src_path, tgt_path, workers * 4)]
+                else:
+                    parts = self._line_parts(src_path, tgt_path, lines,
+                                             workers * 4)
+                results = self.iter_parallel(
+                        self._align_shard,
+                        [(src_path, tgt_path, shard, engine, bool(export),
+                          matcher, sample)
+                         for shard, sample in parts],
+                        workers
+                        )
+            alignments = self.new_counts(self.count_backend)
+            for result, profiler, shard_occurrences in results:
+                self.merge_alignments(alignments, result)
+                if profiler is not None:
+                    shard_profilers.append(profiler)
+                if shard_occurrences is not None:
+                    occurrences.merge(shard_occurrences)
+        elif lines is not None:
+            alignments = self.new_counts(self.count_backend)
+            for shard, sample in self._line_parts(src_path, tgt_path, lines,
+                                                  1):
+                result, _, part_occurrences = self._align_shard(
+                        src_path, tgt_path, shard, engine, bool(export),
+                        matcher, sample
+                        )
+                self.merge_alignments(alignments, result)
+                if part_occurrences is not None:
+                    occurrences.merge(part_occurrences)
+        elif engine == 'numpy':
+            alignments = self.__naive_align_blocks(
+                    src_path, tgt_path, occurrences=occurrences)
+        else:
+            alignments = self.__naive_align(src_path, tgt_path,
+                                            occurrences=occurrences,
+                                            matcher=matcher)
+        if export:
+            with self.timed('export'):
+                occurrences.save(export)
+        self._end_profile(alignments, shard_profilers)
+        return alignments
+
+    def _align_shard(self, src_path, tgt_path, shard, engine='loop',
+                     export=False, matcher=None, sample=None):
+        """Aligns a part of the files (see corpus.Shard).
+
+        Args:
+            export(bool): Whether the occurrences are collected.
+            matcher(prefilter.KeywordMatcher): See '__naive_align'.
+            sample(list of int): See '__naive_align'.
+
+        Returns:
+            tuple: The alignments, the profiler of the worker (None if
+                   profiling is disabled) and the occurrences
+                   (occurrences.Occurrences, None if not 'export').
+
+        """
+        occurrences = self._new_occurrences(export)
+        if engine == 'numpy':
+            alignments = self.__naive_align_blocks(src_path, tgt_path, shard,
+                                                   occurrences=occurrences)
+        else:
+            alignments = self.__naive_align(src_path, tgt_path, shard,
+                                            occurrences=occurrences,
+                                            matcher=matcher, sample=sample)
+        return alignments, self.profiler, occurrences
+
+    def _align_chunk(self, export, matcher, chunk):
+        """Aligns a chunk of line pairs (see pipeline.read_chunks).
 
-    def __naive_align(self, src_path, tgt_path):
+        Returns:
+            tuple: See '_align_shard'.
+
+        """
+        occurrences = self._new_occurrences(export)
+        alignments = self.__naive_align(None, None, chunk=chunk,
+                                        occurrences=occurrences,
+                                        matcher=matcher)
+        return alignments, self.profiler, occurrences
+
+    def __naive_align(self, src_path, tgt_path, shard=None, chunk=None,
+                      occurrences=None, matcher=None, sample=None):
         """Maps source text tokens (in self.connectors) to target text tokens.
 
         In the general case tokens with the same index are matched:
@@ -70,6 +213,20 @@ class NaiveAligner(Aligner):
         Args:
             src_path(str): see Aligner.align().
             tgt_path(str): see Aligner.align().
+            shard(corpus.Shard): Part of the files that is aligned. If
+                                 None, the files are aligned completely.
+            chunk(tuple): If given, the line pairs of this chunk (see
+                          pipeline.read_chunks) are aligned instead of the
+                          files.
+            occurrences(occurrences.Occurrences): If given, every aligned
+                                                  connector is added.
+            matcher(prefilter.KeywordMatcher): If given, the line pairs
+                                               without connector are
+                                               skipped before they are
+                                               tokenized.
+            sample(list of int): If given, these line numbers are aligned
+                                 instead of the shard (see
+                                 line_index.iter_token_pairs_at).
 
         Returns:
             alignments(dict): tokens from the source text (str) as keys and
@@ -79,17 +236,23 @@ class NaiveAligner(Aligner):
                               (int) for values.
 
         """
-        alignments = dict()
-        src_file = open(src_path, encoding='utf-8')
-        tgt_file = open(tgt_path, encoding='utf-8')
-        while True:
-            try:
-                src_line = next(src_file).casefold()
-                tgt_line = next(tgt_file).casefold()
-            except StopIteration:
-                break
-            src_tokens = token_split(src_line)
-            tgt_tokens = token_split(tgt_line)
+        alignments = self.new_counts(self.count_backend)
+        note_match = self._instrument('note_match', self.note_match)
+        tokenize = self._instrument('tokenize', tokenize_line)
+        if chunk is not None:
+            pairs = iter_chunk_pairs(chunk, tokenize, matcher=matcher)
+        elif sample is not None:
+            from line_index import iter_token_pairs_at
+            pairs = iter_token_pairs_at(src_path, tgt_path, sample, tokenize,
+                                        matcher=matcher)
+        elif matcher is not None:
+            pairs = iter_candidate_pairs(src_path, tgt_path, matcher, shard,
+                                         tokenize=tokenize)
+        else:
+            pairs = iter_token_pairs(src_path, tgt_path, shard,
+                                     tokenize=tokenize)
+        for lineno, src_tokens, tgt_tokens in self._instrument_iter('read',
+                                                                    pairs):
             token_id = 0
             for token in src_tokens:
                 if token in self.connectors:
@@ -102,10 +265,135 @@ class NaiveAligner(Aligner):
                             equivalent = tgt_tokens[-1]
                     else:
                         equivalent = tgt_tokens[token_id]
-                    self.note_match(alignments, token, equivalent)
+                    note_match(alignments, token, equivalent)
+                    if occurrences is not None:
+                        occurrences.add(lineno, token_id, token, equivalent,
+                                        min(token_id, len(tgt_tokens) - 1))
                 token_id += 1
-        src_file.close()
-        tgt_file.close()
+        return alignments
+
+    def __naive_align_blocks(self, src_path, tgt_path, shard=None,
+                             block_size=200000, occurrences=None):
+        """Like '__naive_align', but aligns blocks of line pairs at once.
+
+        Args:
+            src_path(str): see Aligner.align().
+            tgt_path(str): see Aligner.align().
+            shard(corpus.Shard): see '__naive_align'.
+            block_size(int): Number of line pairs per block.
+            occurrences(occurrences.Occurrences): see '__naive_align'.
+
+        Returns:
+            alignments(dict): see '__naive_align'.
+
+        """
+        if shard is None:
+            shard = Shard(1, None, 0, 0)
+        alignments = self.new_counts(self.count_backend)
+        align_block = self._instrument('search', self._align_block)
+        merge_alignments = self._instrument('note_match',
+                                            self.merge_alignments)
+        # The IDs are only used to look tokens up, so tokens from files
+        # don't need to be interned.
+        from token_cache import iter_id_blocks
+        src_blocks = iter_id_blocks(src_path, shard.src_offset, shard.lineno,
+                                    shard.n_lines, block_size, intern=False)
+        tgt_blocks = iter_id_blocks(tgt_path, shard.tgt_offset, shard.lineno,
+                                    shard.n_lines, block_size, intern=False)
+        blocks = self._instrument_iter('read', zip(src_blocks, tgt_blocks))
+        flags = (None, None)
+        lineno = shard.lineno
+        for src_block, tgt_block in blocks:
+            # Connector flags of the source vocabulary. The vocabulary of
+            # a tokenized corpus is the same for all blocks.
+            if flags[0] is not src_block[2]:
+                flags = (src_block[2], self._connector_flags(src_block[2]))
+            block = align_block(src_block, tgt_block, flags[1], occurrences,
+                                lineno)
+            merge_alignments(alignments, block)
+            lineno += len(src_block[1]) - 1
+            # One file ended before the other.
+            if len(src_block[1]) != len(tgt_block[1]):
+                break
+        return alignments
+
+    def _connector_flags(self, vocab):
+        """Returns a boolean array that marks the connectors in a vocabulary.
+        """
+        import numpy as np
+        return np.fromiter(map(self.connectors.__contains__, vocab),
+                           dtype=bool, count=len(vocab))
+
+    def _align_block(self, src_block, tgt_block, flags=None, occurrences=None,
+                     lineno=1):
+        """Aligns a block of line pairs given as token ID arrays.
+
+        The connector positions are looked up in 'flags', the positions are
+        clamped to the last token of the target line and the target
+        tokens are gathered. Every (connector, equivalent) pair is counted
+        once, in the order of its first occurrence, so the result is the
+        same as with '__naive_align'.
+
+        Args:
+            src_block(tuple): (ids, offsets, vocab) of the source lines, see
+                              token_cache.iter_id_blocks.
+            tgt_block(tuple): The same for the target lines. If it has a
+                              different number of lines, only the lines
+                              of both blocks are aligned.
+            flags(numpy.ndarray): See '_connector_flags'. If None, computed
+                                  from the source vocabulary.
+            occurrences(occurrences.Occurrences): If given, every aligned
+                                                  connector is added.
+            lineno(int): Line number of the first line pair of the block.
+
+        Returns:
+            dict: The alignments of the block, see '__naive_align'.
+
+        """
+        import numpy as np
+
+        src_ids, src_offsets, src_vocab = src_block
+        tgt_ids, tgt_offsets, tgt_vocab = tgt_block
+        n_lines = min(len(src_offsets), len(tgt_offsets)) - 1
+        src_ids = src_ids[:src_offsets[n_lines]]
+        src_offsets = src_offsets[:n_lines+1]
+        if flags is None:
+            flags = self._connector_flags(src_vocab)
+        positions = np.flatnonzero(flags[src_ids])
+        if not len(positions):
+            return dict()
+        lines = np.searchsorted(src_offsets, positions, side='right') - 1
+        token_ids = positions - src_offsets[lines]
+        tgt_starts = tgt_offsets[lines]
+        tgt_lengths = tgt_offsets[lines+1] - tgt_starts
+        # Target line shorter than source line: token furthest to the
+        # right. Target line empty: empty string (-1).
+        gather = tgt_starts + np.minimum(token_ids, tgt_lengths - 1)
+        equivalents = np.full(len(positions), -1, dtype=np.int64)
+        found = tgt_lengths > 0
+        equivalents[found] = tgt_ids[gather[found]]
+        connectors = src_ids[positions].astype(np.int64)
+        if occurrences is not None:
+            targets = np.minimum(token_ids, tgt_lengths - 1)
+            for row in zip((lines + lineno).tolist(), token_ids.tolist(),
+                           connectors.tolist(), equivalents.tolist(),
+                           targets.tolist()):
+                occurrences.add(row[0], row[1], src_vocab[row[2]],
+                                tgt_vocab[row[3]] if row[3] >= 0 else '',
+                                row[4])
+        keys = connectors * (len(tgt_vocab) + 1) + equivalents + 1
+        pairs, first, counts = np.unique(keys, return_index=True,
+                                         return_counts=True)
+        order = np.argsort(first, kind='stable')
+        alignments = dict()
+        for key, count in zip(pairs[order].tolist(), counts[order].tolist()):
+            connector, equivalent = divmod(key, len(tgt_vocab) + 1)
+            if equivalent:
+                equivalent = tgt_vocab[equivalent-1]
+            else:
+                equivalent = ''
+            matches = alignments.setdefault(src_vocab[connector], dict())
+            matches[equivalent] = matches.get(equivalent, 0) + count
         return alignments
 
 
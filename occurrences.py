@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains the per-occurrence export of the aligners.
+
+Every aligned connector occurrence is stored with its line number, its
+position in the source sentence, the equivalent and the position of the
+equivalent in the target sentence. The .npz file is sorted and indexed by
+(connector, equivalent), so the lines of a pair are found without
+scanning, and the sentence pairs are read with a line index (see
+line_index.py):
+
+    index = OccurrenceIndex.load('results/list/occurrences.npz')
+    for lineno, src, tgt in index.sentence_pairs(
+            'allerdings', 'however', 'de-en/europarl-v7.de-en.de',
+            'de-en/europarl-v7.de-en.en', limit=20):
+        print(lineno, src, tgt, sep='\\n')
+
+"""
+from array import array
+
+import numpy as np
+
+from line_index import read_line_numbers
+
+
+class Occurrences():
+    """Collects the aligned connector occurrences of a run.
+
+    Attributes:
+        connectors (list of str): The connector of every connector index.
+        equivalents (list of str): The equivalent of every equivalent
+                                   index, '' means no match.
+
+    """
+    def __init__(self):
+        self.connectors = []
+        self.equivalents = []
+        self._connector_ids = dict()
+        self._equivalent_ids = dict()
+        self._lines = array('I')
+        self._positions = array('I')
+        self._connector_col = array('I')
+        self._equivalent_col = array('I')
+        self._targets = array('i')
+
+    def __len__(self):
+        return len(self._lines)
+
+    def add(self, lineno, position, connector, equivalent, target):
+        """Adds an occurrence.
+
+        Args:
+            lineno (int): Line number of the sentence pair.
+            position (int): Index of the connector in the source tokens.
+            connector (str): Source connector.
+            equivalent (str): Found equivalent, '' if none.
+            target (int): Index of the (first token of the) equivalent in
+                          the target tokens, -1 if none.
+
+        """
+        connector_id = self._connector_ids.get(connector)
+        if connector_id is None:
+            connector_id = self._connector_ids[connector] = \
+                len(self.connectors)
+            self.connectors.append(connector)
+        equivalent_id = self._equivalent_ids.get(equivalent)
+        if equivalent_id is None:
+            equivalent_id = self._equivalent_ids[equivalent] = \
+                len(self.equivalents)
+            self.equivalents.append(equivalent)
+        self._lines.append(lineno)
+        self._positions.append(position)
+        self._connector_col.append(connector_id)
+        self._equivalent_col.append(equivalent_id)
+        self._targets.append(target)
+
+    def merge(self, other):
+        """Adds the occurrences of another Occurrences after these."""
+        for row in zip(other._lines, other._positions,
+                       [other.connectors[i] for i in other._connector_col],
+                       [other.equivalents[i] for i in other._equivalent_col],
+                       other._targets):
+            self.add(*row)
+
+    def save(self, path):
+        """Saves the occurrences sorted by (connector, equivalent, line).
+
+        The .npz file contains one entry per occurrence in 'line',
+        'position', 'connector', 'equivalent' and 'target' (see 'add',
+        connector and equivalent as indices into 'connectors' and
+        'equivalents'). 'pair_connector' and 'pair_equivalent' list every
+        (connector, equivalent) pair, its occurrences are
+        'pair_offsets[i]:pair_offsets[i+1]'.
+
+        """
+        connector = np.frombuffer(self._connector_col, dtype=np.uint32)
+        equivalent = np.frombuffer(self._equivalent_col, dtype=np.uint32)
+        line = np.frombuffer(self._lines, dtype=np.uint32)
+        position = np.frombuffer(self._positions, dtype=np.uint32)
+        order = np.lexsort((position, line, equivalent, connector))
+        connector = connector[order]
+        equivalent = equivalent[order]
+        starts = np.flatnonzero(np.concatenate((
+                [len(order) > 0],
+                (connector[1:] != connector[:-1])
+                | (equivalent[1:] != equivalent[:-1]))))
+        np.savez_compressed(
+                path,
+                line=line[order], position=position[order],
+                connector=connector, equivalent=equivalent,
+                target=np.frombuffer(self._targets, dtype=np.int32)[order],
+                connectors=np.array(self.connectors, dtype=str),
+                equivalents=np.array(self.equivalents, dtype=str),
+                pair_connector=connector[starts],
+                pair_equivalent=equivalent[starts],
+                pair_offsets=np.append(starts, len(order)).astype(np.int64))
+
+
+class OccurrenceIndex():
+    """Queries the occurrences saved by Occurrences.save.
+
+    Attributes:
+        arrays (dict): The arrays of the file.
+
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+        connectors = arrays['connectors'].tolist()
+        equivalents = arrays['equivalents'].tolist()
+        self._pairs = {
+                (connectors[c], equivalents[e]): i for i, (c, e) in enumerate(
+                    zip(arrays['pair_connector'].tolist(),
+                        arrays['pair_equivalent'].tolist()))}
+
+    @classmethod
+    def load(cls, path):
+        """Loads a .npz file written by Occurrences.save."""
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def pairs(self):
+        """Returns (connector, equivalent, number of occurrences) of every
+        pair, most frequent first."""
+        offsets = self.arrays['pair_offsets']
+        counts = (offsets[1:] - offsets[:-1]).tolist()
+        return sorted(((connector, equivalent, counts[i])
+                       for (connector, equivalent), i in self._pairs.items()),
+                      key=lambda pair: -pair[2])
+
+    def find(self, connector, equivalent):
+        """Returns the occurrences of a pair.
+
+        Args:
+            connector (str): Source connector.
+            equivalent (str): Equivalent, '' for no match.
+
+        Returns:
+            dict: 'line', 'position' and 'target' arrays, sorted by line.
+                  Empty if the pair doesn't occur.
+
+        """
+        i = self._pairs.get((connector, equivalent))
+        if i is None:
+            begin = end = 0
+        else:
+            begin, end = self.arrays['pair_offsets'][i:i+2].tolist()
+        return {name: self.arrays[name][begin:end]
+                for name in ('line', 'position', 'target')}
+
+    def lines(self, connector, equivalent):
+        """Returns the sorted line numbers where a pair occurs."""
+        return np.unique(self.find(connector, equivalent)['line'])
+
+    def sentence_pairs(self, connector, equivalent, src_path, tgt_path,
+                       limit=None):
+        """Reads the sentence pairs where a pair occurs.
+
+        The lines are read with the line indices of the files (see
+        line_index.load_line_index), which are built on first use.
+
+        Args:
+            connector (str): Source connector.
+            equivalent (str): Equivalent, '' for no match.
+            src_path (str): The aligned source file.
+            tgt_path (str): The aligned target file.
+            limit (int): Maximum number of sentence pairs. If None, all.
+
+        Returns:
+            list of tuple: (lineno, src_line, tgt_line)
+
+        """
+        line_numbers = self.lines(connector, equivalent)[:limit].tolist()
+        src_lines = read_line_numbers(src_path, line_numbers)
+        tgt_lines = read_line_numbers(tgt_path, line_numbers)
+        return list(zip(line_numbers, src_lines, tgt_lines))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains the pipeline mode of the aligners.
+
+    reader thread --chunks--> worker processes --results--> merge stage
+
+The reader thread reads (and decompresses) the line pairs in chunks, the
+worker processes tokenize and align the chunks and the merge stage (the
+caller) receives the results in the order of the chunks. The queue of
+read chunks and the number of chunks in the workers are bounded, so the
+memory doesn't grow with the size of the corpus.
+
+Files ending with '.gz' or '.xz' are decompressed while they are read.
+
+"""
+import gzip
+import itertools
+import lzma
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from corpus import is_tokenized, iter_file_lines, tokenize_line
+
+
+#: Number of line pairs per chunk.
+CHUNK_SIZE = 20000
+
+#: Buffer size for reading uncompressed files.
+BUFFER_SIZE = 1 << 20
+
+#: Functions that open compressed files by suffix.
+OPENERS = {'.gz': gzip.open, '.xz': lzma.open}
+
+
+def open_corpus(path):
+    """Opens a file for reading in binary mode.
+
+    Files ending with '.gz' or '.xz' are decompressed.
+    """
+    opener = OPENERS.get(os.path.splitext(path)[1])
+    if opener is None:
+        return open(path, 'rb', buffering=BUFFER_SIZE)
+    return opener(path, 'rb')
+
+
+def _iter_blocks(corpus, chunk_size):
+    """Yields lists of the next 'chunk_size' lines of a file (bytes) or
+    tokenized corpus (token lists)."""
+    if is_tokenized(corpus):
+        lines = corpus.iter_tokens()
+        while True:
+            block = list(itertools.islice(lines, chunk_size))
+            if not block:
+                return
+            yield block
+    with open_corpus(corpus) as file:
+        lines = iter_file_lines(file)
+        while True:
+            block = list(itertools.islice(lines, chunk_size))
+            if not block:
+                return
+            yield block
+
+
+def read_chunks(src_path, tgt_path, chunk_size=CHUNK_SIZE):
+    """Yields the parallel lines of two files in chunks.
+
+    Stops at the end of the shorter file.
+
+    Args:
+        src_path(str or TokenizedCorpus): The source file, can be
+                                          compressed.
+        tgt_path(str or TokenizedCorpus): The target file, can be
+                                          compressed.
+        chunk_size(int): Number of line pairs per chunk.
+
+    Yields:
+        tuple: (lineno, src_lines, tgt_lines) with the line number of the
+               first line pair. The lines of a file are undecoded bytes,
+               the lines of a tokenized corpus token lists.
+
+    """
+    lineno = 1
+    for src_lines, tgt_lines in zip(_iter_blocks(src_path, chunk_size),
+                                    _iter_blocks(tgt_path, chunk_size)):
+        n_lines = min(len(src_lines), len(tgt_lines))
+        yield lineno, src_lines[:n_lines], tgt_lines[:n_lines]
+        lineno += n_lines
+        if n_lines < chunk_size:
+            return
+
+
+def iter_chunk_pairs(chunk, tokenize=tokenize_line, src_tokenize=None,
+                     matcher=None):
+    """Like corpus.iter_token_pairs, but for a chunk from 'read_chunks'.
+
+    If a prefilter.KeywordMatcher is given, only the pairs whose source
+    line can contain a keyword are tokenized and yielded.
+    """
+    if src_tokenize is None:
+        src_tokenize = tokenize
+    lineno, src_lines, tgt_lines = chunk
+    for i, (src_line, tgt_line) in enumerate(zip(src_lines, tgt_lines)):
+        if matcher is not None and not matcher.matches(src_line):
+            continue
+        if type(src_line) is bytes:
+            src_line = src_tokenize(src_line.decode('utf-8'))
+        if type(tgt_line) is bytes:
+            tgt_line = tokenize(tgt_line.decode('utf-8'))
+        yield lineno + i, src_line, tgt_line
+
+
+def _put(chunks, item, stop):
+    """Puts an item into the queue unless 'stop' is set while it is full.
+
+    Returns:
+        bool: Whether the item was put.
+
+    """
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _read(chunks, src_path, tgt_path, chunk_size, stop):
+    """Reader stage: puts the chunks into a queue, then None."""
+    try:
+        for chunk in read_chunks(src_path, tgt_path, chunk_size):
+            if not _put(chunks, chunk, stop):
+                return
+        _put(chunks, None, stop)
+    except Exception as error:
+        _put(chunks, error, stop)
+
+
+def run_pipeline(func, src_path, tgt_path, workers=1, chunk_size=CHUNK_SIZE,
+                 max_pending=None):
+    """Runs a function for all chunks of two parallel files.
+
+    Args:
+        func(callable): A picklable function that gets a chunk (see
+                        'read_chunks'), e.g. a method of an aligner.
+        src_path(str or TokenizedCorpus): The source file.
+        tgt_path(str or TokenizedCorpus): The target file.
+        workers(int): Number of worker processes.
+        chunk_size(int): Number of line pairs per chunk.
+        max_pending(int): Maximum number of chunks that are read but not
+                          yet merged, in the queue and in the workers
+                          each. If None, twice the number of workers.
+
+    Yields:
+        The return values of 'func' in the order of the chunks.
+
+    """
+    if max_pending is None:
+        max_pending = 2 * workers
+    chunks = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read, daemon=True,
+                              args=(chunks, src_path, tgt_path, chunk_size,
+                                    stop))
+    reader.start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                pending.append(pool.submit(func, chunk))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    finally:
+        stop.set()
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains a prefilter for the line pairs of the aligners.
+
+Most lines of the corpus contain none of the source connectors. A
+KeywordMatcher searches the undecoded source lines for all connectors
+with one compiled regular expression, and only the line pairs that can
+contain a connector are decoded and tokenized:
+
+    source bytes --KeywordMatcher--> candidate pairs --tokenize--> aligner
+
+Every line whose tokens (see corpus.tokenize_line) contain a connector
+is a candidate, so the aligners give the same results with and without
+the prefilter. A few lines without connector are candidates, too (e.g.
+if a connector is directly followed by a non-ASCII letter).
+
+"""
+import itertools
+import re
+from functools import lru_cache
+
+from corpus import Shard, is_tokenized, iter_file_lines, tokenize_line
+from split_text import TOKEN_PATTERN
+
+
+#: ASCII bytes that are part of a token. A keyword that is preceded or
+#: followed by one of them is only a part of a longer token.
+TOKEN_BYTES = bytes(code for code in range(128)
+                    if TOKEN_PATTERN.fullmatch(chr(code)))
+
+#: Maximum length of a casefolded character (e.g. 'ﬃ' -> 'ffi').
+MAX_FOLD = 3
+
+#: Code point ranges with all characters that aren't the upper, lower or
+#: title case of their casefolded form, e.g. 'ß' -> 'ss', 'ſ' -> 's',
+#: Kelvin sign -> 'k' and the ligatures (found by casefolding all code
+#: points, Unicode 14).
+SPECIAL_FOLDS = ((0x00B5, 0x01F0), (0x0345, 0x03F5), (0x0587, 0x0587),
+                 (0x1C80, 0x1C88), (0x1E96, 0x1E9E), (0x1F50, 0x1FFC),
+                 (0x2126, 0x212B), (0xFB00, 0xFB17))
+
+
+@lru_cache(maxsize=None)
+def _special_folds():
+    """Returns the characters of SPECIAL_FOLDS that are changed by
+    casefolding.
+
+    Returns:
+        dict: The casefolded string as key and a list of the characters
+              as value, e.g. 'ss': ['ß', 'ẞ'].
+
+    """
+    variants = dict()
+    for first, last in SPECIAL_FOLDS:
+        for code in range(first, last + 1):
+            char = chr(code)
+            folded = char.casefold()
+            if folded != char:
+                variants.setdefault(folded, []).append(char)
+    return variants
+
+
+@lru_cache(maxsize=None)
+def _case_variants(folded):
+    """Returns the characters that are casefolded to a string, e.g.
+    ['ß', 'ẞ'] for 'ss' or ['K', 'K'] (Kelvin sign) for 'k'."""
+    chars = set(_special_folds().get(folded, ()))
+    if len(folded) == 1:
+        chars.update(case for case in (folded.upper(), folded.lower(),
+                                       folded.title())
+                     if len(case) == 1)
+    return sorted((char for char in chars
+                   if char != folded and char.casefold() == folded),
+                  key=ord)
+
+
+def _keyword_pattern(keyword):
+    """Returns a bytes pattern for all spellings of a casefolded keyword.
+
+    A spelling is a string that is casefolded to the keyword, e.g. 'ABER'
+    or 'Aber' for 'aber' and 'Straße' for 'strasse'.
+    """
+    @lru_cache(maxsize=None)
+    def suffix(i):
+        # Pattern for keyword[i:].
+        if i == len(keyword):
+            return b''
+        alternatives = []
+        for length in range(1, min(MAX_FOLD, len(keyword) - i) + 1):
+            folded = keyword[i:i+length]
+            chars = _case_variants(folded)
+            if length == 1:
+                chars = [folded] + chars
+            if chars:
+                alternatives.append(
+                        b'(?:' + b'|'.join(re.escape(char.encode('utf-8'))
+                                           for char in chars)
+                        + b')' + suffix(i + length))
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return b'(?:' + b'|'.join(alternatives) + b')'
+
+    return suffix(0)
+
+
+class KeywordMatcher():
+    """Finds the lines that can contain a keyword as token.
+
+    Attributes:
+        keywords(frozenset): The keywords that can be tokens. Keywords
+                             that are not casefolded or contain separators
+                             are never tokens and left out.
+        pattern(re.Pattern): Matches the spellings of all keywords in
+                             undecoded (utf-8) lines, if they are not
+                             preceded or followed by an ASCII token
+                             character.
+
+    """
+    def __init__(self, keywords):
+        self.keywords = frozenset(
+                keyword for keyword in keywords
+                if keyword.casefold() == keyword
+                and TOKEN_PATTERN.fullmatch(keyword))
+        if not self.keywords:
+            # Matches nothing.
+            self.pattern = re.compile(b'(?!)')
+            return
+        boundary = b'[' + re.escape(TOKEN_BYTES) + b']'
+        self.pattern = re.compile(
+                b'(?<!' + boundary + b')(?:'
+                + b'|'.join(_keyword_pattern(keyword)
+                            for keyword in sorted(self.keywords))
+                + b')(?!' + boundary + b')')
+
+    def matches(self, line):
+        """Checks whether a line can contain a keyword.
+
+        Args:
+            line(bytes or list of str): An undecoded line or the tokens of
+                                        a line of a tokenized corpus.
+
+        """
+        if type(line) is bytes:
+            return self.pattern.search(line) is not None
+        return not self.keywords.isdisjoint(line)
+
+
+def _iter_raw_lines(corpus, offset=0, lineno=1, n_lines=None):
+    """Yields the undecoded lines of a file or the token lists of a
+    tokenized corpus, see corpus.iter_tokens."""
+    if is_tokenized(corpus):
+        stop = None if n_lines is None else lineno - 1 + n_lines
+        yield from corpus.iter_tokens(lineno - 1, stop)
+        return
+    with open(corpus, 'rb') as file:
+        file.seek(offset)
+        yield from itertools.islice(iter_file_lines(file), n_lines)
+
+
+def iter_candidate_pairs(src_path, tgt_path, matcher, shard=None,
+                         progress=None, tokenize=tokenize_line, offsets=None,
+                         src_tokenize=None):
+    """Like corpus.iter_token_pairs, but skips most pairs without keyword.
+
+    Only the pairs whose source line can contain a keyword of 'matcher'
+    are decoded, tokenized and yielded, with their line numbers in the
+    files.
+
+    Args:
+        matcher(KeywordMatcher): Matcher of the source connectors.
+        progress(callable): Called for every source line, also for the
+                            skipped lines. See corpus.iter_tokens.
+        offsets(list): If given, [src_offset, tgt_offset] is kept at the
+                       byte positions after the last yielded line pair.
+                       Only updated for files.
+        shard, tokenize, src_tokenize: See corpus.iter_token_pairs.
+
+    Yields:
+        tuple: (lineno, src_tokens, tgt_tokens)
+
+    """
+    if src_tokenize is None:
+        src_tokenize = tokenize
+    if shard is None:
+        shard = Shard(1, None, 0, 0)
+    src_is_file = not is_tokenized(src_path)
+    tgt_is_file = not is_tokenized(tgt_path)
+    if src_is_file:
+        search = matcher.pattern.search
+    else:
+        keywords = matcher.keywords
+
+        def search(tokens):
+            return not keywords.isdisjoint(tokens)
+    src_offset, tgt_offset = shard.src_offset, shard.tgt_offset
+    if offsets is not None:
+        offsets[:] = [src_offset, tgt_offset]
+    src_lines = _iter_raw_lines(src_path, src_offset, shard.lineno,
+                                shard.n_lines)
+    tgt_lines = _iter_raw_lines(tgt_path, tgt_offset, shard.lineno,
+                                shard.n_lines)
+    for lineno, src_line, tgt_line in zip(itertools.count(shard.lineno),
+                                          src_lines, tgt_lines):
+        if progress is not None:
+            progress(len(src_line) if src_is_file else 1)
+        if offsets is not None:
+            if src_is_file:
+                src_offset += len(src_line)
+            if tgt_is_file:
+                tgt_offset += len(tgt_line)
+        if not search(src_line):
+            continue
+        if src_is_file:
+            src_line = src_tokenize(src_line.decode('utf-8'))
+        if tgt_is_file:
+            tgt_line = tokenize(tgt_line.decode('utf-8'))
+        if offsets is not None:
+            offsets[:] = [src_offset, tgt_offset]
+        yield lineno, src_line, tgt_line
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains the opt-in instrumentation of the aligners.
+
+An aligner with a Profiler (see Aligner.enable_profiling) replaces its
+hot-path functions by timed wrappers, so nothing is measured and nothing
+costs extra time if profiling is disabled.
+
+"""
+import sys
+import time
+from contextlib import contextmanager
+
+
+class NullTimer():
+    """Context manager that does nothing, used if profiling is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class Profiler():
+    """Records cumulative times, call counts and counters of a run.
+
+    Attributes:
+        timers (dict): Name as key and [seconds, calls] as value.
+        counters (dict): Name as key and a number as value.
+        out (file): Where 'dump' writes the summary. If None, nothing
+                    is written.
+
+    """
+    def __init__(self, out=sys.stderr):
+        self.timers = dict()
+        self.counters = dict()
+        self.out = out
+
+    def __getstate__(self):
+        # Files can't be pickled. Copies in worker processes only collect.
+        state = self.__dict__.copy()
+        state['out'] = None
+        return state
+
+    def reset(self):
+        self.timers = dict()
+        self.counters = dict()
+
+    def add_time(self, name, seconds, calls=1):
+        timer = self.timers.setdefault(name, [0.0, 0])
+        timer[0] += seconds
+        timer[1] += calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name):
+        """Context manager that adds its duration to a timer."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def wrap(self, name, func):
+        """Returns a version of a function that adds its time to a timer."""
+        perf_counter = time.perf_counter
+        add_time = self.add_time
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add_time(name, perf_counter() - start)
+        return timed
+
+    def wrap_iter(self, name, iterable):
+        """Yields from an iterable and adds the time of every step."""
+        perf_counter = time.perf_counter
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, perf_counter() - start, 0)
+                return
+            self.add_time(name, perf_counter() - start)
+            yield item
+
+    def count_result(self, alignments):
+        """Counts connector hits and hits without match of a result."""
+        for equivalents in alignments.items():
+            for equivalent, count in equivalents[1].items():
+                self.count('hits', count)
+                if not equivalent:
+                    self.count('no_match', count)
+
+    def merge(self, other):
+        """Adds the times and counters of another Profiler."""
+        for name, (seconds, calls) in other.timers.items():
+            self.add_time(name, seconds, calls)
+        for name, n in other.counters.items():
+            self.count(name, n)
+
+    def summary(self):
+        """Returns the times, counters and derived rates as dict."""
+        summary = {'timers': {name: {'seconds': seconds, 'calls': calls}
+                              for name, (seconds, calls)
+                              in self.timers.items()},
+                   'counters': dict(self.counters)}
+        hits = self.counters.get('hits', 0)
+        if hits:
+            summary['no_match_rate'] = self.counters.get('no_match', 0) / hits
+            if 'search_steps' in self.counters:
+                summary['avg_search_steps'] = (self.counters['search_steps']
+                                               / hits)
+        if 'read' in self.timers and 'tokenize' in self.timers:
+            # Reading includes the tokenization.
+            summary['timers']['io'] = {
+                'seconds': self.timers['read'][0] - self.timers['tokenize'][0],
+                'calls': self.timers['read'][1]}
+        return summary
+
+    def dump(self):
+        """Writes the summary to 'self.out'."""
+        if self.out is None:
+            return
+        summary = self.summary()
+        print('Profile:', file=self.out)
+        for name, timer in sorted(summary['timers'].items()):
+            print(f'  {name:<12} {timer["seconds"]:10.3f} s '
+                  f'{timer["calls"]:>12} calls', file=self.out)
+        for name, n in sorted(summary['counters'].items()):
+            print(f'  {name:<12} {n:>12}', file=self.out)
+        for name in ('no_match_rate', 'avg_search_steps'):
+            if name in summary:
+                print(f'  {name:<16} {summary[name]:.4f}', file=self.out)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains the sampling mode of the aligners.
+
+Instead of the whole corpus, a random (seeded) sample of line pairs is
+aligned in batches (see Aligner.estimate). The counts of the sample are
+scaled to the corpus, and the share of every equivalent in the matches
+of its connector is given with a confidence interval:
+
+    estimate = aligner.estimate(src, tgt, max_lines=100000, seed=1)
+    estimate.proportions(top=5)
+
+The sampling can stop early when the top equivalents of every connector
+haven't changed for some batches.
+
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def z_value(confidence):
+    """Returns the two-sided quantile of the standard normal distribution.
+
+    E.g. 1.96 for a confidence of 0.95.
+    """
+    if not 0 < confidence < 1:
+        raise ValueError(f'Confidence must be between 0 and 1: {confidence}')
+    low, high = 0.0, 40.0
+    # Bisection of erf(z / sqrt(2)) = confidence.
+    for _ in range(100):
+        middle = (low + high) / 2
+        if math.erf(middle / math.sqrt(2)) < confidence:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def wilson_interval(k, n, z):
+    """Returns the Wilson score interval of a proportion.
+
+    Args:
+        k(int): Number of successes.
+        n(int): Number of trials.
+        z(float): Quantile of the confidence, see 'z_value'.
+
+    Returns:
+        tuple: (lower, upper), (0.0, 1.0) if n is 0.
+
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = k / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = (z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+              / denominator)
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def sample_lines(n_lines, size, seed=0):
+    """Returns a random sample of line numbers without repetition.
+
+    Args:
+        n_lines(int): Number of lines, the line numbers are 1 to n_lines.
+        size(int): Number of line numbers. At most 'n_lines'.
+        seed(int): Seed of the random generator, the same seed gives the
+                   same sample.
+
+    Returns:
+        numpy.ndarray: The line numbers in random order.
+
+    """
+    permutation = np.random.RandomState(seed).permutation(n_lines)
+    return permutation[:min(size, n_lines)] + 1
+
+
+class SampleEstimate():
+    """The result of aligning a sample of the line pairs.
+
+    Attributes:
+        counts(dict): The matches in the sample, like the result of
+                      'align'. Can also be a CountMatrix.
+        n_lines(int): Number of sampled line pairs.
+        total_lines(int): Number of line pairs of the corpus.
+        batches(int): Number of aligned batches.
+        stable(bool): Whether the sampling stopped early because the top
+                      equivalents were stable.
+        confidence(float): Confidence level of the intervals.
+
+    """
+    def __init__(self, counts, n_lines, total_lines, batches=1,
+                 stable=False, confidence=0.95):
+        self.counts = counts
+        self.n_lines = n_lines
+        self.total_lines = total_lines
+        self.batches = batches
+        self.stable = stable
+        self.confidence = confidence
+
+    def _dict(self):
+        if isinstance(self.counts, dict):
+            return self.counts
+        return self.counts.to_dict()
+
+    @property
+    def scale(self):
+        """Factor from the sample to the corpus."""
+        if not self.n_lines:
+            return 0.0
+        return self.total_lines / self.n_lines
+
+    def scaled_counts(self):
+        """Returns the counts scaled to the whole corpus (rounded).
+
+        Returns:
+            dict: Like the result of 'align'.
+
+        """
+        scale = self.scale
+        return {connector: {equivalent: int(round(count * scale))
+                            for equivalent, count in equivalents.items()}
+                for connector, equivalents in self._dict().items()}
+
+    def proportions(self, top=None):
+        """Returns the share of every equivalent in the matches of its
+        connector, with a Wilson confidence interval.
+
+        The occurrences of a connector are treated as independent, even
+        if several of them are in the same sentence.
+
+        Args:
+            top(int): If given, only the most frequent equivalents of every
+                      connector.
+
+        Returns:
+            pandas.DataFrame: Columns connector, equivalent, count (in the
+                              sample), scaled (to the corpus), proportion,
+                              lower and upper, the most frequent
+                              equivalents of every connector first.
+
+        """
+        z = z_value(self.confidence)
+        scale = self.scale
+        rows = []
+        for connector, equivalents in self._dict().items():
+            n = sum(equivalents.values())
+            ranked = sorted(equivalents.items(), key=lambda item: -item[1])
+            for equivalent, count in ranked[:top]:
+                lower, upper = wilson_interval(count, n, z)
+                rows.append((connector, equivalent, count,
+                             int(round(count * scale)), count / n,
+                             lower, upper))
+        return pd.DataFrame(rows, columns=['connector', 'equivalent',
+                                           'count', 'scaled', 'proportion',
+                                           'lower', 'upper'])
+
+    def print_summary(self, save='', top=10):
+        """Prints the proportions of the top equivalents of every connector.
+
+        Args:
+            save(str): Path to txt-file. If empty, printed to console.
+            top(int): How many equivalents are printed per connector.
+
+        """
+        if save:
+            out = open(save, 'w', encoding='utf-8')
+        else:
+            out = None
+        print(f'Sample of {self.n_lines} of {self.total_lines} line pairs '
+              f'({self.batches} batches'
+              f'{", stopped early" if self.stable else ""}), '
+              f'{self.confidence:.0%} confidence intervals:', end='\n\n',
+              file=out)
+        df = self.proportions(top)
+        for connector, group in df.groupby('connector', sort=False):
+            width = max(len(equivalent) for equivalent in group.equivalent)
+            for row in group.itertuples():
+                print(f'{row.equivalent:<{width}}    {row.scaled:>9}    '
+                      f'{row.proportion:6.1%} '
+                      f'[{row.lower:6.1%}, {row.upper:6.1%}]', file=out)
+            print(f'Name: {connector}', end='\n\n', file=out)
+        if save:
+            out.close()
@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""Serves the aligners over HTTP with the corpus kept in memory.
+
+The token caches of both files (see token_cache.py) are loaded once and
+kept in memory, together with an index of the source lines that contain
+each connector. Every request only aligns the lines of its connectors,
+and the results are cached by their parameters, so a repeated request is
+answered without aligning again:
+
+    python server.py de-en/europarl-v7.de-en.de de-en/europarl-v7.de-en.en
+
+Requests are JSON objects, the answers too:
+
+    POST /align         {"src_connectors": ["aber", "doch"],
+                         "tgt_connectors": ["but", "however"],
+                         "frame": 33, "start": -16, "top": 10,
+                         "approach": "list"}
+    POST /disambiguate  {"candidates": ["but", "yet"],
+                         "c_filter": 10, "p_filter": 2}
+    POST /align_pair    {"src": "Das ist aber gut.",
+                         "tgt": "But that is good.", "frame": 33,
+                         "start": -16, "disambiguate": false}
+    GET  /status
+
+The connectors default to the German and English lists of
+batch_runner.DEFAULT_CONFIG. Requests are answered in parallel threads.
+
+"""
+import argparse
+import inspect
+import json
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import numpy as np
+
+from batch_runner import DEFAULT_CONFIG
+from disambig_aligner import DisambigAligner
+from disambiguator import Disambiguator
+from list_aligner import ListAligner
+from naive_aligner import NaiveAligner
+from token_cache import TokenizedCorpus, load_token_cache
+
+
+#: Approaches of /align and the aligner classes. 'disambig' reads the
+#: source lines from the text file (see disambig_aligner.py).
+APPROACHES = {'list': ListAligner, 'naive': NaiveAligner,
+              'disambig': DisambigAligner}
+
+#: Number of results that are cached.
+CACHE_SIZE = 256
+
+
+class AlignmentService():
+    """The state of the server: corpus, connector index and results.
+
+    The methods take the parameters of a request as dict and return a
+    dict that can be sent as JSON. They can be called from several
+    threads.
+
+    Attributes:
+        src_path(str): Path to the source file.
+        tgt_path(str): Path to the target file.
+        src(TokenizedCorpus): Token cache of the source file, in memory.
+        tgt(TokenizedCorpus): Token cache of the target file, in memory.
+        cache_size(int): Maximum number of cached results.
+
+    """
+    def __init__(self, src_path, tgt_path, cache_size=CACHE_SIZE,
+                 warm=()):
+        """Loads the token caches (builds them if needed).
+
+        Args:
+            warm(iterable of str): Source connectors that are indexed
+                                   right away, see 'connector_lines'.
+
+        """
+        self.src_path = src_path
+        self.tgt_path = tgt_path
+        self.src = self._in_memory(load_token_cache(src_path))
+        self.tgt = self._in_memory(load_token_cache(tgt_path))
+        self.cache_size = cache_size
+        self._token_ids = {token: i for i, token in enumerate(self.src.vocab)}
+        # Source connector: line numbers (starting at 1) that contain it.
+        self._connector_lines = dict()
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        # Disambiguator.pattern_counts is not thread-safe.
+        self._disambiguator = Disambiguator(None)
+        self._disambiguator_lock = threading.Lock()
+        self.connector_lines(warm)
+
+    @staticmethod
+    def _in_memory(corpus):
+        """Copies a memory-mapped TokenizedCorpus to memory."""
+        return TokenizedCorpus(np.array(corpus.ids), np.array(corpus.offsets),
+                               corpus.vocab)
+
+    def connector_lines(self, connectors):
+        """Returns the source lines that contain one of the connectors.
+
+        Connectors that are not indexed yet are indexed together in one
+        pass over the token IDs.
+
+        Returns:
+            list of int: Sorted line numbers (starting at 1).
+
+        """
+        with self._lock:
+            missing = [connector for connector in set(connectors)
+                       if connector not in self._connector_lines]
+        if missing:
+            ids = self.src.ids
+            wanted = [self._token_ids[connector] for connector in missing
+                      if connector in self._token_ids]
+            positions = np.flatnonzero(np.isin(ids, wanted))
+            found = ids[positions]
+            lines = np.searchsorted(self.src.offsets, positions,
+                                    side='right')
+            index = {connector: np.unique(
+                        lines[found == self._token_ids[connector]])
+                     if connector in self._token_ids
+                     else np.zeros(0, dtype=np.int64)
+                     for connector in missing}
+            with self._lock:
+                self._connector_lines.update(index)
+        with self._lock:
+            parts = [self._connector_lines[connector]
+                     for connector in set(connectors)]
+        if not parts:
+            return []
+        return np.unique(np.concatenate(parts)).tolist()
+
+    def _cached(self, key, compute):
+        """Returns the cached result of 'key' or computes and caches it."""
+        key = json.dumps(key, sort_keys=True)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        result = compute()
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _int(params, name, default):
+        """Returns an integer parameter of a request.
+
+        Raises:
+            ValueError: If the parameter is not an integer.
+
+        """
+        value = params.get(name, default)
+        # bool is a subclass of int, but no valid setting.
+        if type(value) is not int:
+            raise ValueError(f'{name} must be an integer')
+        return value
+
+    @staticmethod
+    def _strings(params, name, default=None):
+        """Returns a list of strings of a request.
+
+        Raises:
+            ValueError: If the parameter is missing (and 'default' is
+                        None) or not a list of strings.
+
+        """
+        value = params.get(name, default)
+        if not isinstance(value, list) or not all(
+                isinstance(item, str) for item in value):
+            raise ValueError(f'{name} must be a list of strings')
+        return value
+
+    @classmethod
+    def _connectors(cls, params, name, language):
+        """Returns a connector list of a request, sorted."""
+        return sorted(set(cls._strings(
+                params, name, DEFAULT_CONFIG['connectors'][language])))
+
+    @staticmethod
+    def _settings(cls):
+        """Returns the names of the settings of 'cls.align'.
+
+        A subclass that passes its arguments on with **kwargs (like
+        DisambigAligner) has the settings of its base class.
+        """
+        for base in cls.__mro__:
+            if 'align' not in vars(base):
+                continue
+            parameters = inspect.signature(base.align).parameters.values()
+            if not any(parameter.kind is parameter.VAR_KEYWORD
+                       for parameter in parameters):
+                return {parameter.name for parameter in parameters} - {
+                        'self', 'src_path', 'tgt_path'}
+        return set()
+
+    def align(self, params):
+        """Aligns the lines of the source connectors.
+
+        Args:
+            params(dict): 'src_connectors', 'tgt_connectors' (only 'list'
+                          and 'disambig'), 'approach' (see APPROACHES,
+                          default 'list'), 'top' (default 10) and the
+                          settings of the aligner (e.g. 'frame', 'start').
+
+        Returns:
+            dict: 'counts' like the result of 'align' and 'top', the most
+                  frequent equivalents of every connector (see
+                  Aligner.top_values).
+
+        Raises:
+            ValueError: If the approach or a setting is unknown.
+
+        """
+        params = dict(params)
+        approach = params.pop('approach', 'list')
+        if approach not in APPROACHES:
+            raise ValueError(f'Unknown approach: {approach}')
+        top = self._int(params, 'top', 10)
+        params.pop('top', None)
+        src_connectors = self._connectors(params, 'src_connectors', 'de')
+        params.pop('src_connectors', None)
+        key = ['align', approach, src_connectors]
+        if approach == 'naive':
+            aligner = NaiveAligner(set(src_connectors))
+        else:
+            tgt_connectors = self._connectors(params, 'tgt_connectors', 'en')
+            params.pop('tgt_connectors', None)
+            key.append(tgt_connectors)
+            aligner = APPROACHES[approach](set(src_connectors),
+                                           set(tgt_connectors))
+        for name in ('lines', 'checkpoint', 'resume', 'pipeline', 'export',
+                     'workers'):
+            if name in params:
+                raise ValueError(f'Unsupported setting: {name}')
+        unknown = sorted(set(params) - self._settings(type(aligner)))
+        if unknown:
+            raise ValueError(f'Unknown setting: {", ".join(unknown)}')
+        for name in ('frame', 'start'):
+            if name in params:
+                self._int(params, name, None)
+        if params.get('max_window') is not None:
+            self._int(params, 'max_window', None)
+        key.append(params)
+        src = self.src_path if approach == 'disambig' else self.src
+
+        def compute():
+            lines = self.connector_lines(src_connectors)
+            counts = aligner.align(src, self.tgt, lines=lines, **params)
+            counts = {connector: dict(equivalents)
+                      for connector, equivalents in counts.items()}
+            return {'counts': counts,
+                    'top': aligner.top_values(counts, top)}
+
+        return self._cached(key + [top], compute)
+
+    def disambiguate(self, params):
+        """Finds the candidates that are dropped by the disambiguation.
+
+        See Disambiguator.disambiguate, the patterns are counted in the
+        target file once per candidate.
+
+        Args:
+            params(dict): 'candidates' (list of str), 'c_filter' (default
+                          10) and 'p_filter' (default 2).
+
+        Returns:
+            dict: 'drop', the list of dropped candidates.
+
+        """
+        candidates = self._strings(params, 'candidates')
+        c_filter = self._int(params, 'c_filter', 10)
+        p_filter = self._int(params, 'p_filter', 2)
+
+        def compute():
+            with self._disambiguator_lock:
+                drop = self._disambiguator.disambiguate(
+                        self.tgt_path, candidates, c_filter, p_filter,
+                        mode='count', tokenized=self.tgt)
+            if drop is None:
+                raise ValueError(f'Could not read {self.tgt_path}')
+            return {'drop': drop}
+
+        return self._cached(['disambiguate', candidates, c_filter, p_filter],
+                            compute)
+
+    def align_pair(self, params):
+        """Aligns the connectors of one sentence pair.
+
+        Args:
+            params(dict): 'src' and 'tgt' (the sentences),
+                          'src_connectors', 'tgt_connectors', 'frame'
+                          (default 33), 'start' (default -16) and
+                          'disambiguate' (default false, if true the
+                          non-connector uses are skipped like by
+                          DisambigAligner).
+
+        Returns:
+            dict: 'matches', per source connector a dict with 'position',
+                  'connector', 'equivalent' and 'target' (see
+                  ListAligner.align_pair).
+
+        """
+        src_line, tgt_line = params.get('src'), params.get('tgt')
+        if not isinstance(src_line, str) or not isinstance(tgt_line, str):
+            raise ValueError('src and tgt must be strings')
+        src_connectors = self._connectors(params, 'src_connectors', 'de')
+        tgt_connectors = self._connectors(params, 'tgt_connectors', 'en')
+        frame = self._int(params, 'frame', 33)
+        start = self._int(params, 'start', -16)
+        disambiguate = bool(params.get('disambiguate', False))
+
+        def compute():
+            cls = DisambigAligner if disambiguate else ListAligner
+            aligner = cls(set(src_connectors), set(tgt_connectors))
+            return {'matches': [
+                {'position': position, 'connector': connector,
+                 'equivalent': equivalent, 'target': target}
+                for position, connector, equivalent, target
+                in aligner.align_pair(src_line, tgt_line, frame, start)]}
+
+        return self._cached(['align_pair', src_line, tgt_line,
+                             src_connectors, tgt_connectors, frame, start,
+                             disambiguate], compute)
+
+    def status(self):
+        """Returns the corpus, the indexed connectors and the cache size."""
+        with self._lock:
+            return {'src_path': self.src_path,
+                    'tgt_path': self.tgt_path,
+                    'lines': min(len(self.src), len(self.tgt)),
+                    'indexed_connectors': sorted(self._connector_lines),
+                    'cached_results': len(self._results)}
+
+
+#: POST paths and the methods of AlignmentService that answer them.
+ROUTES = {'/align': AlignmentService.align,
+          '/disambiguate': AlignmentService.disambiguate,
+          '/align_pair': AlignmentService.align_pair}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Answers the requests with the AlignmentService of the server."""
+
+    def do_GET(self):
+        if self.path != '/status':
+            self._reply(404, {'error': f'Unknown path: {self.path}'})
+            return
+        self._reply(200, self.server.service.status())
+
+    def do_POST(self):
+        method = ROUTES.get(self.path)
+        if method is None:
+            self._reply(404, {'error': f'Unknown path: {self.path}'})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            params = json.loads(self.rfile.read(length).decode('utf-8')
+                                or '{}')
+            if not isinstance(params, dict):
+                raise ValueError('The request must be a JSON object')
+            result = method(self.server.service, params)
+        except ValueError as error:
+            self._reply(400, {'error': str(error)})
+            return
+        except Exception as error:
+            # The client gets an answer instead of a closed connection.
+            self.log_error('%s', traceback.format_exc())
+            self._reply(500, {'error': f'{type(error).__name__}: {error}'})
+            return
+        self._reply(200, result)
+
+    def _reply(self, status, content):
+        body = json.dumps(content, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class AlignmentServer(ThreadingMixIn, HTTPServer):
+    """HTTP server that answers every request in its own thread.
+
+    Attributes:
+        service(AlignmentService): Answers the requests.
+
+    """
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, RequestHandler)
+        self.service = service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('src', help='file in the source language')
+    parser.add_argument('tgt', help='file in the target language')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help='number of cached results')
+    args = parser.parse_args()
+    service = AlignmentService(args.src, args.tgt, args.cache_size,
+                               warm=DEFAULT_CONFIG['connectors']['de'])
+    server = AlignmentServer((args.host, args.port), service)
+    print(f'Serving on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
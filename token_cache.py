@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# Python 3.6.12
+
+"""This module contains a persistent cache for tokenized corpus files.
+
+A file is casefolded and tokenized with corpus.tokenize_line once. The
+tokens are interned into a vocabulary and stored as token IDs:
+
+    <prefix>.ids.npy      uint32 token IDs of all lines.
+    <prefix>.offsets.npy  int64 position of the first token of every line
+                          in the ID array, plus the total number of tokens.
+    <prefix>.vocab.txt    One token per line, the line index is the ID.
+    <prefix>.meta.json    Size and modification time of the source file
+                          and CACHE_VERSION.
+
+The arrays are memory-mapped when the cache is loaded, so the aligners can
+iterate over the tokens without reading or tokenizing the text again.
+
+"""
+import json
+import os
+from array import array
+
+import numpy as np
+
+from corpus import is_tokenized, iter_tokens, read_lines, tokenize_line
+
+
+#: Version of the cache format. A cache of another version is rebuilt.
+#: Version 2 also ends a line at a lone '\r'.
+CACHE_VERSION = 2
+
+
+class TokenizedCorpus():
+    """A tokenized corpus file, stored as memory-mapped token IDs.
+
+    Can be passed to the aligners instead of a file path.
+
+    Attributes:
+        ids (numpy.ndarray): Token IDs of all lines.
+        offsets (numpy.ndarray): Start of every line in 'ids', the last
+                                 value is the length of 'ids'.
+        vocab (list of str): The token of every ID.
+
+    """
+    #: Number of lines that are converted to strings at once.
+    BLOCK_SIZE = 10000
+
+    def __init__(self, ids, offsets, vocab):
+        self.ids = ids
+        self.offsets = offsets
+        self.vocab = vocab
+
+    @classmethod
+    def load(cls, prefix):
+        """Loads a cache written by 'build_token_cache'.
+
+        Args:
+            prefix (str): Path prefix of the cache files.
+
+        """
+        ids = np.load(prefix + '.ids.npy', mmap_mode='r')
+        offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+        with open(prefix + '.vocab.txt', encoding='utf-8') as vocab_file:
+            vocab = vocab_file.read().split('\n')
+        return cls(ids, offsets, vocab)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line_ids(self, index):
+        """Returns the token IDs of a line (index starting at 0)."""
+        return self.ids[self.offsets[index]:self.offsets[index+1]]
+
+    def line_tokens(self, index):
+        """Returns the tokens of a line (index starting at 0)."""
+        return [self.vocab[i] for i in self.line_ids(index).tolist()]
+
+    def iter_tokens(self, start=0, stop=None):
+        """Yields the token lists of consecutive lines.
+
+        Args:
+            start (int): Index of the first line.
+            stop (int): Index after the last line. If None, until the
+                        last line.
+
+        """
+        vocab = self.vocab
+        if stop is None or stop > len(self):
+            stop = len(self)
+        for block in range(start, stop, self.BLOCK_SIZE):
+            block_stop = min(block + self.BLOCK_SIZE, stop)
+            offsets = self.offsets[block:block_stop+1].tolist()
+            ids = self.ids[offsets[0]:offsets[-1]].tolist()
+            base = offsets[0]
+            for i in range(len(offsets) - 1):
+                line_ids = ids[offsets[i]-base:offsets[i+1]-base]
+                yield [vocab[j] for j in line_ids]
+
+    def lookup(self, tokens):
+        """Returns the IDs of the tokens that are in the vocabulary."""
+        index = {token: i for i, token in enumerate(self.vocab)}
+        return [index[token] for token in tokens if token in index]
+
+    def lines_with(self, tokens):
+        """Returns the sorted indices of all lines that contain a token.
+
+        Args:
+            tokens (iterable of str): Casefolded tokens.
+
+        Returns:
+            numpy.ndarray: Line indices.
+
+        """
+        positions = np.flatnonzero(np.isin(self.ids, self.lookup(tokens)))
+        lines = np.searchsorted(self.offsets, positions, side='right') - 1
+        return np.unique(lines)
+
+
+def iter_id_blocks(corpus, offset=0, lineno=1, n_lines=None,
+                   block_size=200000, intern=True):
+    """Yields consecutive blocks of lines as token ID arrays.
+
+    A file is tokenized like corpus.iter_tokens. A tokenized corpus is
+    sliced without tokenizing.
+
+    Args:
+        corpus(str or TokenizedCorpus): Path to a file or tokenized corpus.
+        offset(int): Byte position of the first line in the file.
+        lineno(int): Line number of the first line. Only used for a
+                     tokenized corpus.
+        n_lines(int): Maximum number of lines. If None, until the end.
+        block_size(int): Number of lines per block.
+        intern(bool): If True, the tokens of a file are interned into a
+                      vocabulary that grows from block to block. If
+                      False, every token of a block gets its own ID (its
+                      position), which is faster if the IDs are only used
+                      to look tokens up.
+
+    Yields:
+        tuple: (ids, offsets, vocab). 'ids' (numpy.ndarray) are the token
+               IDs of the lines of the block, 'offsets' (numpy.ndarray)
+               the start of every line in 'ids' plus the length of 'ids',
+               'vocab' (list of str) the token of every ID.
+
+    """
+    if is_tokenized(corpus):
+        stop = len(corpus)
+        if n_lines is not None:
+            stop = min(stop, lineno - 1 + n_lines)
+        for start in range(lineno - 1, stop, block_size):
+            offsets = np.asarray(
+                    corpus.offsets[start:min(start + block_size, stop) + 1],
+                    dtype=np.int64)
+            ids = np.asarray(corpus.ids[offsets[0]:offsets[-1]])
+            yield ids, offsets - offsets[0], corpus.vocab
+        return
+    index = dict()
+    tokens = []
+    offsets = array('q', [0])
+    for line_tokens in iter_tokens(corpus, offset, n_lines=n_lines):
+        tokens.extend(line_tokens)
+        offsets.append(len(tokens))
+        if len(offsets) > block_size:
+            yield _make_block(tokens, offsets, index if intern else None)
+            tokens = []
+            offsets = array('q', [0])
+    if len(offsets) > 1:
+        yield _make_block(tokens, offsets, index if intern else None)
+
+
+def _make_block(tokens, offsets, index=None):
+    """Converts the tokens of a block, see 'iter_id_blocks'.
+
+    Args:
+        tokens(list of str): The tokens of all lines of the block.
+        offsets(array.array): Start of every line in 'tokens' and the
+                              number of tokens.
+        index(dict): Token as key and ID as value, updated in-place. If
+                     None, the IDs are the positions in 'tokens'.
+
+    """
+    offsets = np.frombuffer(offsets, dtype=np.int64)
+    if index is None:
+        return np.arange(len(tokens), dtype=np.int64), offsets, tokens
+    setdefault = index.setdefault
+    ids = np.array([setdefault(token, len(index)) for token in tokens],
+                   dtype=np.uint32)
+    return ids, offsets, list(index)
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime,
+            'version': CACHE_VERSION}
+
+
+def build_token_cache(path, prefix=None):
+    """Tokenizes a corpus file and writes the cache files.
+
+    Args:
+        path (str): Path to a utf-8 encoded corpus file.
+        prefix (str): Path prefix of the cache files. If None, 'path'.
+
+    Returns:
+        TokenizedCorpus: The loaded cache.
+
+    """
+    if prefix is None:
+        prefix = path
+    index = dict()
+    vocab = []
+    ids = array('I')
+    offsets = array('q', [0])
+    for line in read_lines(path):
+        for token in tokenize_line(line):
+            token_id = index.get(token)
+            if token_id is None:
+                token_id = index[token] = len(vocab)
+                vocab.append(token)
+            ids.append(token_id)
+        offsets.append(len(ids))
+    np.save(prefix + '.ids.npy', np.frombuffer(ids, dtype=np.uint32))
+    np.save(prefix + '.offsets.npy', np.frombuffer(offsets, dtype=np.int64))
+    with open(prefix + '.vocab.txt', 'w', encoding='utf-8') as vocab_file:
+        vocab_file.write('\n'.join(vocab))
+    with open(prefix + '.meta.json', 'w', encoding='utf-8') as meta_file:
+        json.dump(_source_stat(path), meta_file)
+    return TokenizedCorpus.load(prefix)
+
+
+def load_token_cache(path, prefix=None):
+    """Loads the cache of a corpus file and builds it if needed.
+
+    The cache is rebuilt if the corpus file changed since it was built.
+
+    Args:
+        path (str): Path to a utf-8 encoded corpus file.
+        prefix (str): Path prefix of the cache files. If None, 'path'.
+
+    Returns:
+        TokenizedCorpus: The loaded cache.
+
+    """
+    if prefix is None:
+        prefix = path
+    try:
+        with open(prefix + '.meta.json', encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+    except (IOError, ValueError):
+        meta = None
+    if meta != _source_stat(path):
+        return build_token_cache(path, prefix)
+    return TokenizedCorpus.load(prefix)
+
+
+def main():
+    """Builds the caches of both Europarl files."""
+    load_token_cache('de-en/europarl-v7.de-en.de')
+    load_token_cache('de-en/europarl-v7.de-en.en')
+
+
+if __name__ == '__main__':
+    main()